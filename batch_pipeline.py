@@ -0,0 +1,145 @@
+"""
+Offline batch runner: pre-computes summaries, reviews and MCQs for whole books.
+
+Usage:
+    python batch_pipeline.py book.epub other.pdf library_dir/ [--workers 4] [--model NAME]
+
+Progress is checkpointed per book after every chapter, so re-running the same
+command after a crash or a rate-limit stop resumes where it left off.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from ingest_utils import ingest_epub, ingest_pdf, file_hash
+from chroma_utils import store_content_version, flush
+from embedding_cache import content_hash
+from pipeline import process_chapter
+from rate_limiter import llm_priority, PRIORITY_BATCH
+
+SUPPORTED_EXTENSIONS = {".epub": ingest_epub, ".pdf": ingest_pdf}
+DEFAULT_CHECKPOINT_DIR = "./batch_checkpoints"
+RATE_LIMIT_MARKERS = ["429", "rate limit", "rate_limit", "too many requests"]
+
+def find_books(paths):
+    """Expand files and directories into a sorted list of supported book paths."""
+    books = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _dirs, files in os.walk(path):
+                for name in files:
+                    if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+                        books.append(os.path.join(root, name))
+        elif os.path.splitext(path)[1].lower() in SUPPORTED_EXTENSIONS:
+            books.append(path)
+        else:
+            print(f"[Batch] Skipping unsupported path: {path}")
+    return sorted(set(books))
+
+class Checkpoint:
+    """Per-book JSON record of finished chapters, rewritten atomically after each one."""
+
+    def __init__(self, checkpoint_dir, content_hash, book_id):
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.path = os.path.join(checkpoint_dir, f"{content_hash}.json")
+        self._lock = threading.Lock()
+        self.state = {"book_id": book_id, "done": []}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def is_done(self, chapter):
+        return chapter in self.state["done"]
+
+    def mark_done(self, chapter):
+        with self._lock:
+            if chapter not in self.state["done"]:
+                self.state["done"].append(chapter)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f)
+            os.replace(tmp_path, self.path)
+
+def _is_rate_limited(outputs):
+    return any(
+        value.startswith("[Error]") and any(m in value.lower() for m in RATE_LIMIT_MARKERS)
+        for value in outputs.values()
+    )
+
+def process_book(path, workers, model=None, checkpoint_dir=DEFAULT_CHECKPOINT_DIR, stop_event=None):
+    """
+    Run summary, review and MCQ generation for every chapter of one book and store
+    the results. Returns (chapters_done, chapters_failed).
+    """
+    stop_event = stop_event or threading.Event()
+    with open(path, "rb") as f:
+        data = f.read()
+    ingest = SUPPORTED_EXTENSIONS[os.path.splitext(path)[1].lower()]
+    book = ingest(data, os.path.basename(path))
+    checkpoint = Checkpoint(checkpoint_dir, file_hash(data), book["book_id"])
+    todo = [i for i in range(len(book["chapters"])) if not checkpoint.is_done(i)]
+    print(f"[Batch] {book['book_id']}: {len(book['chapters'])} chapters, {len(todo)} to process")
+
+    def run(chapter):
+        if stop_event.is_set():
+            return chapter, None
+        # Batch work yields to interactive Q&A and page requests in the LLM scheduler
+        with llm_priority(PRIORITY_BATCH):
+            return chapter, process_chapter(book["chapters"][chapter], model=model)
+
+    done = failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run, chapter) for chapter in todo]
+        for future in as_completed(futures):
+            chapter, outputs = future.result()
+            if outputs is None:
+                continue
+            if any(value.startswith("[Error]") for value in outputs.values()):
+                failed += 1
+                print(f"[Batch] {book['book_id']} chapter {chapter} failed; it will be retried on the next run")
+                if _is_rate_limited(outputs):
+                    print("[Batch] Rate limited: stopping after in-flight chapters finish")
+                    stop_event.set()
+                continue
+            for content_type, content in outputs.items():
+                store_content_version(book["book_id"], content, content_type, chapter=chapter,
+                                      source_hash=content_hash(book["chapters"][chapter]))
+            checkpoint.mark_done(chapter)
+            done += 1
+            print(f"[Batch] {book['book_id']} chapter {chapter} done")
+    flush()
+    return done, failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-compute summaries, reviews and MCQs for EPUB/PDF books.")
+    parser.add_argument("paths", nargs="+", help="EPUB/PDF files or directories containing them")
+    parser.add_argument("--workers", type=int, default=4, help="chapters processed concurrently (default: 4)")
+    parser.add_argument("--model", default=None, help="LLM model name (default: OPENROUTER_MODEL)")
+    parser.add_argument("--checkpoint-dir", default=DEFAULT_CHECKPOINT_DIR, help="where progress is recorded")
+    args = parser.parse_args(argv)
+
+    books = find_books(args.paths)
+    if not books:
+        print("[Batch] No EPUB or PDF files found.")
+        return 1
+    stop_event = threading.Event()
+    total_failed = 0
+    for path in books:
+        if stop_event.is_set():
+            break
+        try:
+            _done, failed = process_book(path, args.workers, args.model, args.checkpoint_dir, stop_event)
+            total_failed += failed
+        except Exception as e:
+            total_failed += 1
+            print(f"[Batch] Error processing {path}: {e}")
+    if stop_event.is_set():
+        print("[Batch] Stopped early; re-run the same command to resume.")
+        return 2
+    return 1 if total_failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""
+Compare two benchmark result files.
+
+Usage:
+    python benchmarks/compare.py baseline.json candidate.json
+
+Prints each timing (p50) and throughput metric side by side with the change;
+for timings lower is better, for throughputs higher is better.
+"""
+import json
+import sys
+
+
+def _metrics(result, prefix=""):
+    """Flatten a benchmark entry into {name: value} for p50 timings and */s throughputs."""
+    out = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            out.update(_metrics(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and (key == "p50_s" or key.endswith("_per_s")):
+            out[prefix + key] = value
+    return out
+
+def compare(baseline: dict, candidate: dict):
+    """Yield (benchmark, metric, old, new, change) for metrics present in both runs."""
+    for name, old in baseline["benchmarks"].items():
+        new = candidate["benchmarks"].get(name)
+        if new is None:
+            continue
+        old_metrics = _metrics(old)
+        new_metrics = _metrics(new)
+        for metric, old_value in old_metrics.items():
+            if metric in new_metrics and old_value:
+                yield name, metric, old_value, new_metrics[metric], new_metrics[metric] / old_value - 1
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        print(__doc__)
+        return 1
+    with open(argv[0], "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(argv[1], "r", encoding="utf-8") as f:
+        candidate = json.load(f)
+    print(f"{'benchmark':<18} {'metric':<22} {'baseline':>12} {'candidate':>12} {'change':>8}")
+    for name, metric, old, new, change in compare(baseline, candidate):
+        print(f"{name:<18} {metric:<22} {old:>12.4g} {new:>12.4g} {change:>+8.1%}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
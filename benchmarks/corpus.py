@@ -0,0 +1,117 @@
+"""
+Synthetic corpora for the benchmarks: deterministic plain text, EPUB and PDF
+books of configurable size.
+"""
+import random
+
+_VOCABULARY = (
+    "the a river city night letter king garden war memory house light road ship winter music "
+    "family storm voice silence window forest mountain promise secret journey stranger morning "
+    "crowd fire market soldier teacher friend enemy question answer dream shadow bridge island "
+    "walked spoke remembered waited discovered believed carried watched followed returned wrote "
+    "quietly slowly suddenly again together alone before after beneath across through against "
+    "old young bright dark cold warm long short strange familiar distant broken hidden golden"
+).split()
+
+
+def make_text(words: int, seed: int = 0) -> str:
+    """Paragraphs of random sentences totalling about `words` words."""
+    rng = random.Random(seed)
+    paragraphs = []
+    written = 0
+    while written < words:
+        sentences = []
+        for _ in range(rng.randint(3, 6)):
+            n = rng.randint(8, 20)
+            sentence = " ".join(rng.choice(_VOCABULARY) for _ in range(n))
+            sentences.append(sentence[0].upper() + sentence[1:] + rng.choice(".!?."))
+            written += n
+        paragraphs.append(" ".join(sentences))
+    return "\n\n".join(paragraphs)
+
+def make_chapters(chapters: int, words_per_chapter: int, seed: int = 0):
+    """[(title, text)] for a synthetic book."""
+    return [(f"Chapter {i + 1}", make_text(words_per_chapter, seed * 100003 + i)) for i in range(chapters)]
+
+def write_epub(path: str, chapters, title: str = "Synthetic Book"):
+    """Write [(title, text)] chapters as an EPUB with a TOC entry per chapter."""
+    from ebooklib import epub
+    book = epub.EpubBook()
+    book.set_identifier(f"bookbrain-bench-{len(chapters)}")
+    book.set_title(title)
+    book.set_language("en")
+    items = []
+    for i, (chapter_title, text) in enumerate(chapters):
+        item = epub.EpubHtml(title=chapter_title, file_name=f"chapter_{i + 1}.xhtml", lang="en")
+        body = "".join(f"<p>{p}</p>" for p in text.split("\n\n"))
+        item.content = f"<html><body><h1>{chapter_title}</h1>{body}</body></html>"
+        book.add_item(item)
+        items.append(item)
+    book.toc = items
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ["nav"] + items
+    epub.write_epub(path, book)
+
+def _wrap(text: str, width: int):
+    for paragraph in text.split("\n\n"):
+        line = ""
+        for word in paragraph.split():
+            if line and len(line) + 1 + len(word) > width:
+                yield line
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        if line:
+            yield line
+        yield ""
+
+def write_pdf(path: str, chapters, lines_per_page: int = 50, width: int = 90):
+    """
+    Write [(title, text)] chapters as a minimal text PDF (Helvetica, one chapter
+    starting per page, no outline) that PyPDF2 can extract. Returns the page count.
+    """
+    pages = []
+    for chapter_title, text in chapters:
+        lines = [chapter_title, ""] + list(_wrap(text, width))
+        for start in range(0, len(lines), lines_per_page):
+            pages.append(lines[start:start + lines_per_page])
+
+    objects = []  # object bodies; object number = index + 1
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_obj = add(b"")  # filled in once the kids are known
+    kids = []
+    for lines in pages:
+        ops = ["BT", "/F1 10 Tf", "12 TL", "50 770 Td"]
+        for line in lines:
+            escaped = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            ops.append(f"({escaped}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Contents %d 0 R"
+            b" /Resources << /Font << /F1 %d 0 R >> >> >>" % (pages_obj, content, font)
+        ))
+    objects[pages_obj - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+    catalog = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_obj)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+    return len(pages)
@@ -0,0 +1,244 @@
+"""
+End-to-end benchmarks for BookBrain on synthetic corpora, with LLM calls served
+by a local stub server so results do not depend on a provider.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--chapters 20] [--words-per-chapter 2000]
+        [--latency-ms 200] [--tokens-per-second 50] [--repeat 5] [--output results.json]
+    python benchmarks/compare.py old.json new.json
+
+Every run gets fresh stores and caches in a temporary directory. Results are
+written as JSON (timings in seconds) so runs can be compared.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from corpus import make_chapters, write_epub, write_pdf
+from stub_llm_server import StubLLMServer
+
+BENCHMARKS = ["extract_epub", "extract_pdf", "chunking", "embedding", "chroma", "answer_question", "process_chapter"]
+
+
+class Skipped(Exception):
+    """A benchmark whose optional dependency is missing."""
+
+
+def timings(samples):
+    samples = sorted(samples)
+    return {
+        "runs": len(samples),
+        "mean_s": statistics.fmean(samples),
+        "p50_s": samples[len(samples) // 2],
+        "p95_s": samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))],
+        "min_s": samples[0],
+        "max_s": samples[-1],
+    }
+
+def timed(fn, repeat):
+    """Run fn repeat times; returns (last result, timings)."""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return result, timings(samples)
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def _configure_environment(workdir, stub):
+    """Point every store, cache and the LLM client at throwaway locations before the app modules load."""
+    os.environ.update({
+        "CHROMA_PERSIST_DIR": os.path.join(workdir, "chroma"),
+        "EMBEDDING_CACHE_DIR": os.path.join(workdir, "embedding_cache"),
+        # Exported ONNX models and tuning results are kept between runs
+        "EMBEDDING_MODELS_DIR": os.path.abspath(os.getenv("EMBEDDING_MODELS_DIR", os.path.join(REPO_DIR, "embedding_models"))),
+        "LLM_CACHE_PATH": os.path.join(workdir, "llm_cache.db"),
+        "FEEDBACK_DB_PATH": os.path.join(workdir, "feedback.db"),
+        "HTTP_CACHE_PATH": os.path.join(workdir, "http_cache.db"),
+        "WIKIPEDIA_CACHE_PATH": os.path.join(workdir, "wikipedia_cache.db"),
+        "OPENROUTER_BASE_URL": stub.base_url,
+        "OPENAI_API_KEY": "benchmark",
+        # The stub is the only limit worth measuring
+        "LLM_REQUESTS_PER_MINUTE": "1000000",
+        "LLM_TOKENS_PER_MINUTE": "1000000000",
+    })
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+# --- BENCHMARKS ---
+def bench_extract_epub(ctx):
+    from epub_utils import iter_chapters_from_epub
+    chapters, t = timed(lambda: list(iter_chapters_from_epub(ctx["epub_path"])), ctx["repeat"])
+    chars = sum(len(text) for _title, text in chapters)
+    return {"chapters": len(chapters), "chars": chars, "chars_per_s": chars / t["p50_s"], **t}
+
+def bench_extract_pdf(ctx):
+    from pdf_utils import iter_pdf_chapters
+    chapters, t = timed(lambda: list(iter_pdf_chapters(ctx["pdf_path"])), ctx["repeat"])
+    return {"pages": ctx["pdf_pages"], "chapters": len(chapters),
+            "pages_per_s": ctx["pdf_pages"] / t["p50_s"], **t}
+
+def bench_chunking(ctx):
+    from chunking_utils import chunk_text, count_tokens, EMBED_CHUNK_TOKENS, EMBED_CHUNK_OVERLAP
+    text = ctx["text"]
+    chunks, t = timed(lambda: chunk_text(text, EMBED_CHUNK_TOKENS, EMBED_CHUNK_OVERLAP), ctx["repeat"])
+    tokens = count_tokens(text)
+    return {"tokens": tokens, "chunks": len(chunks), "tokens_per_s": tokens / t["p50_s"], **t}
+
+def bench_embedding(ctx):
+    from embedding_utils import EMBEDDINGS_AVAILABLE, encode, get_embedding_service
+    from chunking_utils import embedding_chunks
+    if not EMBEDDINGS_AVAILABLE:
+        raise Skipped("no embedding backend is installed")
+    texts = [chunk for _title, text in ctx["chapters"] for chunk in embedding_chunks(text)]
+    encode(texts[:8])  # load (and export/tune) the model outside the timed runs
+    model = get_embedding_service().get_model()
+    _vectors, t = timed(lambda: encode(texts), ctx["repeat"])
+    return {"backend": f"{model.name}:{model.cache_name}", "threads": model.threads,
+            "batch_size": model.batch_size, "texts": len(texts), "texts_per_s": len(texts) / t["p50_s"], **t}
+
+def bench_chroma(ctx):
+    """Upsert/query latency of the vector store itself, with synthetic vectors (no embedding model needed)."""
+    import numpy as np
+    import chroma_utils
+    from chunking_utils import embedding_chunks
+    texts = [chunk for _title, text in ctx["chapters"] for chunk in embedding_chunks(text)]
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((len(texts), 384)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    collection = chroma_utils.get_book_collection("benchmark_book")
+    metadatas = [{"book_id": "benchmark_book", "chapter": i, "type": "chapter", "version": 1} for i in range(len(texts))]
+    ids = [f"benchmark_{i}" for i in range(len(texts))]
+    _r, upsert = timed(lambda: collection.upsert(ids=ids, embeddings=vectors.tolist(), documents=texts,
+                                                 metadatas=metadatas), ctx["repeat"])
+    queries = rng.standard_normal((max(20, ctx["repeat"]), 384)).astype(np.float32)
+    samples = []
+    for q in queries:
+        start = time.perf_counter()
+        collection.query(query_embeddings=[q.tolist()], n_results=10, where={"type": "chapter"})
+        samples.append(time.perf_counter() - start)
+    return {"store": chroma_utils.VECTOR_STORE, "records": len(texts), "upsert": upsert, "query": timings(samples)}
+
+def bench_answer_question(ctx):
+    import streamlit as st
+    from embedding_cache import content_hash
+    from retrieval_index import get_index
+    from pipeline import answer_question
+    chapters = [text for _title, text in ctx["chapters"]]
+    key = content_hash("\0".join(chapters))
+    start = time.perf_counter()
+    get_index(key, chapters)
+    index_build = time.perf_counter() - start
+    st.session_state["chapters"] = chapters
+    st.session_state["ingested_hash"] = key
+    st.session_state["selected_chapter_idx"] = 0
+    st.session_state["extracted_text"] = chapters[0]
+    samples = []
+    for i in range(ctx["repeat"]):
+        # A new question each time, so the LLM response cache never answers
+        start = time.perf_counter()
+        result = answer_question(f"What did the stranger remember about the river in scene {i}?")
+        samples.append(time.perf_counter() - start)
+        if result["answer"].startswith("[Error]"):
+            raise RuntimeError(result["answer"])
+    return {"index_build_s": index_build, **timings(samples)}
+
+def bench_process_chapter(ctx):
+    from pipeline import process_chapter
+    samples = []
+    for i in range(min(ctx["repeat"], len(ctx["chapters"]))):
+        start = time.perf_counter()
+        outputs = process_chapter(ctx["chapters"][i][1])
+        samples.append(time.perf_counter() - start)
+        errors = [v for v in outputs.values() if v.startswith("[Error]")]
+        if errors:
+            raise RuntimeError(errors[0])
+    return timings(samples)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run BookBrain benchmarks on synthetic data.")
+    parser.add_argument("--chapters", type=int, default=20, help="chapters per synthetic book")
+    parser.add_argument("--words-per-chapter", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=200, help="stub LLM time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="stub LLM generation speed (0 = instant)")
+    parser.add_argument("--completion-tokens", type=int, default=200, help="stub LLM tokens per response")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="run only these benchmarks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary working directory")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="bookbrain-bench-")
+    stub = StubLLMServer(0, args.latency_ms, args.tokens_per_second, args.completion_tokens).start()
+    _configure_environment(workdir, stub)
+
+    chapters = make_chapters(args.chapters, args.words_per_chapter, args.seed)
+    epub_path = os.path.join(workdir, "book.epub")
+    pdf_path = os.path.join(workdir, "book.pdf")
+    write_epub(epub_path, chapters)
+    ctx = {
+        "chapters": chapters,
+        "text": "\n\n".join(text for _title, text in chapters),
+        "epub_path": epub_path,
+        "pdf_path": pdf_path,
+        "pdf_pages": write_pdf(pdf_path, chapters),
+        "repeat": max(1, args.repeat),
+    }
+
+    results = {}
+    try:
+        for name in args.only or BENCHMARKS:
+            print(f"[Bench] {name}...", flush=True)
+            try:
+                results[name] = globals()[f"bench_{name}"](ctx)
+            except Skipped as e:
+                results[name] = {"skipped": str(e)}
+            except Exception as e:
+                results[name] = {"error": f"{type(e).__name__}: {e}"}
+            print(f"[Bench] {name}: {json.dumps(results[name])}", flush=True)
+    finally:
+        stub.shutdown()
+        if args.keep:
+            print(f"[Bench] Working directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": {k: v for k, v in vars(args).items() if k not in ("output", "keep")},
+            "stub_requests": stub.requests_total,
+        },
+        "benchmarks": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[Bench] Results written to {args.output}")
+    return 1 if any("error" in r for r in results.values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Local stand-in for an OpenAI-compatible chat completions API, with configurable
+time to first token and token rate. Supports streaming (SSE) and plain responses.
+
+Usage:
+    python benchmarks/stub_llm_server.py [--port 8765] [--latency-ms 200] [--tokens-per-second 50]
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+_WORDS = "the quick brown fox jumps over the lazy dog while the story continues".split()
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency_ms: float = 200, tokens_per_second: float = 50,
+                 completion_tokens: int = 200):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency_ms / 1000.0
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.requests_total = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/v1/"
+
+    def start(self):
+        """Serve in a daemon thread; returns self."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def handle_error(self, request, client_address):
+        # Clients that cancel a request (e.g. a cancelled prefetch) hang up mid-response
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def count_request(self):
+        with self._lock:
+            self.requests_total += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server = self.server
+        server.count_request()
+        n = max(1, min(int(body.get("max_tokens") or server.completion_tokens), server.completion_tokens))
+        words = [_WORDS[i % len(_WORDS)] for i in range(n)]
+        delay = 1.0 / server.tokens_per_second if server.tokens_per_second > 0 else 0.0
+        model = body.get("model", "stub")
+        created = int(time.time())
+        time.sleep(server.latency)
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for i, word in enumerate(words):
+                chunk = {"id": "stub", "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word},
+                                      "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(delay)
+            final = {"id": "stub", "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+            self.wfile.flush()
+            self.close_connection = True
+            return
+
+        time.sleep(delay * n)
+        payload = json.dumps({
+            "id": "stub", "object": "chat.completion", "created": created, "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": n, "total_tokens": n},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible chat completions server.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200, help="delay before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="generation speed (0 = instant)")
+    parser.add_argument("--completion-tokens", type=int, default=200, help="tokens per response (capped by max_tokens)")
+    args = parser.parse_args(argv)
+    server = StubLLMServer(args.port, args.latency_ms, args.tokens_per_second, args.completion_tokens)
+    print(f"Stub LLM server listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -2,107 +2,358 @@ import sys
 import pysqlite3
 sys.modules["sqlite3"] = pysqlite3
 import os
-from sentence_transformers import SentenceTransformer
 import time
+import atexit
+import hashlib
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from embedding_utils import encode, encode_cached, EMBEDDINGS_AVAILABLE
+from embedding_cache import content_hash
+from version_catalog import get_catalog
+from metrics_utils import span, record_error
+from vector_store import NumpyVectorClient
 
 # Try to import ChromaDB, but make it optional
 try:
+    import chromadb
     from chromadb import Client
     from chromadb.config import Settings
+    try:
+        from chromadb.errors import NotFoundError
+    except ImportError:
+        NotFoundError = ValueError
     CHROMADB_AVAILABLE = True
 except ImportError:
     CHROMADB_AVAILABLE = False
-    print("Warning: ChromaDB not available. Some features may be limited.")
+    print("Warning: ChromaDB not available. Using the built-in NumPy vector store.")
 
-# Initialize sentence transformer
-try:
-    embedder = SentenceTransformer("all-MiniLM-L6-v2")
-    EMBEDDINGS_AVAILABLE = True
-except Exception as e:
-    EMBEDDINGS_AVAILABLE = False
-    print(f"Warning: Sentence transformers not available: {e}")
+CHROMA_PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", "./chroma_data")
+# "chroma", or "numpy" for the built-in memory-mapped store (always used when chromadb is missing)
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma").lower() if CHROMADB_AVAILABLE else "numpy"
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", os.path.join(CHROMA_PERSIST_DIR, "numpy_store"))
+# Legacy single collection that held every book; still searched library-wide
+COLLECTION_NAME = "bookbrain_chapters"
+# Each book gets its own collection, so book-scoped queries never scan other books
+BOOK_COLLECTION_PREFIX = "bookbrain_book_"
+SEARCH_WORKERS = int(os.getenv("CHROMA_SEARCH_WORKERS", "8"))
+# Ingested versions of a book kept per content type; older ones are garbage-collected
+KEEP_VERSIONS = int(os.getenv("CHROMA_KEEP_VERSIONS", "1"))
+# How long the list of partitions is reused before re-listing (picks up other processes' books)
+PARTITION_CACHE_SECONDS = float(os.getenv("CHROMA_PARTITION_CACHE_SECONDS", "60"))
+# Raised by get_collection for a missing collection (older Chroma and the NumPy store raise ValueError)
+_MISSING_COLLECTION = (ValueError, NotFoundError) if CHROMADB_AVAILABLE else (ValueError,)
 
-def store_chapter_embeddings(book_id: str, chapters, content_type: str = "chapter", version: int = 1):
+# --- MANAGED STORE (one client per process, cached collection handles) ---
+_client = None
+_collections = {}
+_store_lock = threading.RLock()
+_book_locks = {}
+_partitions = None       # (names, listed_at), see list_partitions
+
+def get_client():
     """
-    Store chapter (or other content) embeddings with versioning and type metadata.
-    Falls back gracefully if ChromaDB is not available.
+    Return the process-wide persistent Chroma client (or the NumPy store client,
+    see VECTOR_STORE), opening it on first use. Shared by all Streamlit sessions
+    and threads.
     """
-    if not CHROMADB_AVAILABLE:
-        print("ChromaDB not available - skipping embedding storage")
-        return
-    
-    try:
-        chroma_client = Client(Settings(persist_directory="./chroma_data"))
-        collection = chroma_client.get_or_create_collection("bookbrain_chapters")
-        
-        if not EMBEDDINGS_AVAILABLE:
-            print("Embeddings not available - skipping storage")
+    global _client
+    if _client is None:
+        with _store_lock:
+            if _client is None:
+                if VECTOR_STORE == "numpy":
+                    _client = NumpyVectorClient(VECTOR_STORE_DIR)
+                elif hasattr(chromadb, "PersistentClient"):
+                    _client = chromadb.PersistentClient(path=CHROMA_PERSIST_DIR)
+                else:
+                    # Legacy (<0.4) clients only persist with the duckdb+parquet backend
+                    _client = Client(Settings(chroma_db_impl="duckdb+parquet", persist_directory=CHROMA_PERSIST_DIR))
+    return _client
+
+def get_collection(name: str = COLLECTION_NAME, metadata: dict = None):
+    """Return a cached collection handle, creating the collection if needed."""
+    collection = _collections.get(name)
+    if collection is None:
+        with _store_lock:
+            collection = _collections.get(name)
+            if collection is None:
+                collection = get_client().get_or_create_collection(name, metadata=metadata)
+                _collections[name] = collection
+                _add_partition(name)
+    return collection
+
+def find_collection(name: str):
+    """Return a cached handle of an existing collection, or None; never creates one (for read paths)."""
+    collection = _collections.get(name)
+    if collection is None:
+        with _store_lock:
+            collection = _collections.get(name)
+            if collection is None:
+                try:
+                    collection = get_client().get_collection(name)
+                except _MISSING_COLLECTION:
+                    return None
+                _collections[name] = collection
+    return collection
+
+def book_collection_name(book_id: str) -> str:
+    """Collection name for a book's partition (Chroma names are limited to 63 safe characters)."""
+    return BOOK_COLLECTION_PREFIX + hashlib.sha1(book_id.encode("utf-8")).hexdigest()[:32]
+
+def get_book_collection(book_id: str):
+    """The partition holding all content (chapters, summaries, reviews, MCQs) of one book."""
+    return get_collection(book_collection_name(book_id), metadata={"book_id": book_id})
+
+def find_book_collection(book_id: str):
+    """A book's partition if anything was ever stored for it, else None."""
+    return find_collection(book_collection_name(book_id))
+
+def _is_partition(name: str) -> bool:
+    return name.startswith(BOOK_COLLECTION_PREFIX) or name == COLLECTION_NAME
+
+def list_partitions():
+    """
+    Names of every book partition plus the legacy shared collection, if present.
+    The listing is cached; partitions created through get_collection are added
+    to it, and it is re-listed after PARTITION_CACHE_SECONDS.
+    """
+    global _partitions
+    with _store_lock:
+        if _partitions is not None and time.monotonic() - _partitions[1] < PARTITION_CACHE_SECONDS:
+            return sorted(_partitions[0])
+    names = set()
+    for c in get_client().list_collections():
+        name = c if isinstance(c, str) else c.name
+        if _is_partition(name):
+            names.add(name)
+    with _store_lock:
+        _partitions = (names, time.monotonic())
+    return sorted(names)
+
+def _add_partition(name: str):
+    with _store_lock:
+        if _partitions is not None and _is_partition(name):
+            _partitions[0].add(name)
+
+def _where(**filters):
+    """Build a Chroma where clause; several conditions must be combined with $and."""
+    conditions = [{k: v} for k, v in filters.items() if v is not None]
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+def flush():
+    """
+    Make pending writes durable. PersistentClient writes through on every call;
+    legacy clients need an explicit persist().
+    """
+    with _store_lock:
+        if _client is not None and hasattr(_client, "persist"):
+            try:
+                _client.persist()
+            except Exception as e:
+                print(f"[ChromaDB] Error flushing store: {e}")
+
+def close():
+    """Flush and drop the shared client and all cached collection handles."""
+    global _client, _partitions
+    with _store_lock:
+        if _client is None:
             return
-            
-        embeddings = embedder.encode(chapters).tolist()
-        ids = [f"{book_id}_{content_type}_v{version}_ch_{i}" for i in range(len(chapters))]
-        timestamp = int(time.time())
-        metadatas = [{
-            "book_id": book_id,
-            "chapter": i,
-            "type": content_type,
-            "version": version,
-            "timestamp": timestamp
-        } for i in range(len(chapters))]
-        collection.upsert(ids=ids, embeddings=embeddings, documents=chapters, metadatas=metadatas)
+        flush()
+        _collections.clear()
+        _partitions = None
+        if hasattr(_client, "clear_system_cache"):
+            try:
+                _client.clear_system_cache()
+            except Exception as e:
+                print(f"[ChromaDB] Error closing store: {e}")
+        _client = None
+
+atexit.register(flush)
+
+def record_id(book_id: str, content_type: str, digest: str) -> str:
+    """Content-addressed ID of a stored chapter: identical text maps to the same record."""
+    return f"{book_id}_{content_type}_{digest[:32]}"
+
+def _book_lock(book_id: str):
+    with _store_lock:
+        return _book_locks.setdefault(book_id, threading.Lock())
+
+def store_chapter_embeddings(book_id: str, chapters, content_type: str = "chapter", version: int = None,
+                             chunker: str = "", chapter_of=None):
+    """
+    Store content-addressed records of chapters (or chunks, with chapter_of giving
+    each one's chapter) as a new catalogued version of the book, embedding only
+    new texts; cache entries are keyed by chunker. Returns the version (None on failure).
+    """
+    if not EMBEDDINGS_AVAILABLE:
+        print("Embeddings not available - skipping storage")
+        return None
+    try:
+        collection = get_book_collection(book_id)
+        catalog = get_catalog()
+        with _book_lock(book_id):
+            ids = [record_id(book_id, content_type, content_hash(c)) for c in chapters]
+            chapter_of = list(range(len(ids))) if chapter_of is None else [int(c) for c in chapter_of]
+            first = {}
+            for i, rid in enumerate(ids):
+                first.setdefault(rid, i)
+            previous_version = catalog.latest_version(book_id, content_type)
+            if version is None:
+                unchanged = previous_version is not None and (
+                    catalog.manifest(book_id, content_type, previous_version) == ids
+                    and catalog.manifest_chapters(book_id, content_type, previous_version)
+                    == {rid: chapter_of[i] for rid, i in first.items()}
+                )
+                if unchanged:
+                    return previous_version
+                version = (previous_version or 0) + 1
+            stored = catalog.referenced_ids(book_id, content_type)
+
+            new = [rid for rid in first if rid not in stored]
+
+            timestamp = int(time.time())
+            if new:
+                texts = [chapters[first[rid]] for rid in new]
+                embeddings = encode_cached(texts, chunker=chunker).tolist()
+                metadatas = [{
+                    "book_id": book_id,
+                    "chapter": chapter_of[first[rid]],
+                    "type": content_type,
+                    "version": version,
+                    "timestamp": timestamp
+                } for rid in new]
+                with span("chroma.upsert", records=len(new)):
+                    collection.upsert(ids=new, embeddings=embeddings, documents=texts, metadatas=metadatas)
+
+            catalog.put_manifest(book_id, content_type, version, ids, timestamp, chapters=chapter_of)
+            catalog.prune(book_id, content_type, KEEP_VERSIONS)
+            orphans = stored - catalog.referenced_ids(book_id, content_type)
+            if previous_version is None:
+                # First catalogued ingest: drop records written before the catalog existed
+                existing = collection.get(where=_where(type=content_type), include=[])["ids"]
+                orphans.update(rid for rid in existing if rid not in first)
+            if orphans:
+                with span("chroma.delete", records=len(orphans)):
+                    collection.delete(ids=list(orphans))
+            print(f"[ChromaDB] {book_id} {content_type} v{version}: {len(new)} embedded, "
+                  f"{len(ids) - len(new)} carried forward, {len(orphans)} removed")
+            return version
     except Exception as e:
         print(f"[ChromaDB] Error storing embeddings: {e}")
+        record_error("chroma.store")
+        return None
 
-def store_content_version(book_id: str, content: str, content_type: str, chapter: int = 0, version: int = 1):
+def store_content_version(book_id: str, content: str, content_type: str, chapter: int = 0, version: int = None,
+                          source_hash: str = None):
     """
-    Store a single content version (summary, review, MCQs, or chapter) with metadata.
-    Falls back gracefully if ChromaDB is not available.
+    Store and catalog one version of a chapter's artifact (next version by default),
+    tagged with source_hash, the hash of the text it was generated from.
+    Returns the stored version number (None on failure).
     """
-    if not CHROMADB_AVAILABLE:
-        print("ChromaDB not available - skipping content storage")
-        return
-        
+    if not EMBEDDINGS_AVAILABLE:
+        print("Embeddings not available - skipping storage")
+        return None
     try:
-        chroma_client = Client(Settings(persist_directory="./chroma_data"))
-        collection = chroma_client.get_or_create_collection("bookbrain_chapters")
-        
-        if not EMBEDDINGS_AVAILABLE:
-            print("Embeddings not available - skipping storage")
-            return
-            
-        embedding = embedder.encode([content]).tolist()[0]
-        id = f"{book_id}_{content_type}_v{version}_ch_{chapter}"
-        timestamp = int(time.time())
-        metadata = {
-            "book_id": book_id,
-            "chapter": chapter,
-            "type": content_type,
-            "version": version,
-            "timestamp": timestamp
-        }
-        collection.upsert(ids=[id], embeddings=[embedding], documents=[content], metadatas=[metadata])
+        collection = get_book_collection(book_id)
+        catalog = get_catalog()
+        with _book_lock(book_id):
+            if version is None:
+                latest = catalog.latest(book_id, content_type, chapter)
+                version = latest["version"] + 1 if latest else 1
+            embedding = encode([content]).tolist()[0]
+            id = f"{book_id}_{content_type}_v{version}_ch_{chapter}"
+            timestamp = int(time.time())
+            metadata = {
+                "book_id": book_id,
+                "chapter": chapter,
+                "type": content_type,
+                "version": version,
+                "timestamp": timestamp
+            }
+            if source_hash:
+                metadata["source_hash"] = source_hash
+            with span("chroma.upsert", records=1):
+                collection.upsert(ids=[id], embeddings=[embedding], documents=[content], metadatas=[metadata])
+            catalog.put_entry(book_id, content_type, chapter, version, id, timestamp)
+            return version
     except Exception as e:
         print(f"[ChromaDB] Error storing content version: {e}")
+        record_error("chroma.store")
+        return None
 
-def retrieve_content_versions(book_id: str, content_type: str, chapter: int = None):
+def list_content_versions(book_id: str, content_type: str, chapter: int = None, limit: int = None, offset: int = 0):
     """
-    Retrieve all versions of a given content type (and optionally chapter) for a book.
-    Returns a list of dicts with content, version, and metadata.
-    Falls back gracefully if ChromaDB is not available.
+    Version metadata (id, chapter, version, timestamp) newest first, paged with
+    limit/offset. Served from the version catalog; no document bodies are loaded.
     """
-    if not CHROMADB_AVAILABLE:
-        print("ChromaDB not available - returning empty results")
+    try:
+        return get_catalog().history(book_id, content_type, chapter, limit=limit, offset=offset)
+    except Exception as e:
+        print(f"[ChromaDB] Error listing content versions: {e}")
         return []
-        
+
+def _with_content(book_id: str, entries):
+    """Attach document bodies to catalog entries with one ID lookup."""
+    if not entries:
+        return []
+    collection = find_book_collection(book_id)
+    if collection is None:
+        return []
+    with span("chroma.get", records=len(entries)):
+        results = collection.get(ids=[e["id"] for e in entries], include=["documents", "metadatas"])
+    found = {id: (doc, meta) for id, doc, meta in zip(results["ids"], results["documents"], results["metadatas"])}
+    out = []
+    for entry in entries:
+        if entry["id"] not in found:
+            continue
+        doc, meta = found[entry["id"]]
+        out.append({
+            "content": doc,
+            "version": entry["version"],
+            "metadata": dict(meta or {}, chapter=entry["chapter"], version=entry["version"])
+        })
+    return out
+
+def get_latest_content(book_id: str, content_type: str, chapter: int = 0):
+    """
+    The newest stored version of one chapter's artifact as a dict with content,
+    version and metadata, or None. A single-key catalog lookup plus one fetch by ID.
+    """
     try:
-        chroma_client = Client(Settings(persist_directory="./chroma_data"))
-        collection = chroma_client.get_or_create_collection("bookbrain_chapters")
-        
-        # Query all documents for this book_id and type
-        where = {"book_id": book_id, "type": content_type}
-        if chapter is not None:
-            where["chapter"] = chapter
-        results = collection.get(where=where)
+        entry = get_catalog().latest(book_id, content_type, chapter)
+        if entry is None:
+            return None
+        found = _with_content(book_id, [entry])
+        return found[0] if found else None
+    except Exception as e:
+        print(f"[ChromaDB] Error retrieving latest content: {e}")
+        record_error("chroma.get")
+        return None
+
+def retrieve_content_versions(book_id: str, content_type: str, chapter: int = None, limit: int = None, offset: int = 0):
+    """
+    Versions of a content type (optionally one chapter) for a book, latest first and
+    paged with limit/offset, as dicts with content, version, and metadata.
+    """
+    try:
+        catalog = get_catalog()
+        entries = catalog.history(book_id, content_type, chapter, limit=limit, offset=offset)
+        if entries or offset or catalog.latest_version(book_id, content_type) is not None:
+            # Ingested content (an ingest manifest) has no per-chapter artifact versions
+            return _with_content(book_id, entries)
+
+        # Content stored before the version catalog existed: scan the partition
+        collection = find_book_collection(book_id)
+        if collection is None:
+            return []
+        where = _where(book_id=book_id, type=content_type, chapter=chapter)
+        with span("chroma.get", scan=True) as s:
+            results = collection.get(where=where)
+            s["records"] = len(results["ids"])
         out = []
         for doc, meta in zip(results["documents"], results["metadatas"]):
             out.append({
@@ -112,30 +363,83 @@ def retrieve_content_versions(book_id: str, content_type: str, chapter: int = No
             })
         # Sort by version descending (latest first)
         out.sort(key=lambda x: x["version"], reverse=True)
-        return out
+        return out[offset:None if limit is None else offset + limit]
     except Exception as e:
         print(f"[ChromaDB] Error retrieving content versions: {e}")
+        record_error("chroma.get")
+        return []
+
+def _query_partition(name: str, query_emb, top_k: int, where):
+    collection = find_collection(name)
+    if collection is None:
         return []
+    with span("chroma.query", top_k=top_k):
+        results = collection.query(query_embeddings=[query_emb], n_results=top_k, where=where)
+    hits = []
+    for id, doc, meta, dist in zip(results["ids"][0], results["documents"][0],
+                                   results["metadatas"][0], results["distances"][0]):
+        hits.append({"id": id, "text": doc, "meta": meta, "distance": dist})
+    return hits
 
-def semantic_search(query: str, top_k: int = 3):
+def _current_hits(hits):
     """
-    Perform semantic search using embeddings.
-    Falls back to simple text search if embeddings are not available.
+    Report ingested records with the chapter and version of their book's latest
+    manifest, and drop records only an older retained version still references.
+    Records outside ingest manifests (artifact versions, legacy data) pass through.
     """
-    if not CHROMADB_AVAILABLE or not EMBEDDINGS_AVAILABLE:
-        print("ChromaDB or embeddings not available - using fallback search")
+    catalog = get_catalog()
+    manifests = {}
+    out = []
+    for hit in hits:
+        meta = hit["meta"] or {}
+        key = (meta.get("book_id"), meta.get("type"))
+        if key not in manifests:
+            version = catalog.latest_version(*key) if None not in key else None
+            manifests[key] = None if version is None else (
+                version, catalog.manifest_chapters(*key, version), catalog.referenced_ids(*key))
+        manifest = manifests[key]
+        if manifest is not None:
+            version, chapters, referenced = manifest
+            if hit["id"] in chapters:
+                hit = dict(hit, meta=dict(meta, chapter=chapters[hit["id"]], version=version))
+            elif hit["id"] in referenced:
+                continue
+        out.append(hit)
+    return out
+
+def semantic_search(query: str, top_k: int = 3, book_id: str = None, content_type: str = None):
+    """
+    Semantic search over one book's partition (book_id) or all partitions in parallel,
+    optionally filtered by content_type. Hits report the chapter and version of the
+    book's latest ingest. Returns [] if embeddings are not available.
+    """
+    if not EMBEDDINGS_AVAILABLE:
+        print("Embeddings not available - using fallback search")
         return []
         
     try:
-        chroma_client = Client(Settings(persist_directory="./chroma_data"))
-        collection = chroma_client.get_or_create_collection("bookbrain_chapters")
-        
-        query_emb = embedder.encode([query]).tolist()[0]
-        results = collection.query(query_embeddings=[query_emb], n_results=top_k)
-        hits = []
-        for doc, meta in zip(results["documents"][0], results["metadatas"][0]):
-            hits.append({"text": doc, "meta": meta})
-        return hits
+        query_emb = encode([query]).tolist()[0]
+        candidates = top_k * max(1, KEEP_VERSIONS)
+        if book_id is not None:
+            hits = _query_partition(book_collection_name(book_id), query_emb, candidates, _where(type=content_type))
+            return _current_hits(hits)[:top_k]
+        # Library-wide: the legacy shared collection can hold several books
+        partitions = list_partitions()
+        if not partitions:
+            return []
+
+        def search(name):
+            try:
+                return _current_hits(_query_partition(name, query_emb, candidates, _where(type=content_type)))[:top_k]
+            except Exception as e:
+                print(f"[ChromaDB] Error searching {name}: {e}")
+                record_error("chroma.query")
+                return []
+
+        with ThreadPoolExecutor(max_workers=min(SEARCH_WORKERS, len(partitions))) as executor:
+            results = list(executor.map(search, partitions))
+        return heapq.nsmallest(top_k, (hit for hits in results for hit in hits), key=lambda h: h["distance"])
     except Exception as e:
         print(f"[ChromaDB] Error in semantic search: {e}")
-        return [] 
+        record_error("chroma.query")
+        return []
@@ -0,0 +1,155 @@
+import os
+import re
+from typing import List, NamedTuple
+
+from metrics_utils import span
+
+# Use the real tokenizer when tiktoken is installed, otherwise estimate ~4 chars per token
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+    TIKTOKEN_AVAILABLE = True
+except Exception:
+    _encoding = None
+    TIKTOKEN_AVAILABLE = False
+
+CHARS_PER_TOKEN = 4
+
+# Token budgets for each place text gets chunked
+EMBED_CHUNK_TOKENS = int(os.getenv("EMBED_CHUNK_TOKENS", "250"))        # MiniLM truncates at 256 word pieces
+EMBED_CHUNK_OVERLAP = int(os.getenv("EMBED_CHUNK_OVERLAP", "25"))
+QA_CHUNK_TOKENS = int(os.getenv("QA_CHUNK_TOKENS", "3000"))
+QA_CHUNK_OVERLAP = int(os.getenv("QA_CHUNK_OVERLAP", "150"))
+CHAPTER_MAX_TOKENS = int(os.getenv("CHAPTER_MAX_TOKENS", "2500"))      # longer chapters are split
+CHAPTER_PART_TOKENS = int(os.getenv("CHAPTER_PART_TOKENS", "2000"))
+
+# A paragraph may close a chunk early once it is this full
+_PARAGRAPH_BREAK_FILL = 0.8
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])[\"'”’)\]]*\s+")
+_WORD_RE = re.compile(r"\S+\s*")
+
+
+class Chunk(NamedTuple):
+    text: str
+    start: int   # offset of the chunk in the source text
+    end: int
+    tokens: int
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in text (estimated when tiktoken is not installed)."""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+def _split_spans(text, start, end, pattern):
+    """Split text[start:end] after each match of pattern, as (start, end) spans."""
+    spans = []
+    pos = start
+    for m in pattern.finditer(text, start, end):
+        if m.end() > pos:
+            spans.append((pos, m.end()))
+            pos = m.end()
+    if pos < end:
+        spans.append((pos, end))
+    return spans
+
+
+def _segments(text, max_tokens):
+    """
+    Break text into (start, end, tokens, starts_paragraph) segments no larger
+    than max_tokens, preferring paragraph, then sentence, then word boundaries.
+    """
+    segments = []
+    for p_start, p_end in _split_spans(text, 0, len(text), _PARAGRAPH_RE):
+        first = True
+        for s_start, s_end in _split_spans(text, p_start, p_end, _SENTENCE_RE):
+            tokens = count_tokens(text[s_start:s_end])
+            if tokens <= max_tokens:
+                pieces = [(s_start, s_end, tokens)]
+            else:
+                pieces = []
+                for w_start, w_end in _split_spans(text, s_start, s_end, _WORD_RE):
+                    w_tokens = count_tokens(text[w_start:w_end])
+                    if w_tokens <= max_tokens:
+                        pieces.append((w_start, w_end, w_tokens))
+                        continue
+                    # A single "word" over budget (e.g. a URL blob): hard split by characters
+                    step = max(1, max_tokens * CHARS_PER_TOKEN // 2)
+                    for c in range(w_start, w_end, step):
+                        c_end = min(c + step, w_end)
+                        pieces.append((c, c_end, count_tokens(text[c:c_end])))
+            for seg_start, seg_end, seg_tokens in pieces:
+                segments.append((seg_start, seg_end, seg_tokens, first))
+                first = False
+    return segments
+
+
+def chunk_text(text: str, max_tokens: int = QA_CHUNK_TOKENS, overlap_tokens: int = 0) -> List[Chunk]:
+    """
+    Split text into chunks of at most max_tokens tokens that end on paragraph or
+    sentence boundaries where possible. Consecutive chunks share up to
+    overlap_tokens tokens of whole sentences. Each Chunk carries its offsets into
+    the source text; whitespace-only chunks are dropped.
+    """
+    if not text or not text.strip():
+        return []
+    with span("chunking.chunk_text", chars=len(text)) as s:
+        chunks = _chunk_text(text, max_tokens, overlap_tokens)
+        s["chunks"] = len(chunks)
+        s["tokens"] = sum(c.tokens for c in chunks)
+    return chunks
+
+def _chunk_text(text, max_tokens, overlap_tokens):
+    max_tokens = max(1, max_tokens)
+    overlap_tokens = max(0, min(overlap_tokens, max_tokens // 2))
+    segments = _segments(text, max_tokens)
+    chunks = []
+    i = 0
+    while i < len(segments):
+        j = i
+        total = 0
+        while j < len(segments):
+            seg_tokens = segments[j][2]
+            if j > i and total + seg_tokens > max_tokens:
+                break
+            if j > i and segments[j][3] and total >= max_tokens * _PARAGRAPH_BREAK_FILL:
+                break
+            total += seg_tokens
+            j += 1
+        start, end = segments[i][0], segments[j - 1][1]
+        chunk = text[start:end].strip()
+        if chunk:
+            lead = len(text[start:end]) - len(text[start:end].lstrip())
+            chunks.append(Chunk(chunk, start + lead, start + lead + len(chunk), total))
+        if j >= len(segments):
+            break
+        # Step back over whole segments to build the overlap, always moving forward
+        back = j
+        carried = 0
+        while overlap_tokens and back - 1 > i and carried + segments[back - 1][2] <= overlap_tokens:
+            back -= 1
+            carried += segments[back][2]
+        i = back
+    return chunks
+
+
+def chunk_strings(text: str, max_tokens: int = QA_CHUNK_TOKENS, overlap_tokens: int = 0) -> List[str]:
+    """chunk_text() returning only the chunk strings."""
+    return [chunk.text for chunk in chunk_text(text, max_tokens, overlap_tokens)]
+
+
+def embedding_chunks(text: str) -> List[str]:
+    """Chunks sized for the sentence-embedding model."""
+    return chunk_strings(text, EMBED_CHUNK_TOKENS, EMBED_CHUNK_OVERLAP)
+
+
+def chunker_key(max_tokens: int, overlap_tokens: int = 0) -> str:
+    """Identifies a chunker configuration, e.g. for embedding cache keys."""
+    counter = "tiktoken" if TIKTOKEN_AVAILABLE else f"chars{CHARS_PER_TOKEN}"
+    return f"sent:{counter}:{max_tokens}:{overlap_tokens}"
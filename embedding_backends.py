@@ -0,0 +1,360 @@
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+# Both backends are optional: PyTorch via sentence-transformers (the reference),
+# ONNX Runtime + tokenizers for faster CPU inference
+try:
+    from sentence_transformers import SentenceTransformer
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+try:
+    import onnxruntime as ort
+    from tokenizers import Tokenizer
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+# "torch" (sentence-transformers) or "onnx" (ONNX Runtime, exported from the torch model once)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+# "int8" applies dynamic int8 quantization to the ONNX model; "none" keeps float32
+EMBEDDING_QUANTIZE = os.getenv("EMBEDDING_QUANTIZE", "int8").lower()
+# Exported ONNX models and tuning results live here, one directory per model
+EMBEDDING_MODELS_DIR = os.getenv("EMBEDDING_MODELS_DIR", "./embedding_models")
+# 0 = pick automatically (auto-tuned when EMBED_AUTOTUNE is on, otherwise the library default)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "0"))
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0"))
+# "1"/"0" to force tuning on/off; by default only the ONNX backend is tuned (torch keeps its defaults)
+EMBED_AUTOTUNE = os.getenv("EMBED_AUTOTUNE", "")
+# An exported model whose vectors differ more than this from the torch reference is not used
+EMBED_MIN_COSINE = float(os.getenv("EMBED_MIN_COSINE", "0.99"))
+
+_BATCH_CANDIDATES = (8, 16, 32, 64, 128)
+_CONSISTENCY_TEXTS = [
+    "The old king walked slowly through the garden at night.",
+    "She wrote a letter to her brother before the storm reached the island.",
+    "Chapter 3: The Journey Across the Mountains",
+    "Quantum mechanics describes nature at the scale of atoms and subatomic particles.",
+    "\"Where were you?\" he asked, but the stranger said nothing and returned to the ship.",
+    "Prices in the market rose sharply after the war, and many families left the city.",
+    "a",
+    " ".join(["The river carried the memory of the village far beyond the bridge."] * 40),
+]
+
+
+def _safe_name(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+
+def _sample_texts(count: int):
+    """Chunk-sized synthetic texts for tuning (about EMBED_CHUNK_TOKENS tokens each)."""
+    from chunking_utils import EMBED_CHUNK_TOKENS
+    words = _CONSISTENCY_TEXTS[7].split()
+    length = max(1, int(EMBED_CHUNK_TOKENS * 0.75))
+    return [" ".join(words[i % 7:i % 7 + length]) for i in range(count)]
+
+def _read_json(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_json(path: str, data: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+class TorchBackend:
+    """The reference backend: sentence-transformers on PyTorch, full precision."""
+
+    name = "torch"
+
+    def __init__(self, model_name: str, model=None):
+        if model is None:
+            if not TORCH_AVAILABLE:
+                raise RuntimeError("sentence-transformers is not installed")
+            model = SentenceTransformer(model_name, device="cpu")
+        self.model_name = model_name
+        self.model = model
+        self.batch_size = 32
+        self.threads = None
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    @property
+    def cache_name(self) -> str:
+        """Name of the on-disk embedding cache; backends with identical vectors share one."""
+        return self.model_name
+
+    def set_threads(self, threads: int):
+        import torch
+        torch.set_num_threads(threads)
+        self.threads = threads
+
+    def encode(self, texts) -> np.ndarray:
+        return np.asarray(self.model.encode(list(texts), batch_size=self.batch_size), dtype=np.float32)
+
+
+class OnnxBackend:
+    """
+    The model exported to ONNX and run with ONNX Runtime, optionally with int8
+    dynamic quantization of the weights. Only onnxruntime and tokenizers are
+    needed at run time; sentence-transformers is needed once, for the export.
+    With verify (the default) the variant is exported if needed and refused if
+    its recorded consistency check is below EMBED_MIN_COSINE; export_onnx
+    passes verify=False to load a variant it is about to check.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_name: str, quantize: str = EMBEDDING_QUANTIZE,
+                 models_dir: str = EMBEDDING_MODELS_DIR, verify: bool = True):
+        if not ONNX_AVAILABLE:
+            raise RuntimeError("onnxruntime and tokenizers are not installed")
+        self.model_name = model_name
+        self.quantize = quantize if quantize in ("int8",) else "none"
+        self.directory = os.path.join(models_dir, _safe_name(model_name))
+        self.variant = "model.int8.onnx" if self.quantize == "int8" else "model.onnx"
+        self.config_path = os.path.join(self.directory, "config.json")
+        self.config = _read_json(self.config_path)
+        if verify:
+            if self.variant not in self.config.get("variants", {}):
+                export_onnx(model_name, self.directory, quantize=self.quantize)
+                self.config = _read_json(self.config_path)
+            check = self.config["variants"][self.variant]
+            if check["min_cosine"] < EMBED_MIN_COSINE:
+                raise RuntimeError(f"{self.variant} differs from the torch reference "
+                                   f"(min cosine {check['min_cosine']:.4f} < {EMBED_MIN_COSINE})")
+        self.tokenizer = Tokenizer.from_file(os.path.join(self.directory, "tokenizer.json"))
+        self.tokenizer.enable_truncation(self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_id"], pad_token=self.config["pad_token"])
+        self.batch_size = 32
+        self.threads = None
+        self.session = self._session(None)
+
+    @property
+    def dimension(self) -> int:
+        return self.config["dimension"]
+
+    @property
+    def cache_name(self) -> str:
+        # Quantized vectors differ slightly from the reference, so they get their own cache
+        return self.model_name if self.quantize == "none" else f"{self.model_name}@{self.quantize}"
+
+    def _session(self, threads):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        return ort.InferenceSession(os.path.join(self.directory, self.variant), options,
+                                    providers=["CPUExecutionProvider"])
+
+    def set_threads(self, threads: int):
+        self.session = self._session(threads)
+        self.threads = threads
+
+    def encode(self, texts) -> np.ndarray:
+        texts = list(texts)
+        out = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        # Batch texts of similar length together so little time goes into padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            out[idx] = self._encode_batch([texts[i] for i in idx])
+        return out
+
+    def _encode_batch(self, texts) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": np.array([e.ids for e in encodings], dtype=np.int64), "attention_mask": mask}
+        if "token_type_ids" in self.config["inputs"]:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        hidden = self.session.run(None, feeds)[0]
+        if self.config["pooling"] == "cls":
+            vectors = hidden[:, 0]
+        else:
+            weights = mask[:, :, None].astype(np.float32)
+            vectors = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        if self.config["normalize"]:
+            vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors.astype(np.float32)
+
+
+def check_consistency(backend, reference, texts=None) -> dict:
+    """Cosine similarity between a backend's vectors and the reference backend's, per text."""
+    texts = list(texts or _CONSISTENCY_TEXTS)
+    a = backend.encode(texts)
+    b = reference.encode(texts)
+    cos = (a * b).sum(axis=1) / np.clip(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12, None)
+    return {"min_cosine": float(cos.min()), "mean_cosine": float(cos.mean()), "texts": len(texts)}
+
+def _pooling_config(model) -> dict:
+    """Read pooling and normalization from a sentence-transformers pipeline; only plain mean/CLS pooling is exported."""
+    from sentence_transformers import models
+    modules = list(model)
+    if not isinstance(modules[0], models.Transformer) or len(modules) < 2 or not isinstance(modules[1], models.Pooling):
+        raise RuntimeError("only Transformer + Pooling models can be exported to ONNX")
+    pooling = modules[1]
+    if pooling.pooling_mode_mean_tokens and not pooling.pooling_mode_cls_token:
+        mode = "mean"
+    elif pooling.pooling_mode_cls_token and not pooling.pooling_mode_mean_tokens:
+        mode = "cls"
+    else:
+        raise RuntimeError("unsupported pooling mode for the ONNX backend")
+    extra = modules[2:]
+    if any(not isinstance(m, models.Normalize) for m in extra):
+        raise RuntimeError("models with layers after pooling are not supported by the ONNX backend")
+    return {"pooling": mode, "normalize": bool(extra)}
+
+def export_onnx(model_name: str, directory: str, quantize: str = "none"):
+    """
+    Export a sentence-transformers model to ONNX (and optionally an int8 dynamically
+    quantized copy) in directory, and record how closely each variant matches the
+    torch reference in config.json. A variant is only recorded once its check has
+    run, so an interrupted or failed check is simply repeated next time.
+    """
+    if not TORCH_AVAILABLE:
+        raise RuntimeError("sentence-transformers is needed to export the ONNX model")
+    import torch
+    os.makedirs(directory, exist_ok=True)
+    config_path = os.path.join(directory, "config.json")
+    config = _read_json(config_path)
+    st_model = SentenceTransformer(model_name, device="cpu")
+    reference = TorchBackend(model_name, st_model)
+    fp32_path = os.path.join(directory, "model.onnx")
+
+    if "model.onnx" not in config.get("variants", {}) or not os.path.exists(fp32_path):
+        print(f"[Embeddings] Exporting {model_name} to ONNX...")
+        tokenizer = st_model.tokenizer
+        tokenizer.save_pretrained(directory)
+        transformer = st_model[0].auto_model.eval()
+        sample = tokenizer(["an example sentence", "another one"], padding=True, return_tensors="pt")
+        inputs = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+        class _Encoder(torch.nn.Module):
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, *args):
+                return self.model(**dict(zip(inputs, args)))[0]
+
+        axes = {name: {0: "batch", 1: "sequence"} for name in inputs}
+        axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        with torch.no_grad():
+            torch.onnx.export(_Encoder(transformer), tuple(sample[name] for name in inputs), fp32_path,
+                              input_names=inputs, output_names=["last_hidden_state"],
+                              dynamic_axes=axes, opset_version=14)
+        config = {
+            "model_name": model_name,
+            "dimension": st_model.get_sentence_embedding_dimension(),
+            "max_seq_length": st_model.max_seq_length,
+            "inputs": inputs,
+            "pad_id": tokenizer.pad_token_id,
+            "pad_token": tokenizer.pad_token,
+            **_pooling_config(st_model),
+            "variants": {},
+        }
+        _write_json(config_path, config)
+
+    variants = ["model.onnx"] + (["model.int8.onnx"] if quantize == "int8" else [])
+    if "model.int8.onnx" in variants and "model.int8.onnx" not in config["variants"]:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        print(f"[Embeddings] Quantizing {model_name} to int8...")
+        quantize_dynamic(fp32_path, os.path.join(directory, "model.int8.onnx"), weight_type=QuantType.QInt8)
+
+    for variant in variants:
+        if variant in config["variants"]:
+            continue
+        backend = OnnxBackend(model_name, "int8" if variant == "model.int8.onnx" else "none",
+                              os.path.dirname(directory), verify=False)
+        check = check_consistency(backend, reference)
+        config["variants"][variant] = check
+        _write_json(config_path, config)
+        print(f"[Embeddings] {variant}: min cosine {check['min_cosine']:.4f}, "
+              f"mean {check['mean_cosine']:.4f} vs. torch")
+
+def tune(backend, models_dir: str = EMBEDDING_MODELS_DIR):
+    """
+    Pick the fastest thread count and batch size for this backend on this machine
+    by timing chunk-sized synthetic texts. Results are remembered per backend and
+    CPU count in tuning.json, so tuning runs once. EMBED_THREADS / EMBED_BATCH_SIZE
+    override the tuned values.
+    """
+    cpus = os.cpu_count() or 1
+    path = os.path.join(models_dir, _safe_name(backend.model_name), "tuning.json")
+    key = f"{backend.name}:{backend.cache_name}:{cpus}"
+    results = _read_json(path)
+    best = results.get(key)
+    autotune = EMBED_AUTOTUNE == "1" or (EMBED_AUTOTUNE == "" and backend.name == "onnx")
+    if best is None and autotune:
+        texts = _sample_texts(max(_BATCH_CANDIDATES) * 2)
+        thread_options = [EMBED_THREADS] if EMBED_THREADS else sorted({cpus, max(1, cpus // 2), max(1, cpus // 4)})
+        batch_options = [EMBED_BATCH_SIZE] if EMBED_BATCH_SIZE else _BATCH_CANDIDATES
+        best = {"texts_per_s": 0.0}
+        for threads in thread_options:
+            backend.set_threads(threads)
+            backend.batch_size = batch_options[0]
+            backend.encode(texts[:batch_options[0]])  # warm up
+            for batch_size in batch_options:
+                backend.batch_size = batch_size
+                start = time.perf_counter()
+                backend.encode(texts)
+                rate = len(texts) / (time.perf_counter() - start)
+                if rate > best["texts_per_s"]:
+                    best = {"threads": threads, "batch_size": batch_size, "texts_per_s": rate}
+        print(f"[Embeddings] Tuned {backend.name}: {best['threads']} threads, batch size {best['batch_size']} "
+              f"({best['texts_per_s']:.1f} texts/s)")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        results[key] = best
+        _write_json(path, results)
+    best = best or {}
+    threads = EMBED_THREADS or best.get("threads")
+    if threads and threads != backend.threads:
+        backend.set_threads(threads)
+    backend.batch_size = EMBED_BATCH_SIZE or best.get("batch_size") or backend.batch_size
+    return backend
+
+_tune_lock = threading.Lock()
+
+def load_backend(model_name: str, backend: str = EMBEDDING_BACKEND, batch_size: int = 32):
+    """
+    Create and tune the configured embedding backend; batch_size is used when
+    neither tuning nor EMBED_BATCH_SIZE sets one. If the ONNX backend cannot be
+    used (not installed, export failed, or it does not match the reference),
+    falls back to the fp32 ONNX model when int8 was requested, then to torch.
+    """
+    if backend == "onnx":
+        for quantize in ("int8", "none") if EMBEDDING_QUANTIZE == "int8" else ("none",):
+            try:
+                with _tune_lock:
+                    onnx_backend = OnnxBackend(model_name, quantize)
+                    onnx_backend.batch_size = batch_size
+                    return tune(onnx_backend)
+            except Exception as e:
+                print(f"[Embeddings] ONNX backend ({quantize}) unavailable: {e}")
+        print("[Embeddings] Using torch")
+    elif backend != "torch":
+        print(f"[Embeddings] Unknown EMBEDDING_BACKEND '{backend}', using torch")
+    with _tune_lock:
+        torch_backend = TorchBackend(model_name)
+        torch_backend.batch_size = batch_size
+        return tune(torch_backend)
+
+def backend_available(model_name: str, backend: str = EMBEDDING_BACKEND) -> bool:
+    """Whether load_backend() can succeed without raising."""
+    if backend == "onnx" and ONNX_AVAILABLE:
+        exported = os.path.exists(os.path.join(EMBEDDING_MODELS_DIR, _safe_name(model_name), "config.json"))
+        return exported or TORCH_AVAILABLE
+    return TORCH_AVAILABLE
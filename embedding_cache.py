@@ -0,0 +1,135 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "./embedding_cache")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+
+def content_hash(text: str) -> str:
+    """SHA-256 hex digest of a piece of text, used as a stable content key."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache for one embedding model.
+    Vectors are stored as float16 rows in a single memory-mapped file with a fixed
+    number of slots; a small SQLite index maps each key to its slot and tracks
+    last use, so the least recently used entries are overwritten once the cache
+    is full.
+    """
+
+    def __init__(self, model_name: str, dim: int,
+                 max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+                 cache_dir: str = EMBEDDING_CACHE_DIR):
+        os.makedirs(cache_dir, exist_ok=True)
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        self.dim = dim
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._vectors_path = os.path.join(cache_dir, f"{safe_name}.f16")
+        self._conn = sqlite3.connect(os.path.join(cache_dir, f"{safe_name}.db"),
+                                     check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._open_vectors()
+
+    def _open_vectors(self):
+        meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+        layout = {"dim": str(self.dim), "max_entries": str(self.max_entries)}
+        expected_size = self.dim * self.max_entries * 2
+        valid = (
+            meta == layout
+            and os.path.exists(self._vectors_path)
+            and os.path.getsize(self._vectors_path) == expected_size
+        )
+        if not valid:
+            # Layout changed (or first run): start from an empty cache
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("DELETE FROM meta")
+            self._conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", layout.items())
+            mode = "w+"
+        else:
+            mode = "r+"
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float16, mode=mode,
+                                  shape=(self.max_entries, self.dim))
+
+    def _lookup_slots(self, keys):
+        slots = {}
+        for i in range(0, len(keys), 500):
+            part = keys[i:i + 500]
+            placeholders = ",".join("?" * len(part))
+            slots.update(self._conn.execute(
+                f"SELECT key, slot FROM entries WHERE key IN ({placeholders})", part
+            ).fetchall())
+        return slots
+
+    def get_many(self, keys):
+        """Return {key: float32 vector} for the keys present in the cache."""
+        if not keys:
+            return {}
+        with self._lock:
+            slots = self._lookup_slots(list(dict.fromkeys(keys)))
+            found = {key: np.asarray(self._vectors[slot], dtype=np.float32) for key, slot in slots.items()}
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE entries SET last_used = ? WHERE key = ?",
+                                       [(now, k) for k in found])
+        return found
+
+    def put_many(self, keys, vectors):
+        """Store vectors under keys, evicting least recently used entries when full."""
+        if not keys:
+            return
+        vectors = np.asarray(vectors, dtype=np.float16)
+        items = dict(zip(keys, vectors))
+        # More new entries than slots: only the last max_entries can survive anyway
+        if len(items) > self.max_entries:
+            items = dict(list(items.items())[-self.max_entries:])
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                existing = self._lookup_slots(list(items))
+                new_keys = [k for k in items if k not in existing]
+                used = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                free = min(len(new_keys), self.max_entries - used)
+                slots = list(range(used, used + free))
+                if len(new_keys) > free:
+                    needed = len(new_keys) - free
+                    candidates = self._conn.execute(
+                        "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (needed + len(existing),)
+                    ).fetchall()
+                    # Never evict an entry that this batch is about to overwrite
+                    victims = [(k, s) for k, s in candidates if k not in existing][:needed]
+                    self._conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _ in victims])
+                    slots.extend(s for _, s in victims)
+                fresh = set(new_keys)
+                rows = []
+                for key, slot in zip(new_keys, slots):
+                    existing[key] = slot
+                    rows.append((key, slot, now))
+                self._conn.executemany("INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)", rows)
+                self._conn.executemany("UPDATE entries SET last_used = ? WHERE key = ?",
+                                       [(now, k) for k in existing if k not in fresh])
+                for key, vec in items.items():
+                    self._vectors[existing[key]] = vec
+                self._vectors.flush()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
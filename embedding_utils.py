@@ -0,0 +1,175 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from embedding_backends import load_backend, backend_available, EMBEDDING_BACKEND
+from embedding_cache import EmbeddingCache, content_hash
+from metrics_utils import span, cache_result
+
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+
+# The configured backend (see embedding_backends) is optional, like every model dependency
+EMBEDDINGS_AVAILABLE = backend_available(EMBEDDING_MODEL_NAME)
+if not EMBEDDINGS_AVAILABLE:
+    print(f"Warning: No '{EMBEDDING_BACKEND}' embedding backend available (install sentence-transformers). "
+          "Embedding features will be disabled.")
+# Micro-batching knobs: how many texts go into one model call, and how long the
+# worker waits for more requests to arrive before running a partial batch.
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "64"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "10"))
+
+
+class EmbeddingService:
+    """
+    Process-wide embedding service shared by every module and Streamlit session.
+    The model is loaded lazily on first use, with the backend chosen by
+    EMBEDDING_BACKEND (torch or ONNX). Concurrent encode() calls are merged
+    into micro-batches by a single worker thread, so the model is never called
+    from more than one thread at a time.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME,
+                 max_batch_size: int = EMBED_MAX_BATCH_SIZE,
+                 max_wait_ms: float = EMBED_MAX_WAIT_MS):
+        self.model_name = model_name
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._cache = None
+
+    def get_model(self):
+        """Load the model once (thread-safe) and return it."""
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    if not EMBEDDINGS_AVAILABLE:
+                        raise RuntimeError(f"no embedding backend available for '{EMBEDDING_BACKEND}'")
+                    self._model = load_backend(self.model_name, batch_size=self.max_batch_size)
+        return self._model
+
+    @property
+    def dimension(self) -> int:
+        return self.get_model().dimension
+
+    def encode(self, texts) -> np.ndarray:
+        """
+        Encode a list of texts, returning a (len(texts), dim) float32 array.
+        Blocks until this request's micro-batch has been processed.
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        with span("embedding.encode", texts=len(texts), chars=sum(len(t) for t in texts)):
+            self._ensure_worker()
+            future = Future()
+            self._queue.put((texts, future))
+            return future.result()
+
+    def get_cache(self) -> EmbeddingCache:
+        """Open the on-disk embedding cache for this model (thread-safe)."""
+        if self._cache is None:
+            dim = self.dimension
+            with self._load_lock:
+                if self._cache is None:
+                    self._cache = EmbeddingCache(self.get_model().cache_name, dim)
+        return self._cache
+
+    def encode_cached(self, texts, chunker: str = "") -> np.ndarray:
+        """
+        Like encode(), but looks each text up in the on-disk cache first, keyed by
+        (model name, chunker params, SHA of the text). Only misses hit the model.
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        texts = list(texts)
+        if not texts:
+            return self.encode(texts)
+        try:
+            cache = self.get_cache()
+        except Exception as e:
+            print(f"[Embeddings] Cache unavailable, encoding without it: {e}")
+            return self.encode(texts)
+        keys = [f"{chunker}:{content_hash(t)}" for t in texts]
+        found = cache.get_many(keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        cache_result("embedding", len(keys) - len(missing), len(missing))
+        if missing:
+            vectors = self.encode(list(missing.values()))
+            cache.put_many(list(missing), vectors)
+            found.update(zip(missing, vectors))
+        return np.stack([found[k] for k in keys]).astype(np.float32)
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embedding-service", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+            # Keep collecting requests until the batch is full or the wait expires
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+            self._process(batch)
+
+    def _process(self, batch):
+        try:
+            model = self.get_model()
+            all_texts = [t for texts, _ in batch for t in texts]
+            with span("embedding.model_batch", texts=len(all_texts), requests=len(batch)):
+                vectors = model.encode(all_texts)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        offset = 0
+        for texts, future in batch:
+            future.set_result(vectors[offset:offset + len(texts)])
+            offset += len(texts)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_embedding_service() -> EmbeddingService:
+    """Return the process-wide EmbeddingService, creating it on first use."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = EmbeddingService()
+    return _service
+
+def encode(texts) -> np.ndarray:
+    """Encode texts with the shared embedding service."""
+    return get_embedding_service().encode(texts)
+
+def encode_cached(texts, chunker: str = "") -> np.ndarray:
+    """Encode texts through the persistent embedding cache."""
+    return get_embedding_service().encode_cached(texts, chunker=chunker)
@@ -1,11 +1,40 @@
-from ebooklib import epub
+import os
+from concurrent.futures import ProcessPoolExecutor
+from ebooklib import epub, ITEM_DOCUMENT
 from bs4 import BeautifulSoup
 
-def extract_chapters_from_epub(epub_path):
-    book = epub.read_epub(epub_path)
-    toc = book.toc
-    items = {item.get_name(): item for item in book.get_items() if item.get_type() == 9}
-    chapter_texts = []
+# lxml is much faster than html.parser; fall back to BeautifulSoup without it
+try:
+    import lxml.html
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+# Worker processes for HTML-to-text conversion (0 = one per CPU core)
+EPUB_WORKERS = int(os.getenv("EPUB_WORKERS", "0")) or os.cpu_count() or 1
+# Below this many documents a process pool costs more than it saves
+EPUB_PARALLEL_MIN_ITEMS = int(os.getenv("EPUB_PARALLEL_MIN_ITEMS", "8"))
+MIN_CHAPTER_CHARS = 50
+
+def html_to_text(content: bytes) -> str:
+    """
+    Convert an (X)HTML document to whitespace-joined plain text, skipping
+    script and style contents. Top-level so it can run in worker processes.
+    """
+    if LXML_AVAILABLE:
+        try:
+            doc = lxml.html.document_fromstring(content)
+            nodes = doc.xpath("//text()[not(ancestor::script) and not(ancestor::style)]")
+            return " ".join(s for s in (str(n).strip() for n in nodes) if s)
+        except Exception:
+            pass  # Malformed or empty document: let BeautifulSoup have a go
+    soup = BeautifulSoup(content, 'html.parser')
+    return soup.get_text(separator=' ', strip=True)
+
+def _toc_hrefs(toc, items):
+    """Document hrefs in TOC order, each listed once."""
+    hrefs = []
+    seen = set()
 
     def process_entry(entry):
         if isinstance(entry, tuple):
@@ -15,30 +44,76 @@ def extract_chapters_from_epub(epub_path):
             link = entry
             subs = []
         href = getattr(link, 'href', None)
-        if href and href in items:
-            item = items[href]
-            soup = BeautifulSoup(item.get_content(), 'html.parser')
-            text = soup.get_text(separator=' ', strip=True)
-            if len(text) > 50:
-                chapter_texts.append(text)
+        if href and href in items and href not in seen:
+            seen.add(href)
+            hrefs.append(href)
         for sub in subs:
             process_entry(sub)
 
     for entry in toc:
         process_entry(entry)
+    return hrefs
 
-    if not chapter_texts:
-        for item in book.get_items():
-            if item.get_type() == 9:
-                soup = BeautifulSoup(item.get_content(), 'html.parser')
-                text = soup.get_text(separator=' ', strip=True)
-                if len(text) > 50:
-                    chapter_texts.append(text)
+def _reading_order(book, items):
+    """Document hrefs in spine order, followed by any documents not in the spine."""
+    hrefs = []
+    seen = set()
+    for idref, _linear in book.spine:
+        item = book.get_item_with_id(idref)
+        if item is not None and item.get_name() in items and item.get_name() not in seen:
+            seen.add(item.get_name())
+            hrefs.append(item.get_name())
+    hrefs.extend(name for name in items if name not in seen)
+    return hrefs
+
+def _texts(items, hrefs, executor):
+    """Convert documents to text in order, yielding each as soon as it is ready."""
+    contents = (items[href].get_content() for href in hrefs)
+    if executor is None:
+        return map(html_to_text, contents)
+    return executor.map(html_to_text, contents, chunksize=4)
+
+def iter_chapters_from_epub(epub_path, max_workers: int = None):
+    """
+    Yield (title, text) for each chapter in TOC order (spine order if the TOC
+    yields nothing), as soon as each one has been converted. Every document is
+    parsed at most once; conversion runs on a process pool for larger books.
+    """
+    book = epub.read_epub(epub_path)
+    items = {item.get_name(): item for item in book.get_items() if item.get_type() == ITEM_DOCUMENT}
+    workers = max_workers or EPUB_WORKERS
+    executor = None
+    if workers > 1 and len(items) >= EPUB_PARALLEL_MIN_ITEMS:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        count = 0
+        toc_hrefs = _toc_hrefs(book.toc, items)
+        for text in _texts(items, toc_hrefs, executor):
+            if len(text) > MIN_CHAPTER_CHARS:
+                yield f"Chapter {count}", text
+                count += 1
+        if count == 0:
+            # TOC gave nothing usable: fall back to the remaining documents in reading order
+            parsed = set(toc_hrefs)
+            rest = [href for href in _reading_order(book, items) if href not in parsed]
+            for text in _texts(items, rest, executor):
+                if len(text) > MIN_CHAPTER_CHARS:
+                    yield f"Chapter {count}", text
+                    count += 1
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def extract_chapters_from_epub(epub_path):
+    chapter_titles = []
+    chapter_texts = []
+    for title, text in iter_chapters_from_epub(epub_path):
+        chapter_titles.append(title)
+        chapter_texts.append(text)
 
     if not chapter_texts:
         chapter_texts = ["(No chapters found or could not extract text)"]
+        # Format chapter titles as 'Chapter 0', 'Chapter 1', ...
+        chapter_titles = [f"Chapter {i}" for i in range(len(chapter_texts))]
 
-    # Format chapter titles as 'Chapter 0', 'Chapter 1', ...
-    chapter_titles = [f"Chapter {i}" for i in range(len(chapter_texts))]
-
-    return chapter_titles, chapter_texts 
\ No newline at end of file
+    return chapter_titles, chapter_texts
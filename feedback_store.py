@@ -0,0 +1,94 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from embedding_cache import content_hash
+
+FEEDBACK_DB_PATH = os.getenv("FEEDBACK_DB_PATH", "./feedback.db")
+
+def chunk_id(text: str) -> str:
+    """Feedback key for a piece of retrieved text, independent of where it is stored."""
+    return content_hash(text)
+
+def chapter_id(book_id: str, chapter: int) -> str:
+    """Feedback key for a whole chapter, so chapter-sized search hits also get credit."""
+    return f"{book_id}:chapter:{chapter}"
+
+
+class FeedbackStore:
+    """
+    Durable Q&A feedback in a local SQLite file. Besides the raw feedback rows it
+    keeps a per-chunk reward table (+1 per helpful vote, -1 per unhelpful one)
+    that is updated incrementally as feedback arrives, so re-ranking a search
+    hit is a primary-key lookup instead of a scan over all feedback.
+    """
+
+    def __init__(self, path: str = FEEDBACK_DB_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS feedback ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, question TEXT, answer TEXT, correct INTEGER,"
+            " user_feedback TEXT, chunk_ids TEXT, created REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_rewards ("
+            " chunk_id TEXT PRIMARY KEY, reward INTEGER NOT NULL DEFAULT 0, votes INTEGER NOT NULL DEFAULT 0)"
+        )
+
+    def record(self, question: str, answer: str, correct: bool, user_feedback: str, chunk_ids=()):
+        """Store one feedback entry and apply its vote to every chunk it used."""
+        chunk_ids = list(dict.fromkeys(chunk_ids))
+        delta = 1 if user_feedback == "Yes" else -1 if user_feedback == "No" else 0
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO feedback (question, answer, correct, user_feedback, chunk_ids, created)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (question, answer, int(bool(correct)), user_feedback, json.dumps(chunk_ids), time.time()),
+                )
+                if delta:
+                    self._conn.executemany(
+                        "INSERT INTO chunk_rewards (chunk_id, reward, votes) VALUES (?, ?, 1)"
+                        " ON CONFLICT(chunk_id) DO UPDATE SET reward = reward + excluded.reward, votes = votes + 1",
+                        [(chunk_id, delta) for chunk_id in chunk_ids],
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def rewards(self, chunk_ids):
+        """Return {chunk_id: reward} for the given IDs (missing IDs have reward 0)."""
+        chunk_ids = list(dict.fromkeys(chunk_ids))
+        out = {chunk_id: 0 for chunk_id in chunk_ids}
+        with self._lock:
+            for i in range(0, len(chunk_ids), 500):
+                part = chunk_ids[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                out.update(self._conn.execute(
+                    f"SELECT chunk_id, reward FROM chunk_rewards WHERE chunk_id IN ({placeholders})", part
+                ).fetchall())
+        return out
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM feedback").fetchone()[0]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_feedback_store() -> FeedbackStore:
+    """Return the process-wide feedback store, opening it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = FeedbackStore()
+    return _store
@@ -0,0 +1,108 @@
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+HTTP_CACHE_PATH = os.getenv("HTTP_CACHE_PATH", "./http_cache.db")
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "30"))
+# Connections kept open per host; should cover the crawl concurrency
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+USER_AGENT = "BookBrain/1.0 (https://github.com/babneek/BookBrain)"
+
+
+class HTTPCache:
+    """
+    Conditional-GET cache in a local SQLite file: stores each URL's last body with
+    its ETag / Last-Modified validators so a refetch costs a 304 instead of a
+    full download.
+    """
+
+    def __init__(self, path: str = HTTP_CACHE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, body TEXT NOT NULL, fetched REAL NOT NULL)"
+        )
+
+    def get(self, url: str):
+        """Return (etag, last_modified, body) for url, or None."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT etag, last_modified, body FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+
+    def put(self, url: str, etag: str, last_modified: str, body: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (url, etag, last_modified, body, fetched) VALUES (?, ?, ?, ?, ?)",
+                (url, etag, last_modified, body, time.time()),
+            )
+
+
+_session = None
+_cache = None
+_init_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    """
+    Return the process-wide HTTP session. Connections are pooled and reused
+    across requests and threads; transient failures are retried with backoff.
+    """
+    global _session
+    if _session is None:
+        with _init_lock:
+            if _session is None:
+                session = requests.Session()
+                retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                              allowed_methods=frozenset(["GET", "HEAD"]), respect_retry_after_header=True)
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers["User-Agent"] = USER_AGENT
+                _session = session
+    return _session
+
+def get_http_cache() -> HTTPCache:
+    """Return the process-wide conditional-GET cache, opening it on first use."""
+    global _cache
+    if _cache is None:
+        with _init_lock:
+            if _cache is None:
+                _cache = HTTPCache()
+    return _cache
+
+def cached_get(url: str, params: dict = None) -> str:
+    """
+    GET url through the shared session and return the body text. A cached copy
+    is revalidated with If-None-Match / If-Modified-Since and reused on 304.
+    Raises requests exceptions on failure.
+    """
+    session = get_session()
+    cache = get_http_cache()
+    if params:
+        url = requests.Request("GET", url, params=params).prepare().url
+    cached = cache.get(url)
+    headers = {}
+    if cached is not None:
+        etag, last_modified, _body = cached
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+    resp = session.get(url, headers=headers, timeout=HTTP_TIMEOUT_SECONDS)
+    if resp.status_code == 304 and cached is not None:
+        return cached[2]
+    resp.raise_for_status()
+    body = resp.text
+    etag = resp.headers.get("ETag")
+    last_modified = resp.headers.get("Last-Modified")
+    if etag or last_modified:
+        cache.put(url, etag, last_modified, body)
+    return body
@@ -0,0 +1,226 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from epub_utils import iter_chapters_from_epub
+from pdf_utils import iter_pdf_chapters
+from chroma_utils import store_chapter_embeddings
+from retrieval_index import get_index, RETRIEVAL_CHUNK_TOKENS, RETRIEVAL_CHUNK_OVERLAP
+from wikisource_utils import fetch_wikisource
+from wikipedia_utils import fetch_wikipedia
+from metrics_utils import trace, span, cache_result
+from chunking_utils import count_tokens, chunk_strings, chunker_key, CHAPTER_MAX_TOKENS, CHAPTER_PART_TOKENS
+
+# How many ingested books to keep in memory (shared by all sessions in the process)
+INGEST_CACHE_SIZE = int(os.getenv("INGEST_CACHE_SIZE", "32"))
+
+_ingest_cache = OrderedDict()
+_ingest_lock = threading.Lock()
+_key_locks = {}
+
+def file_hash(data: bytes) -> str:
+    """SHA-256 of an uploaded file's bytes; the memoization key for ingestion."""
+    return hashlib.sha256(data).hexdigest()
+
+def _memoized(key, build):
+    """
+    Return the cached ingestion result for key, building it at most once.
+    Concurrent sessions uploading the same file wait for the first build instead
+    of repeating it.
+    """
+    with _ingest_lock:
+        if key in _ingest_cache:
+            _ingest_cache.move_to_end(key)
+            cache_result("ingest", 1)
+            return _ingest_cache[key]
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        try:
+            with _ingest_lock:
+                if key in _ingest_cache:
+                    _ingest_cache.move_to_end(key)
+                    cache_result("ingest", 1)
+                    return _ingest_cache[key]
+            cache_result("ingest", 0, 1)
+            result = build()
+            with _ingest_lock:
+                _ingest_cache[key] = result
+                while len(_ingest_cache) > INGEST_CACHE_SIZE:
+                    _ingest_cache.popitem(last=False)
+            return result
+        finally:
+            # Also on failure, so a file that fails to ingest does not leak its lock
+            with _ingest_lock:
+                _key_locks.pop(key, None)
+
+def _index_and_store(book_id: str, digest: str, chapter_texts):
+    """
+    Build the book's Q&A retrieval index and store the same chunks in the vector
+    store, tagged with their chapter. Search hits and Q&A context chunks are then
+    identical texts, so feedback on an answer credits the records search returns;
+    the embeddings are computed once and shared through the embedding cache.
+    """
+    with span("ingest.build_index", chapters=len(chapter_texts)):
+        index = get_index(digest, chapter_texts)
+    with span("ingest.store_embeddings", items=len(index.chunks)):
+        store_chapter_embeddings(
+            book_id, [chunk.text for chunk in index.chunks], chapter_of=index.chunk_chapters.tolist(),
+            chunker=chunker_key(RETRIEVAL_CHUNK_TOKENS, RETRIEVAL_CHUNK_OVERLAP),
+        )
+
+def split_long_chapters(chapter_titles, chapter_texts, max_tokens=CHAPTER_MAX_TOKENS, part_tokens=CHAPTER_PART_TOKENS):
+    """
+    Split chapters longer than max_tokens into sentence-aligned parts of at most
+    part_tokens, titled 'Chapter N', 'Chapter N.1', ...
+    """
+    new_titles = []
+    new_texts = []
+    for title, text in zip(chapter_titles, chapter_texts):
+        if count_tokens(text) <= max_tokens:
+            new_titles.append(title)
+            new_texts.append(text)
+        else:
+            for j, part in enumerate(chunk_strings(text, part_tokens)):
+                new_titles.append(title if j == 0 else f"{title}.{j}")
+                new_texts.append(part)
+    return new_titles, new_texts
+
+def ingest_epub(data: bytes, file_name: str = None, on_chapter=None) -> dict:
+    """
+    Extract, split and embed an EPUB, memoized by the file's content hash.
+    Returns a dict with 'book_id', 'chapter_titles', 'chapters' and 'content_hash'.
+    Uploading the same book again is a cache hit that does no extraction or embedding.
+    on_chapter(title, text), if given, is called as each chapter is extracted.
+    """
+    digest = file_hash(data)
+
+    def build():
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".epub") as tmp:
+            tmp.write(data)
+            tmp_path = tmp.name
+        chapter_titles = []
+        chapter_texts = []
+        try:
+            with span("ingest.extract", source="epub", bytes=len(data)) as s:
+                for title, text in iter_chapters_from_epub(tmp_path):
+                    sub_titles, sub_texts = split_long_chapters([title], [text])
+                    chapter_titles.extend(sub_titles)
+                    chapter_texts.extend(sub_texts)
+                    if on_chapter is not None:
+                        on_chapter(title, text)
+                s["chapters"] = len(chapter_texts)
+                s["chars"] = sum(len(t) for t in chapter_texts)
+        finally:
+            os.remove(tmp_path)
+        if not chapter_texts:
+            chapter_titles = ["Chapter 0"]
+            chapter_texts = ["(No chapters found or could not extract text)"]
+        book_id = os.path.splitext(os.path.basename(file_name))[0] if file_name else f"epub_{digest[:12]}"
+        # Build the Q&A retrieval index once, at ingest
+        _index_and_store(book_id, digest, chapter_texts)
+        return {
+            "book_id": book_id,
+            "chapter_titles": chapter_titles,
+            "chapters": chapter_texts,
+            "content_hash": digest,
+        }
+
+    with trace("ingest.epub", file=file_name):
+        return _memoized(("epub", digest), build)
+
+def ingest_pdf(data: bytes, file_name: str = None, on_chapter=None) -> dict:
+    """
+    Extract and embed a PDF as page-range chapters, memoized by content hash.
+    Returns the same shape as ingest_epub.
+    """
+    digest = file_hash(data)
+
+    def build():
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+            tmp.write(data)
+            tmp_path = tmp.name
+        chapter_titles = []
+        chapter_texts = []
+        try:
+            with span("ingest.extract", source="pdf", bytes=len(data)) as s:
+                for chapter in iter_pdf_chapters(tmp_path):
+                    if not chapter["text"].strip():
+                        continue
+                    sub_titles, sub_texts = split_long_chapters([chapter["title"]], [chapter["text"]])
+                    chapter_titles.extend(sub_titles)
+                    chapter_texts.extend(sub_texts)
+                    if on_chapter is not None:
+                        on_chapter(chapter["title"], chapter["text"])
+                s["chapters"] = len(chapter_texts)
+                s["chars"] = sum(len(t) for t in chapter_texts)
+        finally:
+            os.remove(tmp_path)
+        if not chapter_texts:
+            chapter_titles = ["Chapter 0"]
+            chapter_texts = ["(No text could be extracted from this PDF)"]
+        book_id = os.path.splitext(os.path.basename(file_name))[0] if file_name else f"pdf_{digest[:12]}"
+        _index_and_store(book_id, digest, chapter_texts)
+        return {
+            "book_id": book_id,
+            "chapter_titles": chapter_titles,
+            "chapters": chapter_texts,
+            "content_hash": digest,
+        }
+
+    with trace("ingest.pdf", file=file_name):
+        return _memoized(("pdf", digest), build)
+
+def _ingest_web_chapters(kind: str, url: str, chapters, on_chapter=None) -> dict:
+    """Split, embed and index [(title, text)] chapters fetched from a web source; book_id is the URL."""
+    chapter_titles = []
+    chapter_texts = []
+    for title, text in chapters:
+        sub_titles, sub_texts = split_long_chapters([title], [text])
+        chapter_titles.extend(sub_titles)
+        chapter_texts.extend(sub_texts)
+        if on_chapter is not None:
+            on_chapter(title, text)
+    digest = file_hash("\0".join([url] + chapter_texts).encode("utf-8"))
+
+    def build():
+        if not chapter_texts:
+            raise ValueError(f"No text could be extracted from {url}")
+        _index_and_store(url, digest, chapter_texts)
+        return {
+            "book_id": url,
+            "chapter_titles": chapter_titles,
+            "chapters": chapter_texts,
+            "content_hash": digest,
+        }
+
+    return _memoized((kind, digest), build)
+
+def ingest_wikisource(url: str, on_chapter=None) -> dict:
+    """
+    Fetch a Wikisource work in-process (subpages become chapters), then split
+    and embed it. Returns the same shape as ingest_epub. Pages are revalidated
+    with conditional GETs, and unchanged works are memoized by content hash, so
+    re-processing a known URL does no extraction or embedding. on_chapter(title,
+    text) is called as each chapter arrives from the crawler.
+    """
+    with trace("ingest.wikisource", url=url):
+        with span("ingest.extract", source="wikisource") as s:
+            chapters = fetch_wikisource(url, on_page=on_chapter)
+            s["chapters"] = len(chapters)
+            s["chars"] = sum(len(text) for _title, text in chapters)
+        return _ingest_web_chapters("wikisource", url, chapters)
+
+def ingest_wikipedia(url: str, linked: int = 0, on_chapter=None) -> dict:
+    """
+    Fetch a Wikipedia article (one chapter per section, from the local article
+    cache when possible) plus, optionally, up to linked related articles, then
+    split and embed it. Returns the same shape as ingest_epub.
+    """
+    with trace("ingest.wikipedia", url=url):
+        with span("ingest.extract", source="wikipedia") as s:
+            chapters = fetch_wikipedia(url, linked)
+            s["chapters"] = len(chapters)
+            s["chars"] = sum(len(text) for _title, text in chapters)
+        return _ingest_web_chapters("wikipedia", url, chapters, on_chapter)
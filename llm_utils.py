@@ -1,51 +1,54 @@
 import os
+import asyncio
+import queue
+import threading
+import time
 from dotenv import load_dotenv
 import openai
+from llm_cache import get_llm_cache, LLMResponseCache
+from rate_limiter import RequestScheduler
+from chunking_utils import count_tokens
+from metrics_utils import span, cache_result, record_error
 
 load_dotenv()
 openai_api_key = os.getenv("OPENAI_API_KEY")
-# Set OpenRouter as the base URL
+LLM_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1/")
+# Set OpenRouter as the base URL. Retries are handled by the shared RequestScheduler.
 client = openai.OpenAI(
     api_key=openai_api_key,
-    base_url="https://openrouter.ai/api/v1/"
+    base_url=LLM_BASE_URL,
+    max_retries=0
+)
+# Shared async client; all async calls run on one background event loop (see run_async)
+async_client = openai.AsyncOpenAI(
+    api_key=openai_api_key,
+    base_url=LLM_BASE_URL,
+    max_retries=0
 )
 # Default model for OpenRouter (can be changed to any supported model)
 MODEL_NAME = os.getenv("OPENROUTER_MODEL", "mistralai/mistral-7b-instruct")
+# Maximum number of LLM requests in flight at once across the whole process
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+SUMMARY_PARAMS = {"temperature": 0.4, "max_tokens": 800}
+REVIEW_PARAMS = {"temperature": 0.5, "max_tokens": 1000}
+MCQ_PARAMS = {"temperature": 0.7, "max_tokens": 1500}  # Increased tokens for longer explanations
 
-def generate_summary(text: str) -> str:
-    prompt = (
+# --- PROMPTS ---
+def summary_prompt(text: str) -> str:
+    return (
         "Please provide a comprehensive, detailed, and multi-paragraph summary of the following text. The summary should cover all key points, main ideas, and important details. Write at least 3 paragraphs.\n\n"
         f"{text}\n\nLong, Detailed Summary:"
     )
-    try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.4,
-            max_tokens=800,
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        return f"[Error] Failed to generate summary: {e}"
 
-def generate_review(text: str) -> str:
-    prompt = (
+def review_prompt(text: str) -> str:
+    return (
         "Write a thorough, multi-paragraph, critical review of the following content. Discuss its strengths, weaknesses, style, and impact. The review should be long, insightful, and cover all important aspects. Write at least 3 paragraphs.\n\n"
         f"{text}\n\nLong, Detailed Review:"
     )
-    try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.5,
-            max_tokens=1000,
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        return f"[Error] Failed to generate review: {e}"
 
-def generate_mcqs(text: str, num_questions: int = 5) -> str:
-    prompt = f"""
+def mcq_prompt(text: str, num_questions: int = 5) -> str:
+    return f"""
     You are a helpful assistant designed to create quizzes.
     Based on the text provided, generate exactly {num_questions} multiple-choice questions (MCQs).
     Each question must have a question, 4 options (A, B, C, D), a correct answer, and a brief explanation.
@@ -66,13 +69,255 @@ def generate_mcqs(text: str, num_questions: int = 5) -> str:
     {text}
     ---
     """
+
+# --- ASYNC LAYER ---
+_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+_semaphore = None
+# Rate limits, priorities and retries for every request sent through async_client
+scheduler = RequestScheduler()
+
+def _get_loop():
+    """Start (once) the background event loop that owns async_client."""
+    global _loop, _loop_thread, _semaphore
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True)
+                thread.start()
+                _semaphore = asyncio.run_coroutine_threadsafe(_make_semaphore(), loop).result()
+                _loop_thread = thread
+                _loop = loop
+    return _loop
+
+async def _make_semaphore():
+    return asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+async def _scheduler_metrics():
+    return scheduler.metrics()
+
+def scheduler_metrics() -> dict:
+    """Queue depth and retry counters of the shared request scheduler."""
+    return asyncio.run_coroutine_threadsafe(_scheduler_metrics(), _get_loop()).result()
+
+def submit_async(coro):
+    """
+    Schedule a coroutine on the shared LLM event loop and return a
+    concurrent.futures.Future; cancelling it cancels the running task.
+    """
+    loop = _get_loop()
+    if threading.current_thread() is _loop_thread:
+        raise RuntimeError("run_async() and submit_async() cannot be called from the LLM event loop itself")
+    return asyncio.run_coroutine_threadsafe(coro, loop)
+
+def run_async(coro):
+    """
+    Run a coroutine on the shared LLM event loop and block until it finishes.
+    Safe to call from Streamlit's script threads and from worker threads.
+    """
+    return submit_async(coro).result()
+
+def cache_key(prompt: str, temperature: float, max_tokens: int, model: str = None) -> str:
+    return LLMResponseCache.make_key(model or MODEL_NAME, prompt, temperature, max_tokens)
+
+def cache_get(key: str):
+    """Cached response for key, or None (also on cache errors)."""
     try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=1500, # Increased tokens for longer explanations
-        )
-        return response.choices[0].message.content.strip()
+        return get_llm_cache().get(key)
     except Exception as e:
-        return f"[Error] Failed to generate MCQs: {e}" 
\ No newline at end of file
+        print(f"[LLM Cache] Error reading cache: {e}")
+        return None
+
+def cache_store(key: str, response: str, model: str = None):
+    try:
+        get_llm_cache().put(key, model or MODEL_NAME, response)
+    except Exception as e:
+        print(f"[LLM Cache] Error writing cache: {e}")
+
+async def acomplete(prompt: str, temperature: float, max_tokens: int, model: str = None, use_cache: bool = True) -> str:
+    """
+    One chat completion on the shared async client, bounded by LLM_MAX_CONCURRENCY
+    and admitted by the rate-limited, priority-ordered scheduler (which also
+    retries 429s and transient errors). Responses are cached; use_cache=False
+    skips the lookup (e.g. "Regenerate") but still stores the fresh response.
+    """
+    key = cache_key(prompt, temperature, max_tokens, model)
+    if use_cache:
+        # SQLite work runs off the event loop so it never stalls other in-flight calls
+        cached = await asyncio.to_thread(cache_get, key)
+        if cached is not None:
+            cache_result("llm", 1)
+            return cached
+        cache_result("llm", 0, 1)
+    _get_loop()
+
+    async def call():
+        async with _semaphore:
+            return await async_client.chat.completions.create(
+                model=model or MODEL_NAME,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+                max_tokens=max_tokens,
+            )
+
+    prompt_tokens = count_tokens(prompt)
+    with span("llm.complete", prompt_tokens=prompt_tokens, max_tokens=max_tokens) as s:
+        response = await scheduler.run(call, prompt_tokens + max_tokens)
+        content = response.choices[0].message.content.strip()
+        s["completion_chars"] = len(content)
+        usage = getattr(response, "usage", None)
+        if usage is not None and getattr(usage, "completion_tokens", None) is not None:
+            s["completion_tokens"] = usage.completion_tokens
+    await asyncio.to_thread(cache_store, key, content, model)
+    return content
+
+async def astream_complete(prompt: str, temperature: float, max_tokens: int, model: str = None, use_cache: bool = True):
+    """
+    Async generator yielding completion text as it arrives. A cache hit is
+    yielded in one piece; a fresh response is cached once the stream completes.
+    """
+    key = cache_key(prompt, temperature, max_tokens, model)
+    if use_cache:
+        cached = await asyncio.to_thread(cache_get, key)
+        if cached is not None:
+            cache_result("llm", 1)
+            yield cached
+            return
+        cache_result("llm", 0, 1)
+    _get_loop()
+
+    async def open_stream():
+        # The concurrency slot is held until the whole stream has been read
+        await _semaphore.acquire()
+        try:
+            return await async_client.chat.completions.create(
+                model=model or MODEL_NAME,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+            )
+        except BaseException:
+            _semaphore.release()
+            raise
+
+    prompt_tokens = count_tokens(prompt)
+    pieces = []
+    with span("llm.stream", prompt_tokens=prompt_tokens, max_tokens=max_tokens) as s:
+        start = time.perf_counter()
+        stream = await scheduler.run(open_stream, prompt_tokens + max_tokens)
+        try:
+            async for event in stream:
+                if not event.choices:
+                    continue
+                piece = event.choices[0].delta.content
+                if piece:
+                    # Drop leading whitespace so the streamed text matches the stripped cached text
+                    if not pieces:
+                        piece = piece.lstrip()
+                        if not piece:
+                            continue
+                        s["first_token_s"] = time.perf_counter() - start
+                    pieces.append(piece)
+                    yield piece
+        finally:
+            _semaphore.release()
+            s["completion_chars"] = sum(len(p) for p in pieces)
+    await asyncio.to_thread(cache_store, key, "".join(pieces).strip(), model)
+
+def iterate_async(agen):
+    """
+    Consume an async generator on the shared LLM event loop from synchronous
+    code, yielding its items as they are produced.
+    """
+    loop = _get_loop()
+    items = queue.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for item in agen:
+                items.put(item)
+        except BaseException as e:
+            items.put(e)
+        finally:
+            items.put(done)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), loop)
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        future.cancel()
+
+class GenerationError(RuntimeError):
+    """A streamed generation failed, possibly after some of its text was yielded."""
+
+
+def stream_prompt(prompt: str, params: dict, error_label: str, model: str = None, use_cache: bool = True):
+    """
+    Stream a completion synchronously. A failure raises GenerationError rather
+    than being mixed into the streamed text, which may already be partly shown.
+    """
+    try:
+        yield from iterate_async(astream_complete(prompt, model=model, use_cache=use_cache, **params))
+    except Exception as e:
+        record_error("llm.stream")
+        raise GenerationError(f"Failed to generate {error_label}: {e}") from e
+
+async def agenerate_summary(text: str, model: str = None, use_cache: bool = True) -> str:
+    try:
+        return await acomplete(summary_prompt(text), model=model, use_cache=use_cache, **SUMMARY_PARAMS)
+    except Exception as e:
+        record_error("llm.generate")
+        return f"[Error] Failed to generate summary: {e}"
+
+async def agenerate_review(text: str, model: str = None, use_cache: bool = True) -> str:
+    try:
+        return await acomplete(review_prompt(text), model=model, use_cache=use_cache, **REVIEW_PARAMS)
+    except Exception as e:
+        record_error("llm.generate")
+        return f"[Error] Failed to generate review: {e}"
+
+async def agenerate_mcqs(text: str, num_questions: int = 5, model: str = None, use_cache: bool = True) -> str:
+    try:
+        return await acomplete(mcq_prompt(text, num_questions), model=model, use_cache=use_cache, **MCQ_PARAMS)
+    except Exception as e:
+        record_error("llm.generate")
+        return f"[Error] Failed to generate MCQs: {e}"
+
+async def agenerate_chapter_artifacts(text: str, num_questions: int = 5, model: str = None, use_cache: bool = True) -> dict:
+    """Generate summary, review and MCQs for a chapter concurrently."""
+    summary, review, mcqs = await asyncio.gather(
+        agenerate_summary(text, model=model, use_cache=use_cache),
+        agenerate_review(text, model=model, use_cache=use_cache),
+        agenerate_mcqs(text, num_questions, model=model, use_cache=use_cache),
+    )
+    return {"summary": summary, "review": review, "mcqs": mcqs}
+
+# --- SYNC API (used by the Streamlit pages) ---
+def generate_summary(text: str, use_cache: bool = True) -> str:
+    return run_async(agenerate_summary(text, use_cache=use_cache))
+
+def generate_review(text: str, use_cache: bool = True) -> str:
+    return run_async(agenerate_review(text, use_cache=use_cache))
+
+def generate_mcqs(text: str, num_questions: int = 5, use_cache: bool = True) -> str:
+    return run_async(agenerate_mcqs(text, num_questions, use_cache=use_cache))
+
+# --- STREAMING API (tokens as they arrive; final text is cached like the above) ---
+def stream_summary(text: str, use_cache: bool = True):
+    return stream_prompt(summary_prompt(text), SUMMARY_PARAMS, "summary", use_cache=use_cache)
+
+def stream_review(text: str, use_cache: bool = True):
+    return stream_prompt(review_prompt(text), REVIEW_PARAMS, "review", use_cache=use_cache)
+
+def stream_mcqs(text: str, num_questions: int = 5, use_cache: bool = True):
+    return stream_prompt(mcq_prompt(text, num_questions), MCQ_PARAMS, "MCQs", use_cache=use_cache)
@@ -0,0 +1,287 @@
+import asyncio
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Set to serve /metrics (Prometheus text) and /metrics.json on this port
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_RECENT_TRACES = int(os.getenv("METRICS_RECENT_TRACES", "20"))
+# Upper bounds (seconds) of the stage duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Span attributes that are amounts of work and are summed per stage; other attributes only appear in traces
+SIZE_KEYS = frozenset(["bytes", "chars", "tokens", "prompt_tokens", "completion_tokens", "completion_chars",
+                       "chunks", "chapters", "texts", "items", "records", "requests"])
+
+_current_trace = contextvars.ContextVar("metrics_trace", default=None)
+_current_span = contextvars.ContextVar("metrics_span", default=None)
+_lock = threading.Lock()
+_stages = {}
+_counters = {}
+_recent = deque(maxlen=METRICS_RECENT_TRACES)
+_start_listeners = []
+
+
+class Trace:
+    """The spans recorded while handling one request (an ingest, a question, a page generation)."""
+
+    def __init__(self, name: str, **attrs):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.attrs = attrs
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.spans = []
+        self.error = None
+        self._recorded = False
+
+    def finish(self):
+        """Close the trace (again, if it was resumed) and make it the latest one."""
+        self.duration = time.perf_counter() - self._start
+        with _lock:
+            if not self._recorded:
+                _recent.append(self)
+                self._recorded = True
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "attrs": self.attrs,
+            "started": self.started,
+            "duration_s": self.duration,
+            "error": self.error,
+            "spans": list(self.spans),
+        }
+
+
+class _Stage:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.sizes = {}
+
+    def observe(self, duration, error, sizes):
+        self.count += 1
+        self.errors += bool(error)
+        self.total += duration
+        self.max = max(self.max, duration)
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if duration <= bound:
+                self.buckets[i] += 1
+        for key, value in sizes.items():
+            self.sizes[key] = self.sizes.get(key, 0) + value
+
+
+@contextlib.contextmanager
+def trace(name: str, **attrs):
+    """
+    Collect the spans recorded inside this block (in this thread and in LLM calls
+    it makes) as one request. The finished trace becomes last_trace().
+    """
+    t = Trace(name, **attrs)
+    if _current_trace.get() is None:
+        for callback in list(_start_listeners):
+            callback(t)
+    token = _current_trace.set(t)
+    try:
+        yield t
+    except BaseException as e:
+        t.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_trace.reset(token)
+        t.finish()
+
+@contextlib.contextmanager
+def use_trace(t: Trace):
+    """Record spans into an existing trace, e.g. while a streamed answer is consumed."""
+    token = _current_trace.set(t)
+    try:
+        yield t
+    finally:
+        _current_trace.reset(token)
+
+@contextlib.contextmanager
+def span(stage: str, **attrs):
+    """
+    Time one pipeline stage. attrs (and keys set on the yielded dict inside the
+    block) are recorded with the span; sizes (SIZE_KEYS such as chars, tokens or
+    chunks) are also summed per stage. An exception marks the span as failed.
+    """
+    attrs = dict(attrs)
+    parent = _current_span.get()
+    token = _current_span.set((stage, attrs))
+    start = time.perf_counter()
+    offset = time.time()
+    error = None
+    try:
+        yield attrs
+    except (GeneratorExit, asyncio.CancelledError):
+        # A stream the consumer stopped reading early, or a cancelled prefetch, is not a failure
+        raise
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        _current_span.reset(token)
+        if attrs.pop("error", None) and error is None:
+            error = "failed"
+        sizes = {k: v for k, v in attrs.items() if k in SIZE_KEYS and isinstance(v, (int, float))}
+        with _lock:
+            _stages.setdefault(stage, _Stage()).observe(duration, error, sizes)
+        t = _current_trace.get()
+        if t is not None:
+            t.spans.append({"stage": stage, "parent": parent[0] if parent else None, "start_s": offset - t.started,
+                            "duration_s": duration, "error": error, **attrs})
+
+def record_error(stage: str = None):
+    """
+    Count an error that was caught and reported rather than raised, and mark
+    the enclosing span as failed. stage defaults to that span's stage.
+    """
+    current = _current_span.get()
+    if current is not None:
+        current[1]["error"] = True
+    inc("errors_total", stage=stage or (current[0] if current else "unknown"))
+
+def inc(name: str, value: float = 1, **labels):
+    """Add to a counter, e.g. inc("cache_hits_total", cache="llm")."""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def cache_result(cache: str, hits: int, misses: int = 0):
+    """Count lookups in one of the caches (llm, embedding, ingest, ...)."""
+    if hits:
+        inc("cache_hits_total", hits, cache=cache)
+    if misses:
+        inc("cache_misses_total", misses, cache=cache)
+
+def on_trace_start(callback):
+    """Call callback(trace) whenever a top-level (not nested) trace starts, in the thread starting it."""
+    _start_listeners.append(callback)
+
+def get_trace(trace_id: str):
+    """The finished trace with this id, or None if it is unknown or no longer among the recent ones."""
+    with _lock:
+        return next((t for t in _recent if t.id == trace_id), None)
+
+def last_trace():
+    """The most recently finished trace, or None."""
+    with _lock:
+        return _recent[-1] if _recent else None
+
+def recent_traces():
+    with _lock:
+        return list(_recent)
+
+def metrics_json() -> dict:
+    """Per-stage aggregates, counters and recent traces as plain data."""
+    with _lock:
+        stages = {
+            name: {
+                "count": s.count,
+                "errors": s.errors,
+                "total_s": s.total,
+                "mean_s": s.total / s.count if s.count else 0.0,
+                "max_s": s.max,
+                "sizes": dict(s.sizes),
+            }
+            for name, s in sorted(_stages.items())
+        }
+        counters = [{"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(_counters.items())]
+        traces = [t.to_dict() for t in _recent]
+    return {"stages": stages, "counters": counters, "traces": traces}
+
+def _labels(pairs) -> str:
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+def prometheus_text() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = [
+        "# HELP bookbrain_stage_duration_seconds Time spent in each pipeline stage.",
+        "# TYPE bookbrain_stage_duration_seconds histogram",
+    ]
+    with _lock:
+        stages = sorted(_stages.items())
+        counters = sorted(_counters.items())
+        for name, s in stages:
+            for bound, count in zip(DURATION_BUCKETS, s.buckets):
+                lines.append(f"bookbrain_stage_duration_seconds_bucket{_labels([('stage', name), ('le', bound)])} {count}")
+            lines.append(f"bookbrain_stage_duration_seconds_bucket{_labels([('stage', name), ('le', '+Inf')])} {s.count}")
+            lines.append(f"bookbrain_stage_duration_seconds_sum{_labels([('stage', name)])} {s.total}")
+            lines.append(f"bookbrain_stage_duration_seconds_count{_labels([('stage', name)])} {s.count}")
+        lines += ["# HELP bookbrain_stage_errors_total Failed calls per pipeline stage.",
+                  "# TYPE bookbrain_stage_errors_total counter"]
+        lines += [f"bookbrain_stage_errors_total{_labels([('stage', name)])} {s.errors}" for name, s in stages]
+        lines += ["# HELP bookbrain_stage_size_total Sizes processed per stage (chars, tokens, chunks, ...).",
+                  "# TYPE bookbrain_stage_size_total counter"]
+        for name, s in stages:
+            for key, value in sorted(s.sizes.items()):
+                lines.append(f"bookbrain_stage_size_total{_labels([('stage', name), ('unit', key)])} {value}")
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE bookbrain_{name} counter")
+                typed.add(name)
+            lines.append(f"bookbrain_{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+def reset():
+    """Drop all recorded metrics and traces."""
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+        _recent.clear()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = prometheus_text().encode("utf-8"), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = json.dumps(metrics_json()).encode("utf-8"), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+_server = None
+
+def start_metrics_server(port: int = METRICS_PORT):
+    """Serve /metrics and /metrics.json from a background thread (once per process). No-op if port is 0."""
+    global _server
+    if not port or _server is not None:
+        return _server
+    with _lock:
+        if _server is None:
+            try:
+                server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            except OSError as e:
+                print(f"[Metrics] Could not start metrics server on port {port}: {e}")
+                return None
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+            _server = server
+    return _server
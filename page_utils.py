@@ -0,0 +1,86 @@
+"""
+Shared flow of the generated-artifact pages (Summary, Review, MCQ). A page
+shows, in order: the newest stored artifact of the selected chapter (from
+batch_pipeline or an earlier visit), the one prefetched in the background when
+the chapter was selected, or a fresh generation streamed through render_stream.
+Prefetched, generated and regenerated artifacts are stored with save_artifact,
+so the next visit shows the latest one. A generation that fails is reported and
+its partial text is dropped, so the next visit tries again; a failed
+regeneration leaves the previous content in place.
+"""
+import contextlib
+
+import streamlit as st
+from chroma_utils import get_latest_content, store_content_version
+from embedding_cache import content_hash
+from llm_utils import GenerationError
+from metrics_utils import trace
+from prefetch_utils import get_prefetched
+
+
+def stored_artifact(content_type: str, text: str):
+    """
+    The newest stored summary/review/mcqs of the selected chapter (e.g. written by
+    batch_pipeline), or None. Artifacts generated from a different text are ignored.
+    """
+    book_id = st.session_state.get("book_id")
+    if not book_id:
+        return None
+    stored = get_latest_content(book_id, content_type, st.session_state.get("selected_chapter_idx", 0))
+    if stored is None:
+        return None
+    source = stored["metadata"].get("source_hash")
+    if source is not None and source != content_hash(text):
+        return None
+    return stored["content"]
+
+
+def save_artifact(content_type: str, text: str, content: str):
+    """Store content as the newest version of the selected chapter's artifact (no-op outside an ingested book)."""
+    book_id = st.session_state.get("book_id")
+    if book_id:
+        store_content_version(book_id, content, content_type, chapter=st.session_state.get("selected_chapter_idx", 0),
+                              source_hash=content_hash(text))
+
+
+def ready_artifact(content_type: str, text: str, label: str):
+    """
+    The stored or prefetched summary/review/mcqs of the selected chapter, or None.
+    Waiting for a background generation that is still running shows a spinner.
+    """
+    stored = stored_artifact(content_type, text)
+    if stored is not None:
+        return stored
+    # st.spinner only appears if the wait lasts more than half a second
+    with st.spinner(f"Finishing the {label} started in the background..."):
+        prefetched = get_prefetched(content_type, text)
+    if prefetched is not None:
+        save_artifact(content_type, text, prefetched)
+    return prefetched
+
+
+def render_stream(stream, trace_name: str = None):
+    """
+    Show generated text as it arrives, then clear it so the page renders the
+    final version. Returns (text, error): error is None on success, otherwise
+    the failure message, and text is whatever arrived before the failure.
+    """
+    pieces = []
+
+    def collect():
+        for piece in stream:
+            pieces.append(piece)
+            yield piece
+
+    placeholder = st.empty()
+    error = None
+    with trace(trace_name) if trace_name else contextlib.nullcontext() as t:
+        with placeholder.container():
+            try:
+                st.write_stream(collect())
+            except GenerationError as e:
+                error = str(e)
+                if t is not None:
+                    t.error = error
+    placeholder.empty()
+    return "".join(pieces), error
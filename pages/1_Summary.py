@@ -1,6 +1,7 @@
 import streamlit as st
-from llm_utils import generate_summary
+from summarize_utils import stream_summarize
 from sidebar_utils import show_sidebar
+from page_utils import render_stream, ready_artifact, save_artifact
 
 def show_logo_and_branding():
     st.markdown(
@@ -23,7 +24,14 @@ def main():
         return
     text = st.session_state["extracted_text"]
     if "summary" not in st.session_state:
-        st.session_state["summary"] = generate_summary(text)
+        summary = ready_artifact("summary", text, "summary")
+        if summary is None:
+            summary, error = render_stream(stream_summarize(text), "page.summary")
+            if error:
+                st.error(error)
+                return
+            save_artifact("summary", text, summary)
+        st.session_state["summary"] = summary
     if "edit_mode" not in st.session_state:
         st.session_state["edit_mode"] = False
     st.markdown("""
@@ -38,8 +46,12 @@ def main():
                 st.session_state["edit_mode"] = True
         with col2:
             if st.button("🔄 Regenerate Summary", key="regen_btn"):
-                with st.spinner("Regenerating summary..."):
-                    st.session_state["summary"] = generate_summary(text)
+                summary, error = render_stream(stream_summarize(text, use_cache=False), "page.summary")
+                if error:
+                    st.error(error)
+                else:
+                    save_artifact("summary", text, summary)
+                    st.session_state["summary"] = summary
                     st.rerun()
         with col3:
             st.download_button("⬇️ Download Summary", st.session_state["summary"], file_name="summary.txt")
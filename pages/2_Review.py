@@ -1,6 +1,7 @@
 import streamlit as st
-from llm_utils import generate_review
+from llm_utils import stream_review
 from sidebar_utils import show_sidebar
+from page_utils import render_stream, ready_artifact, save_artifact
 
 def show_logo_and_branding():
     st.markdown(
@@ -23,7 +24,14 @@ def main():
         return
     text = st.session_state["extracted_text"]
     if "review" not in st.session_state:
-        st.session_state["review"] = generate_review(text)
+        review = ready_artifact("review", text, "review")
+        if review is None:
+            review, error = render_stream(stream_review(text), "page.review")
+            if error:
+                st.error(error)
+                return
+            save_artifact("review", text, review)
+        st.session_state["review"] = review
     if "edit_mode" not in st.session_state:
         st.session_state["edit_mode"] = False
     st.markdown("""
@@ -38,8 +46,12 @@ def main():
                 st.session_state["edit_mode"] = True
         with col2:
             if st.button("🔄 Regenerate Review", key="regen_btn"):
-                with st.spinner("Regenerating review..."):
-                    st.session_state["review"] = generate_review(text)
+                review, error = render_stream(stream_review(text, use_cache=False), "page.review")
+                if error:
+                    st.error(error)
+                else:
+                    save_artifact("review", text, review)
+                    st.session_state["review"] = review
                     st.rerun()
         with col3:
             st.download_button("⬇️ Download Review", st.session_state["review"], file_name="review.txt")
@@ -1,17 +1,24 @@
 import streamlit as st
 from llm_utils import generate_mcqs
+from prefetch_utils import PREFETCH_MCQ_QUESTIONS
 from sidebar_utils import show_sidebar
+from page_utils import ready_artifact, save_artifact
+from metrics_utils import trace
 import re
 
-def try_generate_mcqs(text, n=5, max_retries=2):
-    """Attempt to generate and parse MCQs, retrying on failure."""
-    for _ in range(max_retries):
-        mcq_text = generate_mcqs(text, n)
-        if mcq_text and not mcq_text.startswith("[Error]"):
+def try_generate_mcqs(text, n=5, max_retries=2, use_cache=True):
+    """Attempt to generate and parse MCQs, retrying when the output cannot be parsed."""
+    with trace("page.mcq", questions=n):
+        for attempt in range(max_retries):
+            # A cached response that failed to parse would fail again, so retries bypass the cache
+            mcq_text = generate_mcqs(text, n, use_cache=use_cache and attempt == 0)
+            if not mcq_text or mcq_text.startswith("[Error]"):
+                # Rate limits and transient errors were already retried with backoff by the scheduler
+                break
             parsed = parse_mcqs(mcq_text)
             if parsed:
                 return mcq_text, parsed
-    return "Could not generate valid MCQs.", []
+        return "Could not generate valid MCQs.", []
 
 def show_logo_and_branding():
     """Displays the app logo and branding in the main content area."""
@@ -141,7 +148,12 @@ def main():
     
     if "parsed_mcqs" not in st.session_state:
         with st.spinner("Generating MCQs for you..."):
-            mcq_text, parsed_mcqs = try_generate_mcqs(text)
+            mcq_text = ready_artifact("mcqs", text, "MCQs")
+            parsed_mcqs = parse_mcqs(mcq_text) if mcq_text else []
+            if not parsed_mcqs:
+                mcq_text, parsed_mcqs = try_generate_mcqs(text, n=PREFETCH_MCQ_QUESTIONS)
+                if parsed_mcqs:
+                    save_artifact("mcqs", text, mcq_text)
             st.session_state.mcqs = mcq_text
             st.session_state.parsed_mcqs = parsed_mcqs
     
@@ -161,7 +173,9 @@ def main():
     with col1:
         if st.button("🔄 Regenerate MCQs", key="regenerate_mcqs_btn"):
             with st.spinner("Getting a fresh set of questions..."):
-                mcq_text, parsed_mcqs = try_generate_mcqs(text)
+                mcq_text, parsed_mcqs = try_generate_mcqs(text, n=PREFETCH_MCQ_QUESTIONS, use_cache=False)
+                if parsed_mcqs:
+                    save_artifact("mcqs", text, mcq_text)
                 st.session_state.mcqs = mcq_text
                 st.session_state.parsed_mcqs = parsed_mcqs
                 for k in list(st.session_state.keys()):
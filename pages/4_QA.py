@@ -1,6 +1,7 @@
 import streamlit as st
-from pipeline import answer_question, store_feedback
+from pipeline import stream_answer_question, store_feedback
 from sidebar_utils import show_sidebar
+from page_utils import render_stream
 
 def show_logo_and_branding():
     st.markdown(
@@ -29,11 +30,12 @@ def main():
     if user_q and st.button("Get Answer", key="qa_btn"):
         with st.spinner("Answering..."):
             try:
-                result = answer_question(user_q)
-                answer = result["answer"]
+                result = stream_answer_question(user_q)
                 context_chunks = result["context_chunks"]
-                if answer.startswith("[Error]"):
-                    st.error(answer)
+                # Render tokens as they arrive; the final answer is shown below once complete
+                answer, error = render_stream(result["stream"])
+                if error or answer.startswith("[Error]"):
+                    st.error(error or answer)
                 else:
                     st.session_state["last_answer"] = answer
                     st.session_state["last_question"] = user_q
@@ -52,7 +54,12 @@ def main():
         col1, col2 = st.columns([1,1])
         with col1:
             if st.button("👍 Helpful", key="fb_yes"):
-                store_feedback(st.session_state["last_question"], st.session_state["last_answer"], True, "Yes")
+                store_feedback(
+                    st.session_state["last_question"], st.session_state["last_answer"], True, "Yes",
+                    context_chunks=st.session_state.get("last_context_chunks", []),
+                    book_id=st.session_state.get("book_id"),
+                    chapter=st.session_state.get("selected_chapter_idx", 0),
+                )
                 st.success("Thank you for your feedback!")
                 del st.session_state["last_answer"]
                 del st.session_state["last_question"]
@@ -60,7 +67,12 @@ def main():
                     del st.session_state["last_context_chunks"]
         with col2:
             if st.button("👎 Not Helpful", key="fb_no"):
-                store_feedback(st.session_state["last_question"], st.session_state["last_answer"], False, "No")
+                store_feedback(
+                    st.session_state["last_question"], st.session_state["last_answer"], False, "No",
+                    context_chunks=st.session_state.get("last_context_chunks", []),
+                    book_id=st.session_state.get("book_id"),
+                    chapter=st.session_state.get("selected_chapter_idx", 0),
+                )
                 st.success("Thank you for your feedback!")
                 del st.session_state["last_answer"]
                 del st.session_state["last_question"]
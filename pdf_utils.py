@@ -0,0 +1,106 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from PyPDF2 import PdfReader
+
+# Worker processes for page text extraction (0 = one per CPU core)
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "0")) or os.cpu_count() or 1
+# Pages handed to a worker per task; each task re-opens the PDF, so keep this coarse
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+# Chapter size when the PDF has no outline
+PDF_PAGES_PER_CHAPTER = int(os.getenv("PDF_PAGES_PER_CHAPTER", "10"))
+
+def _extract_page_range(args):
+    """Extract the text of pages [start, end) from a PDF. Runs in worker processes."""
+    pdf_path, start, end = args
+    reader = PdfReader(pdf_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+def _outline_ranges(reader, num_pages):
+    """
+    (title, start_page, end_page) for each top-level outline entry, or [] if the
+    PDF has no usable outline. Pages before the first entry become 'Front matter'.
+    """
+    try:
+        outline = reader.outline
+    except Exception:
+        return []
+    starts = []
+    for entry in outline or []:
+        if isinstance(entry, list):
+            continue  # nested entries belong to the previous top-level chapter
+        try:
+            page = reader.get_destination_page_number(entry)
+        except Exception:
+            continue
+        if page is None or not 0 <= page < num_pages:
+            continue
+        title = str(getattr(entry, "title", "") or f"Page {page + 1}").strip()
+        starts.append((page, title))
+    starts.sort(key=lambda s: s[0])
+    ranges = []
+    for page, title in starts:
+        if ranges and ranges[-1][1] == page:
+            continue  # several entries on one page: keep the first
+        ranges.append((title, page))
+    if not ranges:
+        return []
+    if ranges[0][1] > 0:
+        ranges.insert(0, ("Front matter", 0))
+    return [
+        (title, start, ranges[i + 1][1] if i + 1 < len(ranges) else num_pages)
+        for i, (title, start) in enumerate(ranges)
+    ]
+
+def _page_window_ranges(num_pages, pages_per_chapter):
+    return [
+        (f"Pages {start + 1}-{min(start + pages_per_chapter, num_pages)}", start,
+         min(start + pages_per_chapter, num_pages))
+        for start in range(0, num_pages, pages_per_chapter)
+    ]
+
+def iter_pdf_chapters(pdf_path, max_workers: int = None):
+    """
+    Yield a dict per page-range "chapter" (title, start_page, end_page, text)
+    in document order, as soon as its pages have been extracted.
+    Chapters follow the PDF outline when there is one, otherwise fixed page
+    windows. Pages are extracted in parallel across worker processes and joined
+    once per chapter, so the total cost is linear in the document size.
+    """
+    reader = PdfReader(pdf_path)
+    num_pages = len(reader.pages)
+    if num_pages == 0:
+        return
+    ranges = _outline_ranges(reader, num_pages) or _page_window_ranges(num_pages, PDF_PAGES_PER_CHAPTER)
+    tasks = [
+        (pdf_path, start, min(start + PDF_PAGES_PER_TASK, num_pages))
+        for start in range(0, num_pages, PDF_PAGES_PER_TASK)
+    ]
+    workers = min(max_workers or PDF_WORKERS, len(tasks))
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        page_batches = executor.map(_extract_page_range, tasks) if executor else map(_extract_page_range, tasks)
+        chapter_iter = iter(ranges)
+        title, start, end = next(chapter_iter)
+        pages = []
+        page_no = 0
+        for batch in page_batches:
+            for page_text in batch:
+                pages.append(page_text)
+                page_no += 1
+                if page_no == end:
+                    text = "\n".join(pages)
+                    yield {
+                        "title": title,
+                        "start_page": start,
+                        "end_page": end,
+                        "text": text,
+                    }
+                    pages = []
+                    title, start, end = next(chapter_iter, (None, None, None))
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def extract_text_from_pdf(pdf_path) -> str:
+    """Full text of a PDF, pages joined by newlines."""
+    return "\n".join(chapter["text"] for chapter in iter_pdf_chapters(pdf_path))
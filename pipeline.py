@@ -1,92 +1,162 @@
-from chroma_utils import store_chapter_embeddings, semantic_search, retrieve_content_versions
-from llm_utils import generate_summary, generate_review, generate_mcqs, client, MODEL_NAME
-from epub_utils import extract_chapters_from_epub
+from chroma_utils import semantic_search
+from llm_utils import run_async, agenerate_chapter_artifacts, acomplete, astream_complete, iterate_async, GenerationError
+from embedding_cache import content_hash
+from retrieval_index import get_index
+from feedback_store import get_feedback_store, chunk_id, chapter_id
+from metrics_utils import trace, use_trace, span, record_error
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def chunk_text(text, chunk_size=12000):
-    # Split text into chunks of max chunk_size characters
-    return [text[i:i+chunk_size] for i in range(0, len(text), chunk_size) if text[i:i+chunk_size].strip()]
-
 # --- Q&A PIPELINE ---
+QA_PARAMS = {"temperature": 0.3, "max_tokens": 600}
+# Retrieved chunks considered per question, and the token budget for the context they fill
+QA_TOP_K = int(os.getenv("QA_TOP_K", "6"))
+QA_CONTEXT_TOKENS = int(os.getenv("QA_CONTEXT_TOKENS", "1500"))
+NO_ANSWER_MARKERS = ["no information", "not found", "no details", "no context"]
+
+def _current_source():
+    """
+    The selected chapter's text plus what is needed to find its book's retrieval
+    index: (text, index_key, chapters, chapter_idx).
+    """
+    import streamlit as st
+    # Use the selected chapter from session state
+    text = None
+    if hasattr(st.session_state, 'extracted_text'):
+        text = st.session_state["extracted_text"]
+    if not text:
+        return None, None, None, None
+    chapters = st.session_state.get("chapters")
+    index_key = st.session_state.get("ingested_hash")
+    chapter_idx = st.session_state.get("selected_chapter_idx", 0)
+    if chapters and index_key and 0 <= chapter_idx < len(chapters) and chapters[chapter_idx] == text:
+        return text, index_key, chapters, chapter_idx
+    # Text that is not part of an ingested book: index just this text
+    return text, content_hash(text), [text], 0
+
+def build_qa_context(query: str, text: str, index_key: str = None, chapters=None, chapter: int = None):
+    """
+    Retrieve the most relevant small chunks of the chapter from the book's hybrid
+    BM25 + vector index and build the answer prompt. Returns (prompt, context_chunks).
+    """
+    if chapters is None:
+        chapters, chapter = [text], 0
+    with span("qa.index", chapters=len(chapters)):
+        index = get_index(index_key or content_hash(text), chapters)
+    context_chunks = []
+    used = 0
+    with span("qa.retrieve", top_k=QA_TOP_K) as s:
+        for chunk, _score in index.search(query, top_k=QA_TOP_K, chapter=chapter):
+            if context_chunks and used + chunk.tokens > QA_CONTEXT_TOKENS:
+                break
+            context_chunks.append(chunk.text)
+            used += chunk.tokens
+        s["chunks"] = len(context_chunks)
+        s["tokens"] = used
+    context = "\n\n".join(context_chunks)
+    prompt = f"Use the following context to answer the question in detail.\n\nContext:\n{context}\n\nQuestion: {query}\nAnswer:"
+    return prompt, context_chunks
+
+def _no_answer_fallback(answer: str, context_chunks) -> str:
+    # Fallback: if answer says 'no information' or 'not found', show most relevant passage
+    if any(x in answer.lower() for x in NO_ANSWER_MARKERS):
+        return "\n\nMost relevant passage:\n" + (context_chunks[0] if context_chunks else "[No context found]")
+    return ""
+
 def answer_question(query: str, model: str = None) -> dict:
     """
     Answers a user question using semantic search for context and OpenRouter LLM.
     Returns a dict with 'answer' and 'context_chunks'.
     """
-    try:
-        import streamlit as st
-        # Use the selected chapter from session state, chunk it, and run semantic search over chunks
-        text = None
-        if hasattr(st.session_state, 'extracted_text'):
-            text = st.session_state["extracted_text"]
-        if not text:
-            return {"answer": "[Error] No chapter text found for Q/A.", "context_chunks": []}
-        chunks = chunk_text(text, chunk_size=12000)
-        # Use a simple embedding search over chunks
-        from sentence_transformers import SentenceTransformer
-        embedder = SentenceTransformer("all-MiniLM-L6-v2")
-        query_emb = embedder.encode([query]).tolist()[0]
-        # Compute similarity for each chunk
-        import numpy as np
-        chunk_embs = embedder.encode(chunks)
-        sims = [np.dot(query_emb, chunk_emb) for chunk_emb in chunk_embs]
-        # Get top 2 most relevant chunks
-        top_indices = np.argsort(sims)[-2:][::-1]
-        context_chunks = [chunks[i] for i in top_indices]
-        # Hard cap on context length
-        context = "\n\n".join(context_chunks)
-        if len(context) > 24000:
-            context = context[:24000]
-        prompt = f"Use the following context to answer the question in detail.\n\nContext:\n{context}\n\nQuestion: {query}\nAnswer:"
-        response = client.chat.completions.create(
-            model=model or MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3,
-            max_tokens=600,
-        )
-        answer = response.choices[0].message.content.strip()
-        # Fallback: if answer says 'no information' or 'not found', show most relevant passage
-        if any(x in answer.lower() for x in ["no information", "not found", "no details", "no context"]):
-            answer += "\n\nMost relevant passage:\n" + (context_chunks[0] if context_chunks else "[No context found]")
-        return {"answer": answer, "context_chunks": context_chunks}
-    except Exception as e:
-        return {"answer": f"[Error] Failed to answer question: {e}", "context_chunks": []}
+    with trace("qa.answer", chars=len(query)):
+        try:
+            text, index_key, chapters, chapter = _current_source()
+            if not text:
+                return {"answer": "[Error] No chapter text found for Q/A.", "context_chunks": []}
+            prompt, context_chunks = build_qa_context(query, text, index_key, chapters, chapter)
+            answer = run_async(acomplete(prompt, model=model, **QA_PARAMS))
+            answer += _no_answer_fallback(answer, context_chunks)
+            return {"answer": answer, "context_chunks": context_chunks}
+        except Exception as e:
+            record_error("qa.answer")
+            return {"answer": f"[Error] Failed to answer question: {e}", "context_chunks": []}
 
-# --- FEEDBACK STORE (in-memory for demo) ---
-feedback_store = []
-def store_feedback(question, answer, correct, user_feedback):
+def stream_answer_question(query: str, model: str = None) -> dict:
     """
-    Stores user feedback on Q&A results (in-memory for demo purposes).
+    Streaming variant of answer_question. Returns a dict with 'stream' (a
+    generator of answer text pieces) and 'context_chunks'. The completed answer
+    is cached like answer_question's. If the answer cannot be started the stream
+    is a single '[Error] ...' message; a failure mid-stream raises GenerationError.
     """
-    feedback_store.append({
-        "question": question,
-        "answer": answer,
-        "correct": correct,
-        "user_feedback": user_feedback
-    })
+    with trace("qa.answer", chars=len(query), streamed=True) as qa_trace:
+        try:
+            text, index_key, chapters, chapter = _current_source()
+            if not text:
+                return {"stream": iter(["[Error] No chapter text found for Q/A."]), "context_chunks": []}
+            prompt, context_chunks = build_qa_context(query, text, index_key, chapters, chapter)
+        except Exception as e:
+            record_error("qa.answer")
+            return {"stream": iter([f"[Error] Failed to answer question: {e}"]), "context_chunks": []}
+
+    async def traced_stream():
+        # The LLM stream is read after this function returns; keep its spans in the same trace
+        with use_trace(qa_trace):
+            async for piece in astream_complete(prompt, model=model, **QA_PARAMS):
+                yield piece
+
+    def stream():
+        pieces = []
+        try:
+            for piece in iterate_async(traced_stream()):
+                pieces.append(piece)
+                yield piece
+        except Exception as e:
+            record_error("qa.answer")
+            raise GenerationError(f"Failed to answer question: {e}") from e
+        finally:
+            qa_trace.finish()
+        tail = _no_answer_fallback("".join(pieces), context_chunks)
+        if tail:
+            yield tail
+
+    return {"stream": stream(), "context_chunks": context_chunks}
+
+# --- FEEDBACK STORE ---
+def store_feedback(question, answer, correct, user_feedback, context_chunks=(), book_id=None, chapter=None):
+    """
+    Stores user feedback on Q&A results and credits the chunks (and chapter) the
+    answer was built from.
+    """
+    chunk_ids = [chunk_id(chunk) for chunk in context_chunks]
+    if book_id is not None and chapter is not None:
+        chunk_ids.append(chapter_id(book_id, chapter))
+    try:
+        get_feedback_store().record(question, answer, correct, user_feedback, chunk_ids)
+    except Exception as e:
+        print(f"[Feedback] Error storing feedback: {e}")
 
 # --- RL-INSPIRED SEARCH ---
-def rl_semantic_search(query: str, top_k: int = 3):
+def rl_semantic_search(query: str, top_k: int = 3, book_id: str = None):
     """
-    RL-inspired semantic search: boosts content with positive feedback for similar questions.
-    Returns top_k results, ranked by embedding similarity and feedback reward.
+    RL-inspired semantic search: boosts content that earned positive Q&A feedback.
+    Returns top_k results, ranked by feedback reward and then embedding similarity.
     """
     try:
-        hits = semantic_search(query, top_k=10)  # Get more candidates
-        # Assign a reward score based on feedback_store
-        def feedback_reward(hit_text):
-            reward = 0
-            for fb in feedback_store:
-                if fb["user_feedback"] == "Yes" and fb["answer"] in hit_text:
-                    reward += 1
-                elif fb["user_feedback"] == "No" and fb["answer"] in hit_text:
-                    reward -= 1
-            return reward
+        hits = semantic_search(query, top_k=10, book_id=book_id)  # Get more candidates
+        keys = []
+        for hit in hits:
+            meta = hit.get("meta") or {}
+            hit_keys = [chunk_id(hit["text"])]
+            if meta.get("book_id") is not None and meta.get("chapter") is not None:
+                hit_keys.append(chapter_id(meta["book_id"], meta["chapter"]))
+            keys.append(hit_keys)
+        # One indexed lookup for all candidates instead of a scan over every feedback entry
+        rewards = get_feedback_store().rewards([k for hit_keys in keys for k in hit_keys])
+        reward_of = {id(hit): sum(rewards[k] for k in hit_keys) for hit, hit_keys in zip(hits, keys)}
         # Sort by reward, then by original order (embedding similarity)
-        hits.sort(key=lambda h: (feedback_reward(h["text"]),), reverse=True)
+        hits.sort(key=lambda h: reward_of[id(h)], reverse=True)
         return hits[:top_k]
     except Exception as e:
         print(f"[RL Search] Error: {e}")
@@ -96,13 +166,8 @@ def rl_semantic_search(query: str, top_k: int = 3):
 def process_chapter(text: str, model: str = None):
     """
     Runs the full pipeline for a chapter: summary, review, MCQs.
+    The three generations run concurrently, so wall time is that of the slowest.
     Returns a dict with all outputs.
     """
-    summary = generate_summary(text)
-    review = generate_review(text)
-    mcqs = generate_mcqs(text, 5)
-    return {
-        "summary": summary,
-        "review": review,
-        "mcqs": mcqs
-    } 
\ No newline at end of file
+    with trace("chapter.artifacts", chars=len(text)):
+        return run_async(agenerate_chapter_artifacts(text, 5, model=model)) 
\ No newline at end of file
@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+from embedding_cache import content_hash
+from llm_utils import agenerate_review, agenerate_mcqs, submit_async
+from summarize_utils import asummarize
+from rate_limiter import llm_priority, PRIORITY_PREFETCH
+from metrics_utils import span, cache_result
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+# Background generations running at once (each may still fan out into several LLM calls)
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "2"))
+# Chapters after the selected one whose artifacts are prefetched too
+PREFETCH_NEXT_CHAPTERS = int(os.getenv("PREFETCH_NEXT_CHAPTERS", "1"))
+# Finished artifacts kept in memory for the pages to pick up (least recently used dropped first)
+PREFETCH_MAX_RESULTS = int(os.getenv("PREFETCH_MAX_RESULTS", "64"))
+# Owners (sessions) that have not requested anything for this long are forgotten, cancelling their jobs
+PREFETCH_OWNER_TTL_SECONDS = float(os.getenv("PREFETCH_OWNER_TTL_SECONDS", "1800"))
+# Must match the MCQ page's question count so the prefetched set is the one it would request
+PREFETCH_MCQ_QUESTIONS = 5
+
+# Generated in this order for each chapter
+ARTIFACTS = {
+    "summary": lambda text: asummarize(text),
+    "mcqs": lambda text: agenerate_mcqs(text, PREFETCH_MCQ_QUESTIONS),
+    "review": lambda text: agenerate_review(text),
+}
+
+
+class _Job:
+    def __init__(self, kind: str, text: str):
+        self.kind = kind
+        self.text = text
+        self.future = None     # position in the thread pool
+        self.task = None       # the LLM coroutine, once started
+        self.cancelled = False
+
+
+class PrefetchScheduler:
+    """
+    Generates chapter artifacts (summary, MCQs, review) in the background before
+    a page asks for them. Jobs run on a bounded thread pool at prefetch priority,
+    so interactive LLM calls are admitted first. Each owner (a Streamlit session)
+    says which chapters it wants; jobs nobody wants any more are cancelled,
+    including in-flight LLM calls. Finished results are kept in a bounded store
+    shared by all sessions and keyed by artifact and text hash. Streamlit has no
+    session-end hook, so owners that stop making requests expire after owner_ttl
+    seconds, as if they had called release().
+    """
+
+    def __init__(self, workers: int = PREFETCH_WORKERS, max_results: int = PREFETCH_MAX_RESULTS,
+                 owner_ttl: float = PREFETCH_OWNER_TTL_SECONDS):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="prefetch")
+        self.max_results = max(1, max_results)
+        self.owner_ttl = owner_ttl
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._results = OrderedDict()
+        self._wanted = {}
+        self._last_seen = {}
+
+    def request(self, owner: str, texts):
+        """Prefetch every artifact of texts (most important first) for owner, replacing its previous request."""
+        keys = [((kind, content_hash(text)), kind, text) for text in texts for kind in ARTIFACTS]
+        now = time.monotonic()
+        with self._lock:
+            previous = set(self._wanted.get(owner, ()))
+            for expired in [o for o, seen in self._last_seen.items() if o != owner and now - seen > self.owner_ttl]:
+                previous |= self._wanted.pop(expired, set())
+                del self._last_seen[expired]
+            self._wanted[owner] = {key for key, _kind, _text in keys}
+            self._last_seen[owner] = now
+            still_wanted = set().union(*self._wanted.values())
+            for key in previous - still_wanted:
+                self._cancel(key)
+            for key, kind, text in keys:
+                if key in self._results or key in self._jobs:
+                    continue
+                job = _Job(kind, text)
+                self._jobs[key] = job
+                job.future = self._executor.submit(self._run, key, job)
+
+    def release(self, owner: str):
+        """Forget owner's request, cancelling jobs no other owner wants."""
+        self.request(owner, [])
+        with self._lock:
+            self._wanted.pop(owner, None)
+            self._last_seen.pop(owner, None)
+
+    def _cancel(self, key):
+        job = self._jobs.pop(key, None)
+        if job is None:
+            return
+        job.cancelled = True
+        job.future.cancel()
+        if job.task is not None:
+            job.task.cancel()
+
+    def _run(self, key, job: _Job):
+        result = None
+        try:
+            with llm_priority(PRIORITY_PREFETCH), span(f"prefetch.{job.kind}", chars=len(job.text)) as s:
+                with self._lock:
+                    if job.cancelled:
+                        return
+                    job.task = submit_async(ARTIFACTS[job.kind](job.text))
+                try:
+                    result = job.task.result()
+                except CancelledError:
+                    s["cancelled"] = True
+        except Exception as e:
+            print(f"[Prefetch] Error generating {job.kind}: {e}")
+        finally:
+            with self._lock:
+                if self._jobs.get(key) is job:
+                    del self._jobs[key]
+                # Failed generations are not kept, so the page retries interactively
+                if result and not job.cancelled and not result.startswith("[Error]"):
+                    self._results[key] = result
+                    self._results.move_to_end(key)
+                    while len(self._results) > self.max_results:
+                        self._results.popitem(last=False)
+
+    def get(self, kind: str, text: str, wait: bool = True):
+        """
+        The prefetched artifact for text, or None. With wait, blocks on a job that
+        is already generating it. A job still queued is cancelled, since the
+        caller is about to generate the artifact itself rather than wait its turn.
+        """
+        key = (kind, content_hash(text))
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.task is None:
+                self._cancel(key)
+                job = None
+        if job is not None and wait:
+            try:
+                job.future.result()
+            except CancelledError:
+                pass
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+        cache_result("prefetch", int(result is not None), int(result is None))
+        return result
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_prefetch_scheduler() -> PrefetchScheduler:
+    """Return the process-wide PrefetchScheduler, creating it on first use."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = PrefetchScheduler()
+    return _scheduler
+
+def prefetch_chapters(owner: str, chapters, selected: int, next_chapters: int = PREFETCH_NEXT_CHAPTERS):
+    """Prefetch artifacts of the selected chapter and the next_chapters after it; no-op if disabled."""
+    if not PREFETCH_ENABLED:
+        return
+    texts = [t for t in chapters[selected:selected + 1 + max(0, next_chapters)] if t and t.strip()]
+    get_prefetch_scheduler().request(owner, texts)
+
+def get_prefetched(kind: str, text: str):
+    """The prefetched summary/review/mcqs for text (waiting for one in progress), or None."""
+    if not PREFETCH_ENABLED:
+        return None
+    return get_prefetch_scheduler().get(kind, text)
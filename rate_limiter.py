@@ -0,0 +1,207 @@
+import asyncio
+import contextlib
+import contextvars
+import email.utils
+import heapq
+import itertools
+import os
+import random
+import time
+
+# Client-side limits for the LLM provider (OpenRouter) shared by the whole process
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "200000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "1.0"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "60"))
+
+# Lower value = served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREFETCH = 5
+PRIORITY_BATCH = 10
+
+_priority = contextvars.ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+@contextlib.contextmanager
+def llm_priority(priority: int):
+    """Run LLM calls made inside this block (in this thread/task) at the given priority."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+class TokenBucket:
+    """Classic token bucket: holds up to capacity units, refilled continuously."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = max(1.0, per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount units are available (0 if they are now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+
+class RequestScheduler:
+    """
+    Admits LLM requests under requests-per-minute and tokens-per-minute token
+    buckets, strictly in priority order (interactive before batch, FIFO within a
+    priority). Must be used from a single event loop.
+    """
+
+    def __init__(self, requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = LLM_TOKENS_PER_MINUTE):
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._waiters = []
+        self._seq = itertools.count()
+        self._timer = None
+        self._paused_until = 0.0
+        self.in_flight = 0
+        self.admitted_total = 0
+        self.retries_total = 0
+        self.rate_limited_total = 0
+        self.failed_total = 0
+
+    async def acquire(self, tokens: int, priority: int = None):
+        """Wait until this request may be sent."""
+        if priority is None:
+            priority = current_priority()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), tokens, future))
+        self._dispatch()
+        await future
+
+    def pause(self, seconds: float):
+        """Hold all admissions for a while (e.g. after a 429 with Retry-After)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _dispatch(self):
+        self._timer = None
+        while self._waiters:
+            _priority, _seq, tokens, future = self._waiters[0]
+            if future.done():  # cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+            now = time.monotonic()
+            wait = max(
+                self._paused_until - now,
+                self._requests.wait_time(1, now),
+                self._tokens.wait_time(tokens, now),
+            )
+            if wait > 0:
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self._requests.take(1)
+            self._tokens.take(tokens)
+            self.admitted_total += 1
+            future.set_result(None)
+
+    async def run(self, make_call, tokens: int, priority: int = None):
+        """
+        Send a request built by make_call() (a coroutine factory) once admitted,
+        retrying rate-limit and transient server errors with jittered
+        exponential backoff that honours Retry-After.
+        """
+        if priority is None:
+            priority = current_priority()
+        attempt = 0
+        while True:
+            await self.acquire(tokens, priority)
+            self.in_flight += 1
+            try:
+                return await make_call()
+            except Exception as e:
+                if not is_retryable(e) or attempt >= LLM_MAX_RETRIES:
+                    self.failed_total += 1
+                    raise
+                retry_after = retry_after_seconds(e)
+                if status_code(e) == 429:
+                    self.rate_limited_total += 1
+                if retry_after is not None:
+                    delay = retry_after + random.uniform(0, LLM_BACKOFF_BASE_SECONDS)
+                    self.pause(retry_after)
+                else:
+                    # Full jitter: uniform over [0, base * 2^attempt], capped
+                    delay = random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * 2 ** attempt))
+                attempt += 1
+                self.retries_total += 1
+            finally:
+                self.in_flight -= 1
+            await asyncio.sleep(delay)
+
+    def metrics(self) -> dict:
+        depth = {}
+        for priority, _seq, _tokens, future in self._waiters:
+            if not future.done():
+                depth[priority] = depth.get(priority, 0) + 1
+        return {
+            "queue_depth": sum(depth.values()),
+            "queue_depth_interactive": depth.get(PRIORITY_INTERACTIVE, 0),
+            "queue_depth_batch": sum(n for p, n in depth.items() if p != PRIORITY_INTERACTIVE),
+            "in_flight": self.in_flight,
+            "admitted_total": self.admitted_total,
+            "retries_total": self.retries_total,
+            "rate_limited_total": self.rate_limited_total,
+            "failed_total": self.failed_total,
+        }
+
+
+def status_code(error):
+    code = getattr(error, "status_code", None)
+    if code is None:
+        response = getattr(error, "response", None)
+        code = getattr(response, "status_code", None)
+    return code
+
+def is_retryable(error) -> bool:
+    """Rate limits, 5xx responses, timeouts and connection errors are worth retrying."""
+    code = status_code(error)
+    if code is not None:
+        return code == 429 or code == 408 or code >= 500
+    name = type(error).__name__
+    return name in ("APIConnectionError", "APITimeoutError", "TimeoutError", "ConnectionError")
+
+def retry_after_seconds(error):
+    """Seconds from a Retry-After / retry-after-ms header, or None."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            when = email.utils.parsedate_to_datetime(value)
+            return max(0.0, when.timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
@@ -0,0 +1,160 @@
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+
+import numpy as np
+
+from chunking_utils import chunk_text, chunker_key
+from embedding_utils import encode, encode_cached
+
+# Small chunks rank better and keep the Q&A prompt short
+RETRIEVAL_CHUNK_TOKENS = int(os.getenv("RETRIEVAL_CHUNK_TOKENS", "200"))
+RETRIEVAL_CHUNK_OVERLAP = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", "30"))
+# Reciprocal rank fusion constant (60 is the value from the original RRF paper)
+RRF_K = 60
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Books whose index is kept in memory
+RETRIEVAL_INDEX_CACHE_SIZE = int(os.getenv("RETRIEVAL_INDEX_CACHE_SIZE", "16"))
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i in is it its of on or she that the "
+    "their them they this to was were what when where which who whom why will with you your".split()
+)
+
+def tokenize(text: str):
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class RetrievalIndex:
+    """
+    Hybrid retrieval index for one book: a BM25 inverted index and a dense
+    embedding matrix over small sentence-aligned chunks, fused with reciprocal
+    rank fusion. Built once per book and reused for every question.
+    """
+
+    def __init__(self, chunks, chunk_chapters, vectors=None):
+        self.chunks = chunks                      # list of chunking_utils.Chunk
+        self.chunk_chapters = np.asarray(chunk_chapters, dtype=np.int32)
+        self.vectors = vectors                    # (n, dim) float32 or None (BM25 only)
+        postings = defaultdict(list)
+        lengths = np.zeros(len(chunks), dtype=np.float32)
+        for doc_id, chunk in enumerate(chunks):
+            terms = Counter(tokenize(chunk.text))
+            lengths[doc_id] = sum(terms.values())
+            for term, tf in terms.items():
+                postings[term].append((doc_id, tf))
+        n = max(1, len(chunks))
+        self.avg_length = float(lengths.mean()) if len(chunks) else 0.0
+        self.lengths = lengths
+        self.postings = {}
+        for term, entries in postings.items():
+            doc_ids = np.fromiter((d for d, _ in entries), dtype=np.int32, count=len(entries))
+            tfs = np.fromiter((tf for _, tf in entries), dtype=np.float32, count=len(entries))
+            idf = math.log(1 + (n - len(entries) + 0.5) / (len(entries) + 0.5))
+            self.postings[term] = (doc_ids, tfs, idf)
+
+    @classmethod
+    def build(cls, chapters):
+        """Chunk every chapter and build both indexes."""
+        chunks = []
+        chunk_chapters = []
+        for chapter_idx, text in enumerate(chapters):
+            for chunk in chunk_text(text, RETRIEVAL_CHUNK_TOKENS, RETRIEVAL_CHUNK_OVERLAP):
+                chunks.append(chunk)
+                chunk_chapters.append(chapter_idx)
+        vectors = None
+        if chunks:
+            try:
+                vectors = encode_cached(
+                    [c.text for c in chunks],
+                    chunker=chunker_key(RETRIEVAL_CHUNK_TOKENS, RETRIEVAL_CHUNK_OVERLAP),
+                )
+            except Exception as e:
+                print(f"[Retrieval] Embeddings unavailable, using BM25 only: {e}")
+        return cls(chunks, chunk_chapters, vectors)
+
+    def _bm25_scores(self, query_terms, mask):
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        if not self.avg_length:
+            return scores
+        for term in set(query_terms):
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            doc_ids, tfs, idf = entry
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc_ids] / self.avg_length)
+            np.add.at(scores, doc_ids, idf * tfs * (BM25_K1 + 1) / (tfs + norm))
+        scores[~mask] = 0.0
+        return scores
+
+    def search(self, query: str, top_k: int = 5, chapter: int = None):
+        """
+        Return [(chunk, fused_score)] for the top_k chunks, optionally limited to
+        one chapter. Rankings from BM25 and vector similarity are fused with RRF.
+        """
+        if not self.chunks:
+            return []
+        mask = np.ones(len(self.chunks), dtype=bool) if chapter is None else self.chunk_chapters == chapter
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == 0:
+            return []
+        fused = np.zeros(len(self.chunks), dtype=np.float64)
+
+        bm25 = self._bm25_scores(tokenize(query), mask)
+        matched = candidates[bm25[candidates] > 0]
+        if len(matched):
+            ranked = matched[np.argsort(-bm25[matched], kind="stable")]
+            fused[ranked] += 1.0 / (RRF_K + np.arange(1, len(ranked) + 1))
+
+        if self.vectors is not None:
+            try:
+                query_vec = encode([query])[0]
+                sims = self.vectors[candidates] @ query_vec
+                ranked = candidates[np.argsort(-sims, kind="stable")]
+                fused[ranked] += 1.0 / (RRF_K + np.arange(1, len(ranked) + 1))
+            except Exception as e:
+                print(f"[Retrieval] Vector search failed, using BM25 only: {e}")
+
+        top_k = min(top_k, len(candidates))
+        best = candidates[np.argpartition(-fused[candidates], top_k - 1)[:top_k]]
+        best = best[np.argsort(-fused[best], kind="stable")]
+        return [(self.chunks[i], float(fused[i])) for i in best]
+
+
+_indexes = OrderedDict()
+_index_lock = threading.Lock()
+_build_locks = {}
+
+def register_index(key: str, index: RetrievalIndex):
+    with _index_lock:
+        _indexes[key] = index
+        _indexes.move_to_end(key)
+        while len(_indexes) > RETRIEVAL_INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+
+def get_index(key: str, chapters=None):
+    """
+    Return the index registered under key (e.g. a book's content hash), building
+    it from chapters if it is not in memory. Concurrent builds of one key are merged.
+    """
+    with _index_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+        if chapters is None:
+            return None
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+    with build_lock:
+        with _index_lock:
+            index = _indexes.get(key)
+        if index is None:
+            index = RetrievalIndex.build(chapters)
+            register_index(key, index)
+        with _index_lock:
+            _build_locks.pop(key, None)
+        return index
@@ -1,4 +1,44 @@
+import os
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from metrics_utils import get_trace, metrics_json, on_trace_start, prometheus_text, start_metrics_server
+
+# Set to show the per-stage timing panel for the last request in the sidebar
+METRICS_DEBUG_PANEL = os.getenv("METRICS_DEBUG_PANEL", "").lower() in ("1", "true", "yes")
+
+def _remember_trace(t):
+    # Traces are process-wide; remember which one this session started. Those
+    # started outside a script run (prefetch workers) belong to no session.
+    if get_script_run_ctx() is not None:
+        st.session_state["last_trace_id"] = t.id
+
+on_trace_start(_remember_trace)
+
+def show_debug_panel():
+    """Per-stage breakdown of this session's most recent traced request, plus cache counters."""
+    with st.sidebar.expander("🛠️ Debug: last request", expanded=False):
+        trace_id = st.session_state.get("last_trace_id")
+        t = get_trace(trace_id) if trace_id else None
+        if t is None:
+            st.caption("No finished requests traced in this session yet." if trace_id is None
+                       else "Your last request is still running or has left the recent traces.")
+        else:
+            st.markdown(f"**{t.name}** – {t.duration or 0:.3f}s" + (f" (error: {t.error})" if t.error else ""))
+            rows = []
+            for s in list(t.spans):
+                extra = {k: v for k, v in s.items() if k not in ("stage", "parent", "start_s", "duration_s", "error")}
+                rows.append({
+                    "stage": s["stage"],
+                    "start ms": round(s["start_s"] * 1000, 1),
+                    "ms": round(s["duration_s"] * 1000, 1),
+                    "error": s["error"] or "",
+                    "details": ", ".join(f"{k}={v:.3g}" if isinstance(v, float) else f"{k}={v}" for k, v in extra.items()),
+                })
+            st.dataframe(rows, hide_index=True, use_container_width=True)
+        counters = [c for c in metrics_json()["counters"] if c["name"].startswith(("cache_", "errors_"))]
+        if counters:
+            st.caption(" · ".join(f"{c['name']}{c['labels']}={c['value']:g}" for c in counters))
+        st.download_button("Prometheus metrics", prometheus_text(), file_name="metrics.txt", key="metrics_download")
 
 def show_sidebar():
     # This CSS hides the default Streamlit navigation section.
@@ -14,4 +54,8 @@ def show_sidebar():
     st.sidebar.page_link("pages/1_Summary.py", label="Summary", icon="📜")
     st.sidebar.page_link("pages/2_Review.py", label="Review", icon="🧠")
     st.sidebar.page_link("pages/3_MCQ.py", label="MCQ", icon="❓")
-    st.sidebar.page_link("pages/4_QA.py", label="Q&A", icon="🗣️")
\ No newline at end of file
+    st.sidebar.page_link("pages/4_QA.py", label="Q&A", icon="🗣️")
+    # Serves /metrics when METRICS_PORT is set (once per process)
+    start_metrics_server()
+    if METRICS_DEBUG_PANEL:
+        show_debug_panel()
@@ -1,16 +1,11 @@
 import streamlit as st
-import tempfile
-import os
-from PyPDF2 import PdfReader
-import wikipedia
 import sys
 import asyncio
-from epub_utils import extract_chapters_from_epub
-import subprocess
-from chroma_utils import store_chapter_embeddings
-import time
+import uuid
+from ingest_utils import ingest_epub, ingest_pdf, ingest_wikisource, ingest_wikipedia, file_hash
+from wikipedia_utils import WIKIPEDIA_MAX_LINKED
 from sidebar_utils import show_sidebar
-from wikisource_utils import scrape_wikisource
+from prefetch_utils import prefetch_chapters
 
 # --- WINDOWS EVENT LOOP FIX ---
 if sys.platform.startswith("win"):
@@ -35,46 +30,66 @@ with col2:
 with col3:
     st.markdown("### 🌐 Wiki URL")
     wiki_url = st.text_input("Enter a Wikipedia or Wikisource URL", key="wiki")
+    include_linked = st.checkbox("Add linked Wikipedia articles as extra chapters", key="wiki_linked")
     wiki_btn = st.button("🔍 Process Wiki", key="wiki_btn")
 
+def load_book(book, source_type):
+    """Put an ingested book into session state and select its first chapter."""
+    st.session_state["extracted_text"] = book["chapters"][0] if book["chapters"] else ""
+    st.session_state["source_type"] = source_type
+    st.session_state["chapters"] = book["chapters"]
+    st.session_state["chapter_titles"] = book["chapter_titles"]
+    st.session_state["selected_chapter_idx"] = 0
+    st.session_state.pop("chapter_select_box", None)
+    st.session_state["book_id"] = book["book_id"]
+    st.session_state["ingested_hash"] = book["content_hash"]
+
+def ingest_upload(uploaded_file, ingest, label):
+    """Ingest an uploaded file, streaming chapter progress into the page."""
+    progress = st.empty()
+
+    def show_progress(title, text):
+        progress.markdown(f"{label} Extracted **{title}**: {text[:200]}...")
+
+    book = ingest(uploaded_file.getvalue(), uploaded_file.name, on_chapter=show_progress)
+    progress.empty()
+    return book
+
 # Extraction logic
+# Streamlit reruns this script on every interaction; only ingest when the upload changes
 if epub_file:
-    with st.spinner("⏳ Processing EPUB..."):
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".epub") as tmp:
-            tmp.write(epub_file.read())
-            tmp_path = tmp.name
-        chapter_titles, chapter_texts = extract_chapters_from_epub(tmp_path)
-        # Split long chapters into sub-chapters
-        max_len = 10000
-        chunk_len = 8000
-        new_titles = []
-        new_texts = []
-        for i, (title, text) in enumerate(zip(chapter_titles, chapter_texts)):
-            if len(text) <= max_len:
-                new_titles.append(title)
-                new_texts.append(text)
-            else:
-                # Split into chunks
-                num_chunks = (len(text) + chunk_len - 1) // chunk_len
-                for j in range(num_chunks):
-                    chunk_text = text[j*chunk_len:(j+1)*chunk_len]
-                    if j == 0:
-                        new_titles.append(title)
-                    else:
-                        new_titles.append(f"{title}.{j}")
-                    new_texts.append(chunk_text)
-        chapter_titles = new_titles
-        chapter_texts = new_texts
-        st.session_state["extracted_text"] = chapter_texts[0] if chapter_texts else ""
-        st.session_state["source_type"] = "epub"
-        st.session_state["chapters"] = chapter_texts
-        st.session_state["chapter_titles"] = chapter_titles if chapter_titles else [f"Chapter {i}" for i in range(len(chapter_texts))]
-        st.session_state["selected_chapter_idx"] = 0
-        # Store in ChromaDB
-        book_id = os.path.splitext(os.path.basename(epub_file.name))[0] if epub_file.name else f"epub_{int(time.time())}"
-        store_chapter_embeddings(book_id, chapter_texts)
-        st.session_state["book_id"] = book_id
-        st.success("Chapters extracted and ready for AI processing!")
+    if st.session_state.get("ingested_hash") != file_hash(epub_file.getvalue()):
+        with st.spinner("⏳ Processing EPUB..."):
+            load_book(ingest_upload(epub_file, ingest_epub, "📖"), "epub")
+            st.success("Chapters extracted and ready for AI processing!")
+
+elif pdf_file:
+    if st.session_state.get("ingested_hash") != file_hash(pdf_file.getvalue()):
+        with st.spinner("⏳ Processing PDF..."):
+            load_book(ingest_upload(pdf_file, ingest_pdf, "📄"), "pdf")
+            st.success("PDF text extracted and ready for AI processing!")
+
+elif wiki_url and wiki_btn:
+    with st.spinner("⏳ Processing Wiki URL..."):
+        if "wikisource.org" in wiki_url or "wikipedia.org" in wiki_url:
+            progress = st.empty()
+
+            def show_progress(title, chapter_text):
+                progress.markdown(f"📜 Fetched **{title}**: {chapter_text[:200]}...")
+
+            try:
+                if "wikisource.org" in wiki_url:
+                    book = ingest_wikisource(wiki_url, on_chapter=show_progress)
+                else:
+                    linked = WIKIPEDIA_MAX_LINKED if include_linked else 0
+                    book = ingest_wikipedia(wiki_url, linked=linked, on_chapter=show_progress)
+                load_book(book, "wiki")
+                st.success("Wiki text extracted and ready for AI processing!")
+            except Exception as e:
+                st.error(f"Wiki error: {e}")
+            progress.empty()
+        else:
+            st.error("Please enter a valid Wikipedia or Wikisource URL.")
 
 # Chapter selection dropdown (if chapters are present)
 if "chapters" in st.session_state and st.session_state["chapters"]:
@@ -89,66 +104,17 @@ if "chapters" in st.session_state and st.session_state["chapters"]:
     )
     if idx != prev_idx:
         # Clear feature outputs when chapter changes
-        for k in ["summary", "review", "mcqs", "last_answer", "last_question", "last_context_chunks"]:
+        for k in ["summary", "review", "mcqs", "parsed_mcqs", "last_answer", "last_question", "last_context_chunks"]:
             if k in st.session_state:
                 del st.session_state[k]
+        for k in [k for k in st.session_state.keys() if isinstance(k, str) and k.startswith("mcq_")]:
+            del st.session_state[k]
     st.session_state["selected_chapter_idx"] = idx
     st.session_state["extracted_text"] = st.session_state["chapters"][idx]
-
-elif pdf_file:
-    with st.spinner("⏳ Processing PDF..."):
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp.write(pdf_file.read())
-            tmp_path = tmp.name
-        reader = PdfReader(tmp_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() or ""
-        st.session_state["extracted_text"] = text
-        st.session_state["source_type"] = "pdf"
-        # Split into ~1000 char chunks for embedding
-        chunks = [text[i:i+1000] for i in range(0, len(text), 1000) if text[i:i+1000].strip()]
-        book_id = os.path.splitext(os.path.basename(pdf_file.name))[0] if pdf_file.name else f"pdf_{int(time.time())}"
-        store_chapter_embeddings(book_id, chunks)
-        st.session_state["book_id"] = book_id
-        st.success("PDF text extracted and ready for AI processing!")
-
-elif wiki_url and wiki_btn:
-    with st.spinner("⏳ Processing Wiki URL..."):
-        text = ""
-        if "wikisource.org" in wiki_url:
-            text_path = "wikisource_text.txt"
-            result = subprocess.run([
-                sys.executable, "wikisource_scraper.py", wiki_url, text_path
-            ], capture_output=True, text=True)
-            if result.returncode != 0:
-                st.error(f"Scraper error: {result.stderr}")
-            if not os.path.exists(text_path):
-                st.error(f"File not found: {text_path}")
-            else:
-                with open(text_path, "r", encoding="utf-8") as f:
-                    text = f.read()
-                if "[RequestsBS4] Scraping successful" in result.stdout:
-                    st.info("Wiki text extracted and ready for AI processing!")
-                else:
-                    st.warning("Wikisource scraping completed, but method could not be determined.")
-        elif "wikipedia.org" in wiki_url:
-            if "/wiki/" in wiki_url:
-                title = wiki_url.split("/wiki/")[-1].replace("_", " ")
-                text = wikipedia.page(title).content
-            else:
-                st.error("Invalid Wikipedia URL")
-        else:
-            st.error("Please enter a valid Wikipedia or Wikisource URL.")
-        if text:
-            st.session_state["extracted_text"] = text
-            st.session_state["source_type"] = "wiki"
-            # Split into ~1000 char chunks for embedding
-            chunks = [text[i:i+1000] for i in range(0, len(text), 1000) if text[i:i+1000].strip()]
-            book_id = wiki_url if wiki_url else f"wiki_{int(time.time())}"
-            store_chapter_embeddings(book_id, chunks)
-            st.session_state["book_id"] = book_id
-            st.success("Wiki text extracted and ready for AI processing!")
+    # Start on this chapter's (and the next one's) summary, review and MCQs before a page asks for them;
+    # picking another chapter cancels whatever is no longer needed
+    owner = st.session_state.setdefault("prefetch_owner", uuid.uuid4().hex)
+    prefetch_chapters(owner, st.session_state["chapters"], idx)
 
 # Show extracted content after processing
 if "extracted_text" in st.session_state:
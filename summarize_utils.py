@@ -0,0 +1,98 @@
+import asyncio
+import os
+from chunking_utils import count_tokens, chunk_strings
+from llm_utils import (
+    acomplete, run_async, agenerate_summary, stream_summary, stream_prompt,
+    summary_prompt, SUMMARY_PARAMS, GenerationError,
+)
+
+# Largest input (in tokens) sent to the model in a single summary prompt
+SUMMARY_INPUT_TOKENS = int(os.getenv("SUMMARY_INPUT_TOKENS", "6000"))
+# Size of the pieces the document is cut into for the map step
+SUMMARY_MAP_CHUNK_TOKENS = int(os.getenv("SUMMARY_MAP_CHUNK_TOKENS", "4000"))
+MAP_PARAMS = {"temperature": 0.3, "max_tokens": 500}
+REDUCE_PARAMS = {"temperature": 0.3, "max_tokens": 700}
+
+def partial_summary_prompt(text: str) -> str:
+    return (
+        "Summarize the following section of a longer document. Keep every key point, name, event and argument; "
+        "do not add an introduction or conclusion.\n\n"
+        f"{text}\n\nSection Summary:"
+    )
+
+def combine_summaries_prompt(summaries) -> str:
+    joined = "\n\n".join(f"Part {i + 1}:\n{s}" for i, s in enumerate(summaries))
+    return (
+        "The following are summaries of consecutive parts of a longer document. Merge them into one coherent summary "
+        "that keeps all key points in order.\n\n"
+        f"{joined}\n\nMerged Summary:"
+    )
+
+def _group(summaries, budget):
+    """Greedily group consecutive summaries so each group fits in budget tokens (at least two per group)."""
+    groups = []
+    current = []
+    used = 0
+    for s in summaries:
+        tokens = count_tokens(s)
+        if len(current) >= 2 and used + tokens > budget:
+            groups.append(current)
+            current = []
+            used = 0
+        current.append(s)
+        used += tokens
+    if current:
+        if len(current) == 1 and groups:
+            groups[-1].append(current[0])
+        else:
+            groups.append(current)
+    return groups
+
+async def areduce_to_fit(text: str, model: str = None) -> str:
+    """
+    Map-reduce text until it fits in one summary prompt: summarize chunks in
+    parallel (bounded by LLM_MAX_CONCURRENCY), then merge partial summaries
+    level by level. Every intermediate step goes through the LLM response cache,
+    so regenerating or re-summarizing overlapping text reuses them.
+    Returns text that fits within SUMMARY_INPUT_TOKENS.
+    """
+    if count_tokens(text) <= SUMMARY_INPUT_TOKENS:
+        return text
+    chunks = chunk_strings(text, SUMMARY_MAP_CHUNK_TOKENS)
+    summaries = await asyncio.gather(*(
+        acomplete(partial_summary_prompt(chunk), model=model, **MAP_PARAMS) for chunk in chunks
+    ))
+    while sum(count_tokens(s) for s in summaries) > SUMMARY_INPUT_TOKENS and len(summaries) > 1:
+        groups = _group(summaries, SUMMARY_INPUT_TOKENS)
+        summaries = await asyncio.gather(*(
+            acomplete(combine_summaries_prompt(group), model=model, **REDUCE_PARAMS) if len(group) > 1
+            else asyncio.sleep(0, result=group[0])
+            for group in groups
+        ))
+    return "\n\n".join(summaries)
+
+async def asummarize(text: str, model: str = None, use_cache: bool = True) -> str:
+    """Summarize text of any size; small inputs go straight to generate_summary."""
+    try:
+        reduced = await areduce_to_fit(text, model=model)
+    except Exception as e:
+        return f"[Error] Failed to generate summary: {e}"
+    return await agenerate_summary(reduced, model=model, use_cache=use_cache)
+
+def summarize(text: str, use_cache: bool = True) -> str:
+    return run_async(asummarize(text, use_cache=use_cache))
+
+def stream_summarize(text: str, use_cache: bool = True):
+    """
+    Streaming summary for inputs of any size. Large inputs are reduced first and
+    only the final step is streamed, so time to first token is bounded by the
+    tree depth rather than the document size. Failures raise GenerationError.
+    """
+    if count_tokens(text) <= SUMMARY_INPUT_TOKENS:
+        yield from stream_summary(text, use_cache=use_cache)
+        return
+    try:
+        reduced = run_async(areduce_to_fit(text))
+    except Exception as e:
+        raise GenerationError(f"Failed to generate summary: {e}") from e
+    yield from stream_prompt(summary_prompt(reduced), SUMMARY_PARAMS, "summary", use_cache=use_cache)
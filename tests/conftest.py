@@ -0,0 +1,51 @@
+import hashlib
+import os
+import re
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+
+# Every store the modules open at import time lives in a throwaway directory
+_DATA_DIR = tempfile.mkdtemp(prefix="bookbrain-tests-")
+os.environ.update({
+    "CHROMA_PERSIST_DIR": os.path.join(_DATA_DIR, "chroma"),
+    "VECTOR_STORE": "numpy",
+    "FEEDBACK_DB_PATH": os.path.join(_DATA_DIR, "feedback.db"),
+    "LLM_CACHE_PATH": os.path.join(_DATA_DIR, "llm_cache.db"),
+    "EMBEDDING_CACHE_DIR": os.path.join(_DATA_DIR, "embedding_cache"),
+    "HTTP_CACHE_PATH": os.path.join(_DATA_DIR, "http_cache.db"),
+    "WIKIPEDIA_CACHE_PATH": os.path.join(_DATA_DIR, "wikipedia_cache.db"),
+    "PREFETCH_ENABLED": "0",
+})
+os.environ.setdefault("OPENAI_API_KEY", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class HashingBackend:
+    """Deterministic bag-of-words embedder standing in for the sentence-transformers model."""
+
+    dimension = 256
+    cache_name = "test-hashing"
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dimension] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-9)
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    """Route the shared embedding service (and everything built on it) to HashingBackend."""
+    import embedding_utils
+    import chroma_utils
+
+    service = embedding_utils.EmbeddingService()
+    service._model = HashingBackend()
+    monkeypatch.setattr(embedding_utils, "_service", service)
+    monkeypatch.setattr(chroma_utils, "EMBEDDINGS_AVAILABLE", True)
+    return service
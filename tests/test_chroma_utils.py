@@ -0,0 +1,25 @@
+import uuid
+
+import chroma_utils
+from chroma_utils import semantic_search, store_chapter_embeddings
+
+
+def test_search_reports_the_latest_ingest_of_shared_records(embeddings, monkeypatch):
+    monkeypatch.setattr(chroma_utils, "KEEP_VERSIONS", 2)
+    book_id = f"book-{uuid.uuid4().hex}"
+    assert store_chapter_embeddings(book_id, ["alpha apples", "beta bananas"]) == 1
+    assert store_chapter_embeddings(book_id, ["beta bananas", "gamma grapes"]) == 2
+
+    hits = semantic_search("beta bananas", top_k=3, book_id=book_id)
+    assert [h["text"] for h in hits] == ["beta bananas", "gamma grapes"]
+    assert (hits[0]["meta"]["chapter"], hits[0]["meta"]["version"]) == (0, 2)
+    # Still stored for version 1, but not part of the current book
+    assert "alpha apples" not in [h["text"] for h in semantic_search("alpha apples", top_k=3)]
+
+
+def test_store_without_embeddings_creates_no_partition(monkeypatch):
+    monkeypatch.setattr(chroma_utils, "EMBEDDINGS_AVAILABLE", False)
+    book_id = f"book-{uuid.uuid4().hex}"
+    assert store_chapter_embeddings(book_id, ["alpha apples"]) is None
+    assert chroma_utils.store_content_version(book_id, "a summary", "summary") is None
+    assert chroma_utils.find_book_collection(book_id) is None
@@ -0,0 +1,43 @@
+import uuid
+
+from ingest_utils import _ingest_web_chapters
+from pipeline import build_qa_context, rl_semantic_search, store_feedback
+
+CHAPTERS = [
+    ("Dragons", "The dragon guarded a hoard of gold in the mountain cave. Dragons breathe fire."),
+    ("Ships", "The ship sailed across the stormy sea to the harbour. Sailors trimmed the sails."),
+    ("Gardens", "The garden was full of roses and tulips. A dragon statue stood by the gate."),
+]
+
+
+def _ingest(chapters):
+    url = f"https://example.org/{uuid.uuid4().hex}"
+    return _ingest_web_chapters("test", url, chapters)
+
+
+def test_feedback_on_answer_reranks_search_hits(embeddings):
+    book = _ingest(CHAPTERS)
+    query = "dragon hoard gold cave"
+    before = rl_semantic_search(query, top_k=3, book_id=book["book_id"])
+    assert before[0]["meta"]["chapter"] == 0
+
+    _prompt, context_chunks = build_qa_context(
+        query, book["chapters"][2], book["content_hash"], book["chapters"], 2)
+    store_feedback(query, "By the gate.", True, "Yes", context_chunks=context_chunks)
+
+    after = rl_semantic_search(query, top_k=3, book_id=book["book_id"])
+    assert after[0]["text"] == context_chunks[0]
+    assert after[0]["meta"]["chapter"] == 2
+
+
+def test_chapter_feedback_credits_every_chunk_of_the_chapter(embeddings):
+    long_chapter = " ".join(f"Sentence {i} tells how the sailors mended the nets." for i in range(80))
+    book = _ingest([CHAPTERS[0], ("Nets", long_chapter), CHAPTERS[1]])
+    hits = rl_semantic_search("dragon gold", top_k=10, book_id=book["book_id"])
+    chapter_hits = [h for h in hits if h["meta"]["chapter"] == 1]
+    assert len(chapter_hits) > 1
+
+    store_feedback("q", "a", True, "Yes", book_id=book["book_id"], chapter=1)
+
+    hits = rl_semantic_search("dragon gold", top_k=len(chapter_hits), book_id=book["book_id"])
+    assert [h["meta"]["chapter"] for h in hits] == [1] * len(chapter_hits)
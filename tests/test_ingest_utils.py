@@ -0,0 +1,29 @@
+import io
+import os
+import sys
+
+from PyPDF2 import PdfReader, PdfWriter
+
+from chunking_utils import count_tokens, CHAPTER_MAX_TOKENS
+from ingest_utils import ingest_pdf
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from corpus import make_chapters, write_pdf  # noqa: E402
+
+
+def test_long_pdf_outline_entries_are_split(embeddings, tmp_path):
+    path = str(tmp_path / "book.pdf")
+    write_pdf(path, make_chapters(1, CHAPTER_MAX_TOKENS * 3))
+    writer = PdfWriter()
+    for page in PdfReader(path).pages:
+        writer.add_page(page)
+    # One outline entry spanning the whole document
+    writer.add_outline_item("Everything", 0)
+    data = io.BytesIO()
+    writer.write(data)
+
+    book = ingest_pdf(data.getvalue(), "long.pdf")
+
+    assert len(book["chapters"]) > 1
+    assert book["chapter_titles"][:2] == ["Everything", "Everything.1"]
+    assert all(count_tokens(text) <= CHAPTER_MAX_TOKENS for text in book["chapters"])
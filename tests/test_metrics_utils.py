@@ -0,0 +1,16 @@
+import metrics_utils
+from metrics_utils import get_trace, trace
+
+
+def test_start_listeners_see_top_level_traces_only(monkeypatch):
+    started = []
+    monkeypatch.setattr(metrics_utils, "_start_listeners", [started.append])
+    with trace("outer") as outer:
+        with trace("inner"):
+            pass
+    with trace("other"):
+        pass
+
+    assert [t.name for t in started] == ["outer", "other"]
+    assert get_trace(outer.id) is outer
+    assert get_trace("unknown") is None
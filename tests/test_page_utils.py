@@ -0,0 +1,15 @@
+import uuid
+
+import streamlit as st
+
+from page_utils import save_artifact, stored_artifact
+
+
+def test_saved_artifacts_are_served_for_their_source_text(embeddings):
+    st.session_state["book_id"] = f"book-{uuid.uuid4().hex}"
+    st.session_state["selected_chapter_idx"] = 2
+    save_artifact("summary", "chapter text", "first summary")
+    save_artifact("summary", "chapter text", "regenerated summary")
+
+    assert stored_artifact("summary", "chapter text") == "regenerated summary"
+    assert stored_artifact("summary", "edited chapter text") is None
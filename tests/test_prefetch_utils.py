@@ -0,0 +1,36 @@
+import asyncio
+import time
+
+import prefetch_utils
+from prefetch_utils import PrefetchScheduler
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_idle_owners_expire_and_their_jobs_are_cancelled(monkeypatch):
+    async def slow(text):
+        await asyncio.sleep(30)
+        return text
+
+    async def fast(text):
+        return f"summary of {text}"
+
+    monkeypatch.setattr(prefetch_utils, "ARTIFACTS", {"summary": slow})
+    scheduler = PrefetchScheduler(workers=2, owner_ttl=0.05)
+    scheduler.request("idle-session", ["chapter one"])
+    job = scheduler._jobs[("summary", prefetch_utils.content_hash("chapter one"))]
+    assert _wait_for(lambda: job.task is not None)
+
+    time.sleep(0.1)
+    monkeypatch.setattr(prefetch_utils, "ARTIFACTS", {"summary": fast})
+    scheduler.request("active-session", ["chapter two"])
+
+    assert job.cancelled
+    assert list(scheduler._wanted) == ["active-session"]
+    assert _wait_for(lambda: not scheduler._jobs)
+    assert scheduler.get("summary", "chapter two") == "summary of chapter two"
@@ -0,0 +1,44 @@
+import sqlite3
+
+from version_catalog import VersionCatalog
+
+
+def test_artifact_versions_are_separate_from_ingest_manifests(tmp_path):
+    catalog = VersionCatalog(str(tmp_path / "catalog.db"))
+    catalog.put_entry("book", "summary", 3, 1, "book_summary_v1_ch_3")
+    catalog.put_manifest("book", "summary", 1, ["a", "b"])
+    catalog.put_manifest("book", "summary", 2, ["c"])
+    catalog.prune("book", "summary", 1)
+
+    assert catalog.latest("book", "summary", 3)["id"] == "book_summary_v1_ch_3"
+    assert [e["id"] for e in catalog.history("book", "summary")] == ["book_summary_v1_ch_3"]
+    assert catalog.latest_version("book", "summary") == 2
+    assert catalog.referenced_ids("book", "summary") == {"c"}
+
+
+def test_old_catalog_is_migrated(tmp_path):
+    path = str(tmp_path / "catalog.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE manifest (book_id TEXT NOT NULL, content_type TEXT NOT NULL, version INTEGER NOT NULL,"
+        " position INTEGER NOT NULL, record_id TEXT NOT NULL, timestamp INTEGER, chapter INTEGER,"
+        " PRIMARY KEY (book_id, content_type, version, position))"
+    )
+    conn.execute(
+        "CREATE TABLE latest (book_id TEXT NOT NULL, content_type TEXT NOT NULL, position INTEGER NOT NULL,"
+        " version INTEGER NOT NULL, record_id TEXT NOT NULL, timestamp INTEGER,"
+        " PRIMARY KEY (book_id, content_type, position))"
+    )
+    conn.executemany(
+        "INSERT INTO manifest (book_id, content_type, version, position, record_id) VALUES (?, ?, ?, ?, ?)",
+        [("book", "summary", 1, 2, "book_summary_v1_ch_2"), ("book", "summary", 2, 2, "book_summary_v2_ch_2"),
+         ("book", "summary", 1, 0, "a")],
+    )
+    conn.commit()
+    conn.close()
+
+    catalog = VersionCatalog(path)
+    assert catalog.latest("book", "summary", 2)["id"] == "book_summary_v2_ch_2"
+    assert catalog.referenced_ids("book", "summary") == {"a"}
+    catalog.put_entry("book", "summary", 2, 3, "book_summary_v3_ch_2")
+    assert catalog.latest("book", "summary", 2)["version"] == 3
@@ -0,0 +1,92 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ingest_utils import ingest_wikisource
+from wikisource_utils import fetch_wikisource
+
+PAGES = {
+    "/wiki/Work": '<a href="/wiki/Work/Chapter_1">1</a> <a href="/wiki/Work/Chapter_2">2</a>',
+    "/wiki/Work/Chapter_1": "<p>The first chapter begins by the river.</p>",
+    "/wiki/Work/Chapter_2": "<p>The second chapter ends in the hills.</p>",
+}
+
+
+class WikisourceHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        if self.path not in PAGES:
+            self.send_error(404)
+            return
+        if self.path.endswith("Chapter_2"):
+            # Held back until the first chapter has been handed to on_page
+            server.release_last.wait(5)
+        etag = f'"{self.path}"'
+        server.requests.append((self.path, self.headers.get("If-None-Match") == etag))
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        title = self.path.rsplit("/", 1)[-1].replace("_", " ")
+        body = (f'<h1 id="firstHeading">{title}</h1>'
+                f'<div class="mw-parser-output">{PAGES[self.path]}</div>').encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def wikisource():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), WikisourceHandler)
+    server.requests = []
+    server.release_last = threading.Event()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.release_last.set()
+    server.shutdown()
+    server.server_close()
+
+
+def _url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/wiki/Work"
+
+
+def test_chapters_stream_while_the_crawl_is_running(wikisource):
+    seen = []
+
+    def on_page(title, text):
+        seen.append((title, [path for path, _revalidated in wikisource.requests]))
+        wikisource.release_last.set()
+
+    chapters = fetch_wikisource(_url(wikisource), on_page=on_page)
+
+    assert [title for title, _text in chapters] == ["Chapter 1", "Chapter 2"]
+    # Chapter 1 was reported before Chapter 2 had been served
+    assert [title for title, _served in seen] == ["Chapter 1", "Chapter 2"]
+    assert "/wiki/Work/Chapter_2" not in seen[0][1]
+
+
+def test_refetch_revalidates_unchanged_pages(wikisource):
+    wikisource.release_last.set()
+    first = fetch_wikisource(_url(wikisource))
+    wikisource.requests.clear()
+
+    assert fetch_wikisource(_url(wikisource)) == first
+    assert sorted(wikisource.requests) == sorted((path, True) for path in PAGES)
+
+
+def test_ingest_reports_chapters_as_they_are_crawled(wikisource, embeddings):
+    wikisource.release_last.set()
+    titles = []
+    book = ingest_wikisource(_url(wikisource), on_chapter=lambda title, text: titles.append(title))
+    # Reported in completion order; the book keeps reading order
+    assert sorted(titles) == ["Chapter 1", "Chapter 2"]
+    assert book["chapter_titles"] == ["Chapter 1", "Chapter 2"]
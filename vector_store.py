@@ -0,0 +1,370 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+
+import numpy as np
+
+# "float16" or "int8" (per-row scaled) vector storage
+VECTOR_STORE_DTYPE = os.getenv("VECTOR_STORE_DTYPE", "float16").lower()
+# Rows scored per matmul block, bounding the float32 working memory of a query
+_QUERY_BLOCK_ROWS = 65536
+_INITIAL_CAPACITY = 1024
+
+
+def _match(meta: dict, where: dict) -> bool:
+    """Evaluate a Chroma-style where clause ($and/$or, $eq/$ne/$gt/$gte/$lt/$lte/$in/$nin) against one record."""
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_match(meta, c) for c in condition):
+                return False
+        elif key == "$or":
+            if not any(_match(meta, c) for c in condition):
+                return False
+        else:
+            value = meta.get(key)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, operand in condition.items():
+                if op == "$eq":
+                    ok = value == operand
+                elif op == "$ne":
+                    ok = value != operand
+                elif op == "$in":
+                    ok = value in operand
+                elif op == "$nin":
+                    ok = value not in operand
+                elif value is None:
+                    ok = False
+                elif op == "$gt":
+                    ok = value > operand
+                elif op == "$gte":
+                    ok = value >= operand
+                elif op == "$lt":
+                    ok = value < operand
+                elif op == "$lte":
+                    ok = value <= operand
+                else:
+                    raise ValueError(f"unsupported where operator {op}")
+                if not ok:
+                    return False
+    return True
+
+
+class NumpyCollection:
+    """
+    A collection with the subset of the Chroma API BookBrain uses (upsert, get,
+    update, delete, query, count). Vectors live in a memory-mapped float16 or
+    int8 file with one row per slot, next to a float32 file holding each row's
+    scale and squared norm; ids, documents and metadata live in a SQLite
+    sidecar. Opening a collection maps the files without reading the vectors.
+    Queries are exact: one matmul over the (filtered) rows plus argpartition.
+    Distances are squared L2, like Chroma's default.
+    """
+
+    def __init__(self, directory: str, name: str, metadata: dict = None, dtype: str = VECTOR_STORE_DTYPE):
+        self.name = name
+        self.directory = os.path.join(directory, name)
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(self.directory, "records.db"),
+                                     check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records (id TEXT PRIMARY KEY, slot INTEGER NOT NULL UNIQUE,"
+            " document TEXT, metadata TEXT)"
+        )
+        meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+        if not meta:
+            meta = {"dtype": "int8" if dtype == "int8" else "float16",
+                    "metadata": json.dumps(metadata or {})}
+            self._conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", meta.items())
+        self.metadata = json.loads(meta["metadata"])
+        self.dtype = np.int8 if meta["dtype"] == "int8" else np.float16
+        self.dim = int(meta["dim"]) if "dim" in meta else None
+        self._vectors = None
+        self._rows = None
+        self._capacity = int(meta.get("capacity", 0))
+        # Slot-indexed ids and metadata, kept in memory for filtering
+        self._ids = {}
+        self._slot_ids = []
+        self._metas = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._ensure_slots(self._capacity)
+        for id, slot, metadata_json in self._conn.execute("SELECT id, slot, metadata FROM records"):
+            self._ids[id] = slot
+            self._slot_ids[slot] = id
+            self._metas[slot] = json.loads(metadata_json) if metadata_json else {}
+            self._alive[slot] = True
+        if self.dim is not None and self._capacity:
+            self._open_vectors("r+")
+
+    def _paths(self):
+        suffix = "i8" if self.dtype == np.int8 else "f16"
+        return os.path.join(self.directory, f"vectors.{suffix}"), os.path.join(self.directory, "rows.f32")
+
+    def _open_vectors(self, mode):
+        vectors_path, rows_path = self._paths()
+        self._vectors = np.memmap(vectors_path, dtype=self.dtype, mode=mode, shape=(self._capacity, self.dim))
+        self._rows = np.memmap(rows_path, dtype=np.float32, mode=mode, shape=(self._capacity, 2))
+
+    def _ensure_slots(self, capacity):
+        missing = capacity - len(self._slot_ids)
+        if missing > 0:
+            self._slot_ids.extend([None] * missing)
+            self._metas.extend([None] * missing)
+            self._alive = np.concatenate([self._alive, np.zeros(missing, dtype=bool)])
+
+    def _grow(self, needed: int):
+        """Make room for `needed` more rows by extending the files in place (no copy)."""
+        free = self._capacity - int(self._alive.sum())
+        if needed <= free and self._vectors is not None:
+            return
+        capacity = max(_INITIAL_CAPACITY, self._capacity)
+        while capacity - int(self._alive.sum()) < needed:
+            capacity *= 2
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._rows.flush()
+        self._vectors = self._rows = None
+        vectors_path, rows_path = self._paths()
+        for path, row_bytes in ((vectors_path, self.dim * np.dtype(self.dtype).itemsize), (rows_path, 8)):
+            with open(path, "ab") as f:
+                f.truncate(capacity * row_bytes)
+        self._capacity = capacity
+        self._ensure_slots(capacity)
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('capacity', ?)", (str(capacity),))
+        self._open_vectors("r+")
+
+    def _write_vectors(self, slots, embeddings):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if self.dtype == np.int8:
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            stored = np.round(vectors / scales[:, None]).astype(np.int8)
+            dequantized = stored.astype(np.float32) * scales[:, None]
+        else:
+            scales = np.ones(len(vectors), dtype=np.float32)
+            stored = vectors.astype(np.float16)
+            dequantized = stored.astype(np.float32)
+        self._vectors[slots] = stored
+        self._rows[slots, 0] = scales
+        self._rows[slots, 1] = (dequantized * dequantized).sum(axis=1)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._ids)
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None):
+        ids = list(ids)
+        if not ids:
+            return
+        documents = documents if documents is not None else [None] * len(ids)
+        metadatas = metadatas if metadatas is not None else [None] * len(ids)
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        # Last write wins for an id repeated within one call
+        latest = {id: i for i, id in enumerate(ids)}
+        with self._lock:
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+                self._conn.execute("INSERT INTO meta (key, value) VALUES ('dim', ?)", (str(self.dim),))
+            elif embeddings.shape[1] != self.dim:
+                raise ValueError(f"embedding dimension {embeddings.shape[1]} does not match collection dimension {self.dim}")
+            new = [id for id in latest if id not in self._ids]
+            self._grow(len(new))
+            free = iter(np.flatnonzero(~self._alive))
+            slots = {id: self._ids[id] if id in self._ids else int(next(free)) for id in latest}
+            order = list(latest.values())
+            self._write_vectors([slots[ids[i]] for i in order], embeddings[order])
+            self._vectors.flush()
+            self._rows.flush()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO records (id, slot, document, metadata) VALUES (?, ?, ?, ?)",
+                    [(ids[i], slots[ids[i]], documents[i], json.dumps(metadatas[i] or {})) for i in order])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            for i in order:
+                slot = slots[ids[i]]
+                self._ids[ids[i]] = slot
+                self._slot_ids[slot] = ids[i]
+                self._metas[slot] = dict(metadatas[i] or {})
+                self._alive[slot] = True
+
+    add = upsert
+
+    def update(self, ids, embeddings=None, documents=None, metadatas=None):
+        """Change metadata, documents or embeddings of existing records; unknown ids are ignored."""
+        with self._lock:
+            positions = [i for i, id in enumerate(ids) if id in self._ids]
+            if not positions:
+                return
+            if embeddings is not None:
+                vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)[positions]
+                self._write_vectors([self._ids[ids[i]] for i in positions], vectors)
+                self._vectors.flush()
+                self._rows.flush()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for i in positions:
+                    if documents is not None:
+                        self._conn.execute("UPDATE records SET document = ? WHERE id = ?", (documents[i], ids[i]))
+                    if metadatas is not None:
+                        self._conn.execute("UPDATE records SET metadata = ? WHERE id = ?",
+                                           (json.dumps(metadatas[i] or {}), ids[i]))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            if metadatas is not None:
+                for i in positions:
+                    self._metas[self._ids[ids[i]]] = dict(metadatas[i] or {})
+
+    def _select(self, ids=None, where=None):
+        """Slots matching ids and/or where, in slot order."""
+        if ids is not None:
+            slots = sorted(self._ids[id] for id in set(ids) if id in self._ids)
+        else:
+            slots = np.flatnonzero(self._alive).tolist()
+        if where:
+            slots = [s for s in slots if _match(self._metas[s], where)]
+        return slots
+
+    def delete(self, ids=None, where=None):
+        with self._lock:
+            slots = self._select(ids, where)
+            if not slots:
+                return
+            doomed = [self._slot_ids[s] for s in slots]
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany("DELETE FROM records WHERE id = ?", [(id,) for id in doomed])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            for slot, id in zip(slots, doomed):
+                del self._ids[id]
+                self._slot_ids[slot] = None
+                self._metas[slot] = None
+                self._alive[slot] = False
+
+    def _documents(self, ids):
+        docs = {}
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            placeholders = ",".join("?" * len(part))
+            docs.update(self._conn.execute(
+                f"SELECT id, document FROM records WHERE id IN ({placeholders})", part).fetchall())
+        return [docs.get(id) for id in ids]
+
+    def _vectors_of(self, slots):
+        vectors = np.asarray(self._vectors[slots], dtype=np.float32)
+        return vectors * self._rows[slots, 0][:, None] if self.dtype == np.int8 else vectors
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("documents", "metadatas")):
+        with self._lock:
+            slots = self._select(ids, where)
+            slots = slots[offset or 0:None if limit is None else (offset or 0) + limit]
+            out_ids = [self._slot_ids[s] for s in slots]
+            return {
+                "ids": out_ids,
+                "documents": self._documents(out_ids) if "documents" in include else None,
+                "metadatas": [dict(self._metas[s]) for s in slots] if "metadatas" in include else None,
+                "embeddings": self._vectors_of(slots).tolist() if "embeddings" in include and slots else None,
+            }
+
+    def query(self, query_embeddings, n_results: int = 10, where=None,
+              include=("documents", "metadatas", "distances")):
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = queries.reshape(1, -1) if queries.ndim == 1 else queries
+        with self._lock:
+            if where:
+                slots = np.asarray(self._select(where=where), dtype=np.int64)
+            else:
+                slots = np.flatnonzero(self._alive)
+            k = min(n_results, len(slots))
+            out = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+            if k == 0:
+                for key in out:
+                    out[key] = [[] for _ in queries]
+                return out
+            # Squared L2 distance = |q|^2 + |x|^2 - 2 q.x, scored block by block
+            best_slots = np.empty((len(queries), 0), dtype=np.int64)
+            best_dist = np.empty((len(queries), 0), dtype=np.float32)
+            q_norms = (queries * queries).sum(axis=1)[:, None]
+            contiguous = len(slots) == slots[-1] + 1
+            for start in range(0, len(slots), _QUERY_BLOCK_ROWS):
+                block = slots[start:start + _QUERY_BLOCK_ROWS]
+                stored = self._vectors[start:start + len(block)] if contiguous else self._vectors[block]
+                dots = queries @ np.asarray(stored, dtype=np.float32).T
+                rows = self._rows[block]
+                if self.dtype == np.int8:
+                    dots *= rows[:, 0]
+                dist = q_norms + rows[:, 1] - 2 * dots
+                cand_slots = np.concatenate([best_slots, np.broadcast_to(block, dist.shape)], axis=1)
+                cand_dist = np.concatenate([best_dist, dist], axis=1)
+                top = np.argpartition(cand_dist, k - 1, axis=1)[:, :k] if cand_dist.shape[1] > k else \
+                    np.broadcast_to(np.arange(cand_dist.shape[1]), (len(queries), cand_dist.shape[1]))
+                best_slots = np.take_along_axis(cand_slots, top, axis=1)
+                best_dist = np.take_along_axis(cand_dist, top, axis=1)
+            order = np.argsort(best_dist, axis=1)
+            best_slots = np.take_along_axis(best_slots, order, axis=1)
+            best_dist = np.maximum(np.take_along_axis(best_dist, order, axis=1), 0.0)
+            for row_slots, row_dist in zip(best_slots, best_dist):
+                row_ids = [self._slot_ids[s] for s in row_slots]
+                out["ids"].append(row_ids)
+                out["documents"].append(self._documents(row_ids) if "documents" in include else None)
+                out["metadatas"].append([dict(self._metas[s]) for s in row_slots] if "metadatas" in include else None)
+                out["distances"].append(row_dist.tolist() if "distances" in include else None)
+            return out
+
+    def flush(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._rows.flush()
+
+
+class NumpyVectorClient:
+    """Client with the slice of the Chroma client API chroma_utils uses, backed by NumpyCollection directories."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def get_or_create_collection(self, name: str, metadata: dict = None):
+        if not re.fullmatch(r"[A-Za-z0-9_.-]+", name):
+            raise ValueError(f"invalid collection name {name!r}")
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = NumpyCollection(self.path, name, metadata)
+                self._collections[name] = collection
+            return collection
+
+    def get_collection(self, name: str):
+        """An existing collection; raises ValueError (like older Chroma clients) if there is none."""
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is not None:
+                return collection
+        if name not in self.list_collections():
+            raise ValueError(f"collection {name!r} does not exist")
+        return self.get_or_create_collection(name)
+
+    def list_collections(self):
+        return sorted(name for name in os.listdir(self.path)
+                      if os.path.exists(os.path.join(self.path, name, "records.db")))
+
+    def persist(self):
+        with self._lock:
+            for collection in self._collections.values():
+                collection.flush()
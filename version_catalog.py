@@ -0,0 +1,254 @@
+import os
+import sqlite3
+import threading
+
+# Lives next to the Chroma data it describes
+VERSION_CATALOG_PATH = os.getenv(
+    "VERSION_CATALOG_PATH",
+    os.path.join(os.getenv("CHROMA_PERSIST_DIR", "./chroma_data"), "version_catalog.db"),
+)
+
+_LATEST_TABLE = (
+    "CREATE TABLE {if_not_exists}latest ("
+    " book_id TEXT NOT NULL, content_type TEXT NOT NULL, chapter INTEGER NOT NULL,"
+    " version INTEGER NOT NULL, record_id TEXT NOT NULL, timestamp INTEGER,"
+    " PRIMARY KEY (book_id, content_type, chapter))"
+)
+
+
+class VersionCatalog:
+    """
+    SQLite catalog of stored content, kept alongside the vector store. The
+    manifest table lists, for every (book, content type, version), which
+    content-addressed record holds each position and which chapter that position
+    belongs to (a chapter may span several positions, e.g. retrieval chunks), so
+    several versions can share one stored record and re-ingesting a book only
+    writes what changed. Generated artifacts (one chapter's summary, review or
+    MCQs) are versioned per chapter in a separate namespace: the artifacts table
+    holds their history and the latest table points each (book, type, chapter)
+    at its newest version, so finding the current artifact is a single-key lookup
+    and version history can be paged without touching document bodies. Pruning
+    or re-ingesting a book never touches its artifacts, and vice versa.
+    """
+
+    def __init__(self, path: str = VERSION_CATALOG_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS manifest ("
+            " book_id TEXT NOT NULL, content_type TEXT NOT NULL, version INTEGER NOT NULL,"
+            " position INTEGER NOT NULL, record_id TEXT NOT NULL,"
+            " PRIMARY KEY (book_id, content_type, version, position))"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(manifest)")}
+        if "timestamp" not in columns:
+            self._conn.execute("ALTER TABLE manifest ADD COLUMN timestamp INTEGER")
+        if "chapter" not in columns:
+            # NULL for rows written before chapters were tracked: the position was the chapter
+            self._conn.execute("ALTER TABLE manifest ADD COLUMN chapter INTEGER")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS manifest_history ON manifest (book_id, content_type, position, version)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts ("
+            " book_id TEXT NOT NULL, content_type TEXT NOT NULL, chapter INTEGER NOT NULL,"
+            " version INTEGER NOT NULL, record_id TEXT NOT NULL, timestamp INTEGER,"
+            " PRIMARY KEY (book_id, content_type, chapter, version))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS artifacts_history ON artifacts (book_id, content_type, version)"
+        )
+        self._conn.execute(_LATEST_TABLE.format(if_not_exists="IF NOT EXISTS "))
+        latest_columns = {row[1] for row in self._conn.execute("PRAGMA table_info(latest)")}
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < 1 or "chapter" not in latest_columns:
+            self._split_artifacts()
+
+    def _split_artifacts(self):
+        """
+        One-time migration: artifact versions used to share the manifest table
+        with ingest manifests. Move them (recognisable by their
+        <book>_<type>_v<version>_ch_<chapter> record IDs) to the artifacts table
+        and rebuild the latest pointers (keyed by chapter, formerly "position") from it.
+        """
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            moved = "record_id = book_id || '_' || content_type || '_v' || version || '_ch_' || position"
+            self._conn.execute(
+                "INSERT OR REPLACE INTO artifacts (book_id, content_type, chapter, version, record_id, timestamp)"
+                " SELECT book_id, content_type, position, version, record_id, timestamp FROM manifest WHERE " + moved
+            )
+            self._conn.execute("DELETE FROM manifest WHERE " + moved)
+            self._conn.execute("DROP TABLE latest")
+            self._conn.execute(_LATEST_TABLE.format(if_not_exists=""))
+            # SQLite takes the bare columns from the row holding MAX(version)
+            self._conn.execute(
+                "INSERT INTO latest (book_id, content_type, chapter, version, record_id, timestamp)"
+                " SELECT book_id, content_type, chapter, MAX(version), record_id, timestamp FROM artifacts"
+                " GROUP BY book_id, content_type, chapter"
+            )
+            self._conn.execute("PRAGMA user_version = 1")
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def latest_version(self, book_id: str, content_type: str):
+        """Highest ingest manifest version for (book, type), or None if none is stored."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(version) FROM manifest WHERE book_id = ? AND content_type = ?",
+                (book_id, content_type),
+            ).fetchone()
+        return row[0]
+
+    def manifest(self, book_id: str, content_type: str, version: int):
+        """Record IDs of one version, in position order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT record_id FROM manifest WHERE book_id = ? AND content_type = ? AND version = ?"
+                " ORDER BY position",
+                (book_id, content_type, version),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def manifest_chapters(self, book_id: str, content_type: str, version: int):
+        """{record_id: chapter} of one version (a record repeated in a version maps to its first chapter)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT record_id, COALESCE(chapter, position) FROM manifest"
+                " WHERE book_id = ? AND content_type = ? AND version = ? ORDER BY position DESC",
+                (book_id, content_type, version),
+            ).fetchall()
+        return dict(rows)
+
+    def referenced_ids(self, book_id: str, content_type: str):
+        """Every record ID referenced by any retained version of (book, type)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT record_id FROM manifest WHERE book_id = ? AND content_type = ?",
+                (book_id, content_type),
+            ).fetchall()
+        return {r[0] for r in rows}
+
+    def put_manifest(self, book_id: str, content_type: str, version: int, record_ids, timestamp: int = None,
+                     chapters=None):
+        """
+        Write (or replace) the manifest of one version. chapters gives the chapter
+        of each record; by default every record is its own chapter.
+        """
+        if chapters is None:
+            chapters = range(len(record_ids))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "DELETE FROM manifest WHERE book_id = ? AND content_type = ? AND version = ?",
+                    (book_id, content_type, version),
+                )
+                self._conn.executemany(
+                    "INSERT INTO manifest (book_id, content_type, version, position, record_id, timestamp, chapter)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(book_id, content_type, version, i, rid, timestamp, chapter)
+                     for i, (rid, chapter) in enumerate(zip(record_ids, chapters))],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def put_entry(self, book_id: str, content_type: str, chapter: int, version: int, record_id: str,
+                  timestamp: int = None):
+        """Record a single artifact version (e.g. one chapter's summary) and advance its latest pointer."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO artifacts (book_id, content_type, chapter, version, record_id, timestamp)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (book_id, content_type, chapter, version, record_id, timestamp),
+                )
+                self._conn.execute(
+                    "INSERT INTO latest (book_id, content_type, chapter, version, record_id, timestamp)"
+                    " VALUES (?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT(book_id, content_type, chapter) DO UPDATE SET"
+                    " version = excluded.version, record_id = excluded.record_id, timestamp = excluded.timestamp"
+                    " WHERE excluded.version >= latest.version",
+                    (book_id, content_type, chapter, version, record_id, timestamp),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def latest(self, book_id: str, content_type: str, chapter: int):
+        """Newest version entry of one chapter's artifact, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT chapter, version, record_id, timestamp FROM latest"
+                " WHERE book_id = ? AND content_type = ? AND chapter = ?",
+                (book_id, content_type, chapter),
+            ).fetchone()
+        return None if row is None else self._entry(book_id, content_type, row)
+
+    def history(self, book_id: str, content_type: str, chapter: int = None, limit: int = None, offset: int = 0):
+        """
+        Artifact version entries newest first (then by chapter), optionally for one
+        chapter, paged with limit/offset. Entries hold IDs and metadata only.
+        """
+        query = "SELECT chapter, version, record_id, timestamp FROM artifacts WHERE book_id = ? AND content_type = ?"
+        params = [book_id, content_type]
+        if chapter is not None:
+            query += " AND chapter = ?"
+            params.append(chapter)
+        query += " ORDER BY version DESC, chapter LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else limit, offset]
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._entry(book_id, content_type, row) for row in rows]
+
+    @staticmethod
+    def _entry(book_id, content_type, row):
+        chapter, version, record_id, timestamp = row
+        return {
+            "id": record_id,
+            "book_id": book_id,
+            "chapter": chapter,
+            "type": content_type,
+            "version": version,
+            "timestamp": timestamp,
+        }
+
+    def prune(self, book_id: str, content_type: str, keep: int):
+        """Drop all but the newest keep ingest manifests of (book, type); returns the dropped version numbers."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT DISTINCT version FROM manifest WHERE book_id = ? AND content_type = ? ORDER BY version DESC",
+                    (book_id, content_type),
+                ).fetchall()
+                dropped = [r[0] for r in rows[max(1, keep):]]
+                self._conn.executemany(
+                    "DELETE FROM manifest WHERE book_id = ? AND content_type = ? AND version = ?",
+                    [(book_id, content_type, v) for v in dropped],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return dropped
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+def get_catalog() -> VersionCatalog:
+    """Return the process-wide version catalog, opening it on first use."""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = VersionCatalog()
+    return _catalog
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, unquote
+
+from http_utils import cached_get
+
+WIKIPEDIA_CACHE_PATH = os.getenv("WIKIPEDIA_CACHE_PATH", "./wikipedia_cache.db")
+# Within this many seconds a cached article is served without any network request
+WIKIPEDIA_FRESH_SECONDS = int(os.getenv("WIKIPEDIA_FRESH_SECONDS", str(24 * 3600)))
+# Linked articles added as extra chapters when requested, and how many are fetched at once
+WIKIPEDIA_MAX_LINKED = int(os.getenv("WIKIPEDIA_MAX_LINKED", "5"))
+WIKIPEDIA_CONCURRENCY = int(os.getenv("WIKIPEDIA_CONCURRENCY", "5"))
+
+_SECTION_RE = re.compile(r"^==\s*([^=].*?)\s*==\s*$", re.MULTILINE)
+# Reference-only sections that make poor chapters
+SKIP_SECTIONS = {"see also", "references", "external links", "further reading", "notes", "bibliography",
+                 "sources", "citations", "footnotes", "notes and references"}
+
+
+class WikipediaCache:
+    """
+    Local SQLite cache of Wikipedia articles keyed by (site, title, revision).
+    An article checked within WIKIPEDIA_FRESH_SECONDS is served without touching
+    the network; after that only its current revision ID is looked up, and the
+    text is downloaded again only if the revision changed.
+    """
+
+    def __init__(self, path: str = WIKIPEDIA_CACHE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS articles ("
+            " site TEXT NOT NULL, title TEXT NOT NULL, revision INTEGER NOT NULL, canonical_title TEXT NOT NULL,"
+            " text TEXT NOT NULL, links TEXT NOT NULL, checked REAL NOT NULL,"
+            " PRIMARY KEY (site, title, revision))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS articles_checked ON articles (site, title, checked)")
+
+    def latest(self, site: str, title: str):
+        """Most recently checked cached revision of title: dict or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT revision, canonical_title, text, links, checked FROM articles"
+                " WHERE site = ? AND title = ? ORDER BY checked DESC LIMIT 1",
+                (site, title),
+            ).fetchone()
+        if row is None:
+            return None
+        revision, canonical_title, text, links, checked = row
+        return {"title": canonical_title, "revision": revision, "text": text,
+                "links": json.loads(links), "checked": checked}
+
+    def touch(self, site: str, title: str, revision: int):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE articles SET checked = ? WHERE site = ? AND title = ? AND revision = ?",
+                (time.time(), site, title, revision),
+            )
+
+    def put(self, site: str, title: str, article: dict):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Older revisions of the same title are never served again
+                self._conn.execute("DELETE FROM articles WHERE site = ? AND title = ?", (site, title))
+                self._conn.execute(
+                    "INSERT INTO articles (site, title, revision, canonical_title, text, links, checked)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (site, title, article["revision"], article["title"], article["text"],
+                     json.dumps(article["links"]), time.time()),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_wikipedia_cache() -> WikipediaCache:
+    """Return the process-wide article cache, opening it on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = WikipediaCache()
+    return _cache
+
+def parse_wikipedia_url(url: str):
+    """Return (site, title) for a https://<lang>.wikipedia.org/wiki/<Title> URL; raises ValueError otherwise."""
+    parts = urlsplit(url)
+    if "wikipedia.org" not in parts.netloc or "/wiki/" not in parts.path:
+        raise ValueError("Invalid Wikipedia URL")
+    title = unquote(parts.path.split("/wiki/", 1)[1]).replace("_", " ").strip()
+    if not title:
+        raise ValueError("Invalid Wikipedia URL")
+    return parts.netloc, title
+
+def _api(site: str, **params):
+    params.update(action="query", format="json", formatversion="2", redirects="1")
+    return json.loads(cached_get(f"https://{site}/w/api.php", params=params))
+
+def _current_revision(site: str, title: str):
+    pages = _api(site, titles=title, prop="revisions", rvprop="ids")["query"]["pages"]
+    page = pages[0]
+    if page.get("missing"):
+        raise ValueError(f"Wikipedia article not found: {title}")
+    return page["revisions"][0]["revid"]
+
+def _download(site: str, title: str) -> dict:
+    data = _api(site, titles=title, prop="extracts|revisions|links", explaintext="1", rvprop="ids",
+                plnamespace="0", pllimit="max")
+    page = data["query"]["pages"][0]
+    if page.get("missing"):
+        raise ValueError(f"Wikipedia article not found: {title}")
+    # Only the first batch of links (up to 500) is kept; it is plenty to pick related articles from
+    links = [link["title"] for link in page.get("links", [])]
+    return {"title": page["title"], "revision": page["revisions"][0]["revid"],
+            "text": page.get("extract", ""), "links": links}
+
+def fetch_article(site: str, title: str) -> dict:
+    """
+    Return {'title', 'revision', 'text', 'links'} for an article, from the local
+    cache whenever possible. Text is plain text with '== Heading ==' section markers.
+    """
+    cache = get_wikipedia_cache()
+    cached = cache.latest(site, title)
+    if cached is not None:
+        if time.time() - cached["checked"] < WIKIPEDIA_FRESH_SECONDS:
+            return cached
+        if _current_revision(site, title) == cached["revision"]:
+            cache.touch(site, title, cached["revision"])
+            return cached
+    article = _download(site, title)
+    cache.put(site, title, article)
+    return article
+
+def split_sections(title: str, text: str):
+    """
+    Split article text into [(section title, text)] at top-level '== Heading =='
+    markers. The lead becomes 'Introduction'; subsections stay inside their
+    section; reference-only sections are dropped.
+    """
+    sections = []
+    matches = list(_SECTION_RE.finditer(text))
+    lead = text[:matches[0].start()] if matches else text
+    if lead.strip():
+        sections.append(("Introduction", lead.strip()))
+    for i, match in enumerate(matches):
+        name = match.group(1).strip()
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        body = re.sub(r"^=+\s*(.*?)\s*=+\s*$", r"\1", text[match.end():end], flags=re.MULTILINE).strip()
+        if body and name.lower() not in SKIP_SECTIONS:
+            sections.append((name, body))
+    return sections or [(title, text.strip())]
+
+def related_links(article: dict, limit: int):
+    """The article's links ranked by how often their titles appear in its text."""
+    text = article["text"].lower()
+    scored = [(text.count(link.lower()), i, link) for i, link in enumerate(article["links"])]
+    return [link for count, _i, link in sorted(scored, key=lambda s: (-s[0], s[1])) if count > 0][:limit]
+
+async def afetch_wikipedia(url: str, linked: int = 0):
+    """
+    Fetch a Wikipedia article as [(title, text)] chapters, one per top-level
+    section. With linked > 0, up to that many of its most-mentioned linked
+    articles are fetched concurrently and appended, one chapter each.
+    """
+    site, title = parse_wikipedia_url(url)
+    article = await asyncio.to_thread(fetch_article, site, title)
+    chapters = split_sections(article["title"], article["text"])
+    if linked > 0:
+        semaphore = asyncio.Semaphore(WIKIPEDIA_CONCURRENCY)
+
+        async def fetch(link_title):
+            async with semaphore:
+                return await asyncio.to_thread(fetch_article, site, link_title)
+
+        links = related_links(article, linked)
+        results = await asyncio.gather(*(fetch(link) for link in links), return_exceptions=True)
+        for link, result in zip(links, results):
+            if isinstance(result, Exception):
+                print(f"[Wikipedia] Error fetching linked article {link}: {result}")
+                continue
+            body = "\n\n".join(text for name, text in split_sections(result["title"], result["text"]))
+            if body.strip():
+                chapters.append((f"Linked: {result['title']}", body))
+    return chapters
+
+def fetch_wikipedia(url: str, linked: int = 0):
+    """Synchronous wrapper around afetch_wikipedia."""
+    return asyncio.run(afetch_wikipedia(url, linked))
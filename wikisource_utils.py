@@ -1,25 +1,118 @@
+import asyncio
+import os
+from urllib.parse import urljoin, urlsplit, unquote
+
+from http_utils import cached_get
+
+# Subpages fetched at once while crawling a multi-part work
+WIKISOURCE_CONCURRENCY = int(os.getenv("WIKISOURCE_CONCURRENCY", "8"))
+# Index -> part -> chapter is as deep as Wikisource works usually go
+WIKISOURCE_MAX_DEPTH = int(os.getenv("WIKISOURCE_MAX_DEPTH", "2"))
+WIKISOURCE_MAX_PAGES = int(os.getenv("WIKISOURCE_MAX_PAGES", "300"))
+_TEXT_BLOCKS = ["p", "li", "dd", "h2", "h3", "h4"]
+
+
+def parse_wikisource_page(html: str, url: str):
+    """
+    Extract (title, text, subpage_urls) from a Wikisource page. Subpages are
+    links inside the main content to pages below this one (e.g. 'Work/Chapter 1'),
+    in document order.
+    """
+    from bs4 import BeautifulSoup, Tag
+    soup = BeautifulSoup(html, "lxml")
+    heading = soup.find("h1", id="firstHeading")
+    title = heading.get_text(" ", strip=True) if heading else unquote(urlsplit(url).path.rsplit("/", 1)[-1]).replace("_", " ")
+    main = soup.find("div", id="ws-content") or soup.find("div", class_="mw-parser-output")
+    if not main or not isinstance(main, Tag):
+        return title, "", []
+    for noise in main.select("style, script, .ws-noexport, .mw-editsection, #headertemplate"):
+        noise.decompose()
+    blocks = (b.get_text(separator=" ", strip=True) for b in main.find_all(_TEXT_BLOCKS))
+    text = "\n".join(b for b in blocks if b)
+
+    base = urlsplit(url)
+    prefix = unquote(base.path).rstrip("/") + "/"
+    subpages = []
+    seen = set()
+    for a in main.find_all("a", href=True):
+        link = urlsplit(urljoin(url, a["href"]))
+        path = unquote(link.path)
+        if link.netloc != base.netloc or link.query or not path.startswith(prefix):
+            continue
+        target = link._replace(fragment="").geturl()
+        if target not in seen:
+            seen.add(target)
+            subpages.append(target)
+    return title, text, subpages
+
+def _fetch_page(url: str):
+    return parse_wikisource_page(cached_get(url), url)
+
+async def afetch_wikisource(url: str, max_depth: int = WIKISOURCE_MAX_DEPTH, max_pages: int = WIKISOURCE_MAX_PAGES,
+                            on_page=None):
+    """
+    Fetch a Wikisource work as [(title, text)] chapters. A page that links to its
+    own subpages is treated as an index: the subpages are crawled concurrently
+    (recursively, up to max_depth) and become the chapters, in reading order.
+    A single page without subpages is returned as one chapter.
+    on_page(title, text), if given, is called for each chapter as soon as it has
+    been fetched, while the rest of the crawl is still running (so in completion
+    order, not necessarily reading order).
+    """
+    semaphore = asyncio.Semaphore(WIKISOURCE_CONCURRENCY)
+    visited = {url}
+
+    def leaf(title, text):
+        if not text.strip():
+            return []
+        if on_page is not None:
+            on_page(title, text)
+        return [(title, text)]
+
+    async def fetch(page_url):
+        async with semaphore:
+            return await asyncio.to_thread(_fetch_page, page_url)
+
+    async def visit(page_url, depth):
+        # Each subpage is parsed (and its chapters reported) as soon as it arrives
+        try:
+            page = await fetch(page_url)
+        except Exception as e:
+            print(f"[Wikisource] Error fetching {page_url}: {e}")
+            return []
+        return await collect(page_url, page, depth)
+
+    async def collect(page_url, page, depth):
+        title, text, subpages = page
+        subpages = [s for s in subpages if s not in visited][:max(0, max_pages - len(visited))]
+        if depth >= max_depth or not subpages:
+            return leaf(title, text)
+        visited.update(subpages)
+        parts = await asyncio.gather(*(visit(s, depth + 1) for s in subpages))
+        chapters = [chapter for part in parts for chapter in part]
+        # An index whose links all failed still has its own text
+        return chapters or leaf(title, text)
+
+    root = await fetch(url)
+    return await collect(url, root, 0)
+
+def fetch_wikisource(url: str, on_page=None):
+    """Synchronous wrapper around afetch_wikisource; on_page runs in the calling thread."""
+    return asyncio.run(afetch_wikisource(url, on_page=on_page))
+
 def scrape_wikisource(url: str, text_path: str) -> bool:
     """
-    Scrape the main text from a Wikisource page using requests and BeautifulSoup.
-    Saves the text to text_path. Returns True if successful, False otherwise.
+    Scrape the text of a Wikisource work (all of its subpages) and save it to
+    text_path. Returns True if successful, False otherwise.
     """
     try:
-        import requests
-        from bs4 import BeautifulSoup, Tag
-        resp = requests.get(url)
-        resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, 'html.parser')
-        main = soup.find('div', id='ws-content') or soup.find('div', class_='mw-parser-output')
-        if not main or not isinstance(main, Tag):
-            print("[RequestsBS4] Could not find main content div or it is not a Tag.")
-            return False
-        text = '\n'.join(p.get_text(separator=' ', strip=True) for p in main.find_all(['p', 'div', 'span', 'li']))
-        if not text.strip():
+        chapters = fetch_wikisource(url)
+        if not chapters:
             print("[RequestsBS4] No text extracted from main content.")
             return False
         with open(text_path, 'w', encoding='utf-8') as f:
-            f.write(text)
+            f.write("\n\n".join(text for _title, text in chapters))
         return True
     except Exception as e:
         print(f"[RequestsBS4] Error: {e}")
-        return False 
\ No newline at end of file
+        return False